@@ -1,53 +1,66 @@
 import frappe
 from frappe import _
 from frappe.utils import fmt_money
-from frappe.utils import flt
+from frappe.utils import cint, flt
 from frappe.auth import LoginManager
 from werkzeug import Response
+import gzip
 import json
 from datetime import date, datetime, timedelta
 from frappe.utils import nowdate
+from retail_app.balances import (get_customer_balances, get_customer_list_payload, get_customers_query,
+    get_customers_with_balances_query, make_balance, serialize_customer)
+from retail_app.bootstrap import InvalidKnownHashesError, build_bootstrap
+from retail_app.catalog import get_item_list_payload, get_item_prices_query, get_items_query, serialize_item, serialize_item_price
+from retail_app.coalesce import single_flight
+from retail_app.instrumentation import get_prometheus_metrics, get_recent_calls, instrument
+from retail_app.invoices import (InvoiceFailedError, claim_idempotency_key, get_invoice_items, get_invoice_status, insert_invoices, pop_idempotency_key,
+    prefetch_invoice_lookups, prepare_invoice, queue_invoice, record_idempotency_key)
+from retail_app.item_search import get_search_results
+from retail_app.login import get_login_response
+from retail_app.payments import insert_payments
+from retail_app.price_cache import get_item_prices_payload
+from retail_app.quotes import quote_carts as build_quotes
+from retail_app.sales_summary import get_sales_summary as build_sales_summary
+from retail_app.settings_cache import get_retail_config, get_retail_settings
+from retail_app.snapshots import get_snapshot_manifest
+from retail_app.stock_reservations import release_reservation, reserve_invoice_stock
+from retail_app.streaming import is_streaming, stream_response
+from retail_app.sync import InvalidCursorError, decode_cursor, encode_cursor, get_catalog_changes, get_customer_changes
+from retail_app.utils import get_cached_count, rollback_to_savepoint, set_savepoint
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
 
 @frappe.whitelist(allow_guest=True)
+@instrument
 def custom_login(email, password):
     login_manager = LoginManager()
     login_manager.authenticate(email, password)
     login_manager.post_login()
 
-    user = frappe.get_doc("User", email)
-    api_key = user.api_key
-    api_secret = None
+    # The user may have logged in with a username or mobile number
+    return get_login_response(login_manager.user)
 
-    # Check if the user has an API key and secret, generate if not
-    if not api_key:
-        api_key = frappe.generate_hash(length=15)
-        frappe.db.set_value("User", email, "api_key", api_key)
-
-    try:
-        api_secret = frappe.utils.password.get_decrypted_password('User', email, fieldname='api_secret')
-    except frappe.exceptions.AuthenticationError:
-        # Generate a new API secret if it does not exist
-        api_secret = frappe.generate_hash(length=15)
-        frappe.utils.password.update_password('User', email, api_secret, fieldname='api_secret')
-
-    # Fetch the user's profile picture URL
-    profile_picture = user.user_image
-    if not profile_picture:
-        full_name = user.full_name or user.first_name + " " + user.last_name
-        profile_picture = f"https://ui-avatars.com/api/?name={full_name}&color=16794c&background=daf0e1"
-
-    return {
-        "key": api_key,
-        "secret": api_secret,
-        "dp": profile_picture
-    }
+@frappe.whitelist()
+@instrument
+def refresh_login():
+    """
+    Get the API key, secret and profile picture of the logged in user
+    without a full login, for terminals whose token or session is still
+    valid.
+    """
+    return get_login_response(frappe.session.user)
 
 @frappe.whitelist()
+@instrument
 def get_settings():
-    settings = frappe.get_single("Retail Settings")
-    return settings
+    return get_retail_settings()
 
 @frappe.whitelist()
+@instrument
 def update_settings(walk_in_customer, store_name, store_address):
     settings = frappe.get_single("Retail Settings")
     settings.walk_in_customer = walk_in_customer
@@ -57,124 +70,206 @@ def update_settings(walk_in_customer, store_name, store_address):
     return {"message": _("Settings updated successfully")}
 
 @frappe.whitelist()
-def get_customers():
-    # Fetch default currency from system settings
-    default_currency = frappe.db.get_value('Global Defaults', None, 'default_currency')
+@instrument
+def bootstrap(known=None, warehouse=None, warehouse_group=None):
+    """
+    Get everything a terminal needs at startup in one round trip: the user,
+    settings, items, item prices and customers.
+
+    Every section carries a hash; pass the hashes from the previous response
+    as `known` to get only the sections that changed. The document is
+    gzip-compressed when the client accepts it.
+    """
+    try:
+        payload = build_bootstrap(known, warehouse, warehouse_group)
+    except InvalidKnownHashesError as e:
+        return Response(response=json.dumps({"status": "failed", "error": str(e)}),
+                        status=400,
+                        mimetype='application/json')
 
-    customers = frappe.get_all('Customer', fields=['name', 'customer_name'])
-    customer_list = []
+    response = Response(status=200, mimetype='application/json')
+    if 'gzip' in frappe.get_request_header('Accept-Encoding', ''):
+        payload = gzip.compress(payload, compresslevel=6)
+        response.headers['Content-Encoding'] = 'gzip'
+        response.vary.add('Accept-Encoding')
 
-    for customer in customers:
-        customer_details = frappe.get_doc('Customer', customer.name)
-        customer_balance = get_customer_balance(customer.name)
-        total_due = get_total_due(customer.name)
+    response.set_data(payload)
+    return response
 
-        customer_info = {
-            "id": customer.name,
-            "name": customer_details.customer_name,
-            "advance_balance": fmt_money(customer_balance, currency=default_currency),
-            "total_due": fmt_money(total_due, currency=default_currency)
-        }
+@frappe.whitelist()
+@instrument
+def get_customers(stream=None):
+    # Fetch default currency from system settings
+    default_currency = get_retail_config().default_currency
+
+    if is_streaming(stream):
+        query, values = get_customers_query()
+        return stream_response(query, values,
+                serialize=lambda row: serialize_customer(row.name, row.customer_name, make_balance(row.balance), default_currency),
+                fmt=stream)
 
-        customer_list.append(customer_info)
+    # Terminals opening together share one computation of the list
+    payload = single_flight("get_customers", get_customer_list_payload, default_currency)
 
-    return Response(response=json.dumps(customer_list),
+    return Response(response=payload,
             status=200,
             mimetype='application/json')
 
+@frappe.whitelist()
+@instrument
+def sync_customers(cursor=None, limit=2000, fmt="json"):
+    """
+    Get the customers changed since `cursor`, for terminals with a local
+    customer directory.
+
+    Customers come as parallel arrays (`id`, `name`, `disabled`,
+    `advance_balance`, `total_due`) with numeric balances in the currency
+    given once as `currency`. Pass `fmt=msgpack` for a MessagePack body when
+    the `msgpack` package is installed.
+    """
+    if fmt not in ("json", "msgpack") or (fmt == "msgpack" and not msgpack):
+        return Response(response=json.dumps({"status": "failed", "error": f"Unsupported format {fmt}"}),
+                        status=400,
+                        mimetype='application/json')
+
+    try:
+        changes = get_customer_changes(cursor, min(cint(limit) or 2000, 10000))
+    except InvalidCursorError as e:
+        return Response(response=json.dumps({"status": "failed", "error": str(e)}),
+                        status=400,
+                        mimetype='application/json')
+
+    if fmt == "msgpack":
+        return Response(response=msgpack.packb(changes),
+                        status=200,
+                        mimetype='application/msgpack')
+
+    return Response(response=json.dumps(changes, separators=(",", ":")),
+                        status=200,
+                        mimetype='application/json')
+
 def get_customer_balance(customer_name):
     """
     Get the customer's advance balance.
     """
-    advance_balance = 0.0
-    gl_entries = frappe.get_all("GL Entry", filters={"party_type": "Customer", "party": customer_name}, fields=["debit", "credit"])
-    for entry in gl_entries:
-        advance_balance += entry.credit - entry.debit
-    
-    if(advance_balance <0):
-        advance_balance=0
-
-    return advance_balance
+    return get_customer_balances([customer_name])[customer_name]["advance_balance"]
 
 def get_total_due(customer_name):
     """
     Get the customer's total due.
     """
-    total_due = 0.0
-    gl_entries = frappe.get_all("GL Entry", filters={"party_type": "Customer", "party": customer_name}, fields=["debit", "credit"])
-    for entry in gl_entries:
-        total_due += entry.debit - entry.credit
+    return get_customer_balances([customer_name])[customer_name]["total_due"]
 
-    if(total_due <0):
-        total_due=0
-    
-    return total_due
+@frappe.whitelist()
+@instrument
+def get_item_prices(stream=None):
+    """
+    Get the item prices of every selling price list.
+
+    Served from the price list cache. Terminals that send back the ETag of
+    their last response in `If-None-Match` get a 304 when nothing changed.
+    """
+    if is_streaming(stream):
+        query, values = get_item_prices_query()
+        return stream_response(query, values, serialize=serialize_item_price, fmt=stream)
+
+    payload, etag = single_flight("get_item_prices", get_item_prices_payload)
+    if frappe.get_request_header('If-None-Match', '').strip('"') == etag:
+        response = Response(status=304)
+    else:
+        response = Response(response=payload,
+                            status=200,
+                            mimetype='application/json')
+
+    response.set_etag(etag)
+    return response
 
 @frappe.whitelist()
-def get_item_prices():
-    # Fetch Price Lists used for selling
-    price_lists = frappe.get_all('Price List', filters={'selling': 1}, fields=['name'])
-
-    #Fetch item prices for each Price List
-    item_prices_list = []
-    for price_list in price_lists:
-        item_prices = frappe.get_all('Item Price', filters={"price_list": price_list.name}, fields=['item_code','name', 'uom', 'price_list_rate'])
-        for price in item_prices:
-            item_prices_list.append({
-                "item_code":price.item_code,
-                "name": price.name,
-                "uom": price.uom,
-                "price": price.price_list_rate
-            })
-
-    return Response(response=json.dumps(item_prices_list),
+@instrument
+def get_items(warehouse=None, warehouse_group=None, page_length=None, cursor=None, stream=None):
+    """
+    Get the item catalog with remaining stock.
+
+    Stock can be limited to one `warehouse` or to the warehouses under
+    `warehouse_group`. Pass `page_length` to page through the catalog; the
+    cursor for the next page is returned in the `X-Next-Cursor` header and is
+    absent on the last page. Pass `stream` ("json" or "ndjson") to stream
+    every item after `cursor` instead of building the list in memory.
+    """
+    if is_streaming(stream):
+        query, values = get_items_query(warehouse, warehouse_group, cursor)
+        return stream_response(query, values, serialize=serialize_item, fmt=stream)
+
+    # Terminals opening together share one computation of each page
+    payload, next_cursor = single_flight("get_items", get_item_list_payload, warehouse, warehouse_group, page_length, cursor)
+
+    response = Response(response=payload,
                         status=200,
                         mimetype='application/json')
 
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+
+    return response
+
 @frappe.whitelist()
-def get_items():
-    items = frappe.get_all('Item', fields=['name', 'item_name', 'stock_uom', 'item_code'])
-    item_list = []
-
-    for item in items:
-        # Fetch item details
-        item_details = frappe.get_doc('Item', item.name)
-
-        # Calculate remaining stock
-        remaining_stock = frappe.db.sql("""
-            SELECT SUM(actual_qty)
-            FROM `tabBin`
-            WHERE item_code=%s
-        """, item.item_code)[0][0] or 0
-
-        # Fetch Price Lists used for selling
-        #price_lists = frappe.get_all('Price List', filters={'selling': 1}, fields=['name'])
-
-        # Fetch item prices for each Price List
-        # item_prices_list = []
-        # for price_list in price_lists:
-        #     item_prices = frappe.get_all('Item Price', filters={"item_code": item.item_code, "price_list": price_list.name}, fields=['name', 'uom', 'price_list_rate'])
-        #     for price in item_prices:
-        #         item_prices_list.append({
-        #             "name": price.name,
-        #             "uom": price.uom,
-        #             "price": price.price_list_rate
-        #         })
-
-        # Construct item dictionary
-        item_list.append({
-            "item_name": item.item_name,
-            "item_code": item.item_code,
-            "remaining_stock": "{} {}".format(remaining_stock, item_details.stock_uom),
-            # "item_prices": item_prices_list
-        })
-
-    return Response(response=json.dumps(item_list),
+@instrument
+def search_items(query, limit=20, warehouse=None, warehouse_group=None, price_list=None):
+    """
+    Find items by exact barcode or item code, or by name, with their stock
+    and selling prices, without downloading the catalog.
+
+    Names match when they start with the query (queries of one or two
+    characters) or contain it; items whose name starts with the query are
+    listed first.
+    """
+    limit = min(cint(limit) or 20, 100)
+    results = get_search_results(query or "", limit, warehouse, warehouse_group, price_list)
+
+    return Response(response=json.dumps(results),
+                        status=200,
+                        mimetype='application/json')
+
+@frappe.whitelist()
+@instrument
+def get_catalog_manifest():
+    """
+    Get the version and shard checksums of the catalog snapshot files, with
+    their download URLs.
+    """
+    manifest = get_snapshot_manifest()
+    if not manifest:
+        return Response(response=json.dumps({"status": "failed", "error": "Catalog snapshot has not been generated yet"}),
+                        status=404,
+                        mimetype='application/json')
+
+    return Response(response=json.dumps(manifest),
+                        status=200,
+                        mimetype='application/json')
+
+@frappe.whitelist()
+@instrument
+def sync_catalog(cursor=None, limit=500):
+    """
+    Get the catalog changes since `cursor`, for terminals with a local cache.
+    """
+    try:
+        # Each of the four streams returns up to `limit` rows
+        changes = get_catalog_changes(cursor, min(cint(limit) or 500, 5000))
+    except InvalidCursorError as e:
+        return Response(response=json.dumps({"status": "failed", "error": str(e)}),
+                        status=400,
+                        mimetype='application/json')
+
+    return Response(response=json.dumps(changes),
                         status=200,
                         mimetype='application/json')
 
 @frappe.whitelist(allow_guest=True)
+@instrument
 def create_sales_invoice():
+    sales_invoice = None
+    after_commit = None
     try:
         # Get JSON data from request
         data = frappe.form_dict.get('data')
@@ -183,49 +278,176 @@ def create_sales_invoice():
             return {"error": "No data provided"}
 
         invoice_data = frappe.parse_json(data)
-        invoice_data['update_stock'] = 1
-
-        # Check if payment_terms_template is provided, if not set a default
-        if 'payment_terms_template' not in invoice_data:
-            try:
-                customer = frappe.get_doc('Customer', invoice_data['customer'])
-                if customer.payment_terms:
-                    invoice_data['payment_terms_template'] = customer.payment_terms
-                else:
-                    # Set a default payment terms template if not set for the customer
-                    invoice_data['payment_terms_template'] = 'Standard'
-
-                    # Check if 'Standard' payment terms template exists
-                    if not frappe.db.exists('Payment Terms Template', 'Standard'):
-                        return {
-                            "error": "Payment Terms Template 'Standard' does not exist. Please create it."
-                        }
-
-            except frappe.DoesNotExistError:
-                return {"error": f"Customer {invoice_data['customer']} not found"}
+        idempotency_key = pop_idempotency_key(invoice_data)
+
+        error = prepare_invoice(invoice_data, prefetch_invoice_lookups([invoice_data]))
+        if error:
+            return {"error": error}
+
+        after_commit = set_savepoint("retail_create_sales_invoice")
+
+        # A retried request returns the invoice created by the first attempt
+        if idempotency_key:
+            existing = claim_idempotency_key(idempotency_key)
+            if existing:
+                return {"message": "Sales Invoice already created", "invoice_name": existing}
 
         # Create the sales invoice
         sales_invoice = frappe.get_doc(invoice_data)
         sales_invoice.insert()
+        # Reject the invoice before its submission locks the bins if the stock is short
+        reserve_invoice_stock(sales_invoice)
         sales_invoice.submit()
 
+        if idempotency_key:
+            record_idempotency_key(idempotency_key, sales_invoice.name)
+
         return {"message": "Sales Invoice created successfully", "invoice_name": sales_invoice.name}
 
     except Exception as e:
+        # Release the idempotency key along with any partially created
+        # invoice, leaving whatever the caller wrote before untouched
+        if after_commit is not None:
+            rollback_to_savepoint("retail_create_sales_invoice", after_commit)
+            if sales_invoice and sales_invoice.name:
+                release_reservation(sales_invoice.name)
         # Use a generic error logging method that doesn't depend on the missing ErrorLog function
         frappe.log_error(frappe.get_traceback(), 'Sales Invoice Creation Error')
         return {"error": str(e)}
 
+@frappe.whitelist()
+@instrument
+def queue_sales_invoice():
+    """
+    Validate a sales invoice, save it as a draft and submit it in the
+    background.
+
+    Returns a `ticket` (the idempotency key, generated when the terminal did
+    not send one) to poll `get_sales_invoice_status` with.
+    """
+    try:
+        data = frappe.form_dict.get('data')
+        if not data:
+            return {"error": "No data provided"}
+
+        invoice_data = frappe.parse_json(data)
+        ticket = pop_idempotency_key(invoice_data) or frappe.generate_hash(length=20)
+
+        error = prepare_invoice(invoice_data, prefetch_invoice_lookups([invoice_data]))
+        if error:
+            return {"error": error}
+
+        invoice_name = queue_invoice(invoice_data, ticket)
+
+        return {"message": "Sales Invoice queued for submission", "ticket": ticket, "invoice_name": invoice_name}
+
+    except InvoiceFailedError as e:
+        # A retry of a ticket whose draft failed to submit
+        return {"error": str(e), "ticket": ticket, "status": "Failed"}
+
+    except Exception as e:
+        frappe.db.rollback()
+        frappe.log_error(frappe.get_traceback(), 'Sales Invoice Creation Error')
+        return {"error": str(e)}
+
+@frappe.whitelist()
+@instrument
+def get_sales_invoice_status(ticket):
+    """
+    Get the status of an invoice queued with `queue_sales_invoice`.
+    """
+    status = get_invoice_status(ticket)
+    if not status:
+        return {"error": f"Ticket {ticket} not found"}
+
+    return {
+        "ticket": ticket,
+        "status": status.status,
+        "invoice_name": status.sales_invoice,
+        "error": status.error
+    }
+
+@frappe.whitelist()
+@instrument
+def create_sales_invoices():
+    """
+    Create and submit a batch of sales invoices, e.g. the queue of a terminal
+    that was offline.
+
+    `data` is a JSON array of invoices, each of which may carry an
+    `idempotency_key`. The response has one result per invoice, in the same
+    order, with either its `invoice_name` or `error`.
+    """
+    data = frappe.form_dict.get('data')
+    if not data:
+        return {"error": "No data provided"}
+
+    invoices = frappe.parse_json(data)
+    if not isinstance(invoices, list):
+        return {"error": "Expected a list of invoices"}
+
+    results = insert_invoices(invoices)
+
+    return {
+        "message": "Processed {} Sales Invoices".format(len(results)),
+        "results": results
+    }
+
+
+@frappe.whitelist()
+@instrument
+def quote_carts():
+    """
+    Price carts without creating invoices.
+
+    `data` is a JSON cart or array of carts, each with `items` of
+    `item_code`, `qty` and optionally `uom`, and optionally a `customer`,
+    `selling_price_list`, `taxes_and_charges` and `company`. Carts are priced
+    by ERPNext as their Sales Invoices would be. The response has one quote
+    per cart, in the same order.
+    """
+    data = frappe.form_dict.get('data')
+    if not data:
+        return {"error": "No data provided"}
+
+    carts = frappe.parse_json(data)
+    if isinstance(carts, dict):
+        carts = [carts]
+    if not isinstance(carts, list) or not all(isinstance(cart, dict) for cart in carts):
+        return {"error": "Expected a cart or a list of carts"}
+
+    return {"quotes": build_quotes(carts)}
+
+
+# Function to handle date serialization
+def serialize_date(obj):
+    if isinstance(obj, (datetime, date)):
+        return obj.strftime('%Y-%m-%d')
+    elif isinstance(obj, timedelta):
+        return str(obj.total_seconds())
+    raise TypeError("Type not serializable")
 
 @frappe.whitelist(allow_guest=True)
+@instrument
 def get_sales_invoices():
+    """
+    Get a page of sales invoices, most recent first.
+
+    Pages are addressed with the opaque `cursor` returned as `next_cursor`
+    in the pagination of the previous page, which seeks on
+    `(posting_date, name)` instead of skipping rows. `page` is still
+    accepted for shallow pages. The total count is cached for a minute per
+    filter set and left out with `with_count=0`.
+    """
     try:
         # Fetch pagination parameters
         page = int(frappe.form_dict.get('page', 1))
         per_page = int(frappe.form_dict.get('per_page', 20))
+        cursor = frappe.form_dict.get('cursor')
+        with_count = cint(frappe.form_dict.get('with_count', 1))
 
-        # Calculate the start index
-        start = (page - 1) * per_page
+        # Calculate the start index, only used without a cursor
+        start = 0 if cursor else (page - 1) * per_page
 
         # Fetch filter parameters
         customer = frappe.form_dict.get('customer')
@@ -234,53 +456,51 @@ def get_sales_invoices():
         invoice_name = frappe.form_dict.get('invoice_name')
 
         # Build filters based on parameters
-        filters = {}
+        filters = []
         if customer:
-            filters['customer'] = customer
+            filters.append(['customer', '=', customer])
         if start_date and end_date:
-            filters['posting_date'] = ['between', [start_date, end_date]]
+            filters.append(['posting_date', 'between', [start_date, end_date]])
         elif start_date:
-            filters['posting_date'] = ['>=', start_date]
+            filters.append(['posting_date', '>=', start_date])
         elif end_date:
-            filters['posting_date'] = ['<=', end_date]
+            filters.append(['posting_date', '<=', end_date])
         if invoice_name:
-            filters['name'] = ['like', f'%{invoice_name}%']
+            # Prefix matching can use the primary key index, unlike a leading wildcard
+            prefix = invoice_name.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            filters.append(['name', 'like', f'{prefix}%'])
+
+        # Seek past the last invoice of the previous page; the total counts
+        # the invoices matching the filters only
+        page_filters = filters
+        or_filters = None
+        if cursor:
+            last_posting_date, last_name = decode_cursor(cursor, ("invoice",))["invoice"]
+            page_filters = filters + [['posting_date', '<=', last_posting_date]]
+            or_filters = [['posting_date', '<', last_posting_date], ['name', '<', last_name]]
 
         # Fetch sales invoices with pagination and filters
         sales_invoices = frappe.get_all('Sales Invoice', 
                                         fields=['name', 'customer', 'due_date', 'posting_date', 'set_posting_time', 'posting_time', 'status', 'grand_total', 'outstanding_amount', 'owner'], 
-                                        filters=filters, 
+                                        filters=page_filters, 
+                                        or_filters=or_filters,
+                                        order_by='posting_date desc, name desc',
                                         start=start, 
                                         limit=per_page)
         
+        # Fetch the line items of the whole page in one query, unless only a summary is wanted
+        summary = cint(frappe.form_dict.get('summary'))
+        if not summary:
+            invoice_items = get_invoice_items([invoice.name for invoice in sales_invoices])
+
         invoices = []
         
         for invoice in sales_invoices:
-            invoice_doc = frappe.get_doc('Sales Invoice', invoice.name)
-            items = []
-            for item in invoice_doc.items:
-                items.append({
-                    "item_code": item.item_code,
-                    "item_name": item.item_name,
-                    "qty": item.qty,
-                    "rate": item.rate,
-                    "uom": item.uom
-                })
-
-            # Function to handle date serialization
-            def serialize_date(obj):
-                if isinstance(obj, (datetime, date)):
-                    return obj.strftime('%Y-%m-%d')
-                elif isinstance(obj, timedelta):
-                    return str(obj.total_seconds())
-                raise TypeError("Type not serializable")
-
             invoice_data = {
                 "name": invoice.name,
                 "doctype": "Sales Invoice",
                 "customer": invoice.customer,
                 "due_date": serialize_date(invoice.due_date) if invoice.due_date else None,
-                "items": items,
                 "posting_date": serialize_date(invoice.posting_date) if invoice.posting_date else None,
                 "set_posting_time": invoice.set_posting_time,
                 "posting_time": str(invoice.posting_time) if invoice.posting_time else None,
@@ -289,64 +509,65 @@ def get_sales_invoices():
                 "status": invoice.status,
                 "created_by": invoice.owner
             }
+            if not summary:
+                invoice_data["items"] = invoice_items.get(invoice.name, [])
             invoices.append(invoice_data)
         
         # Pagination metadata
         pagination = {
             "page": page,
             "per_page": per_page,
-            "total_count": frappe.db.count('Sales Invoice', filters=filters)
+            "next_cursor": None
         }
+        if len(sales_invoices) == per_page:
+            last = sales_invoices[-1]
+            pagination["next_cursor"] = encode_cursor({"invoice": [str(last.posting_date), last.name]})
+        if with_count:
+            pagination["total_count"] = get_cached_count('Sales Invoice', filters)
 
         return Response(response=json.dumps({"invoices": invoices, "pagination": pagination}),
                         status=200,
                         mimetype='application/json')
 
+    except InvalidCursorError as e:
+        return Response(response=json.dumps({"status": "failed", "error": str(e)}),
+                        status=400,
+                        mimetype='application/json')
+
     except Exception as e:
         frappe.log_error(frappe.get_traceback(), 'Sales Invoice Fetch Error')
         return Response(response=json.dumps({"status": "failed", "error": str(e)}),
                         status=500,
                         mimetype='application/json')
     
+@frappe.whitelist()
+@instrument
+def get_sales_summary(from_date=None, to_date=None, pos_profile=None, cashier=None):
+    """
+    Get the Z report totals of a date range (today by default): overall and
+    by payment mode, item, cashier and hour, optionally for one POS profile
+    or cashier.
+    """
+    return build_sales_summary(from_date, to_date, pos_profile, cashier)
+
 @frappe.whitelist(allow_guest=True)
+@instrument
 def get_customers_with_balances():
     try:
         # Pagination parameters
         args = frappe.form_dict
         page_length = int(args.get('page_length', 20))
         page_number = int(args.get('page_number', 1))  # Default to first page if not specified
-        start = (page_number - 1) * page_length  # Calculate start index for pagination
+        cursor = args.get('cursor')
+        last_customer = decode_cursor(cursor, ("customer",))["customer"][1] if cursor else None
+        start = 0 if cursor else (page_number - 1) * page_length  # Calculate start index for pagination
 
         # Get default currency
-        default_currency = frappe.db.get_value('Global Defaults', None, 'default_currency')
-
-        # Query to fetch customers with balances
-        query = """
-            SELECT 
-                `tabCustomer`.`customer_name`,
-                IFNULL(`tabAddress`.`address_line1`, '') AS address,
-                IFNULL(`tabContact`.`mobile_no`, '') AS contact,
-                SUM(CASE WHEN `tabSales Invoice`.`outstanding_amount` > 0 THEN `tabSales Invoice`.`outstanding_amount` ELSE 0 END) AS total_debits,
-                SUM(CASE WHEN `tabSales Invoice`.`outstanding_amount` < 0 THEN -(`tabSales Invoice`.`outstanding_amount`) ELSE 0 END) AS total_credits
-            FROM 
-                `tabCustomer`
-            LEFT JOIN 
-                `tabDynamic Link` ON `tabDynamic Link`.`parent` = `tabCustomer`.`name` AND `tabDynamic Link`.`link_doctype` = 'Address'
-            LEFT JOIN 
-                `tabAddress` ON `tabAddress`.`name` = `tabDynamic Link`.`parent` AND `tabAddress`.`disabled` = 0
-            LEFT JOIN 
-                `tabContact` ON `tabContact`.`is_primary_contact` = 1 AND `tabContact`.`name` = `tabCustomer`.`name`
-            LEFT JOIN 
-                `tabSales Invoice` ON `tabSales Invoice`.`customer` = `tabCustomer`.`name` AND `tabSales Invoice`.`docstatus` = 1
-            WHERE 
-                (`tabSales Invoice`.`outstanding_amount` > 0 OR `tabSales Invoice`.`outstanding_amount` < 0)
-            GROUP BY 
-                `tabCustomer`.`name`
-            LIMIT {}, {}
-        """.format(start, page_length)
+        default_currency = get_retail_config().default_currency
 
         # Fetch results from the database
-        results = frappe.db.sql(query, as_dict=True)
+        query, values = get_customers_with_balances_query(page_length, last_customer, start)
+        results = frappe.db.sql(query, values, as_dict=True)
 
         # Replace None with empty string for contact field and format currency
         for result in results:
@@ -367,6 +588,7 @@ def get_customers_with_balances():
             "per_page": page_length,
             "previous_page": previous_page,
             "next_page": next_page,
+            "next_cursor": encode_cursor({"customer": ["", results[-1]['customer']]}) if next_page else None,
         }
 
         # Prepare response
@@ -381,6 +603,11 @@ def get_customers_with_balances():
                         status=200,
                         mimetype='application/json')
 
+    except InvalidCursorError as e:
+        return Response(response=json.dumps({"status": "failed", "error": str(e)}),
+                        status=400,
+                        mimetype='application/json')
+
     except Exception as e:
         # Log the exception and return a failure response
         frappe.log_error(frappe.get_traceback(), 'Get Customers with Balances Error')
@@ -390,6 +617,7 @@ def get_customers_with_balances():
 
 
 @frappe.whitelist(allow_guest=True)
+@instrument
 def make_customer_payment_entry():
     try:
         import frappe
@@ -429,3 +657,51 @@ def make_customer_payment_entry():
         # Log the exception and return a failure response
         frappe.log_error(frappe.get_traceback(), 'Payment Entry Creation Error')
         return {"status": "failed", "error": str(e)}
+
+@frappe.whitelist()
+@instrument
+def make_customer_payment_entries():
+    """
+    Receive a batch of customer payments, e.g. the collections of a day.
+
+    `data` is a JSON array of payments with `customer`, `amount`,
+    `paid_from_account` and `paid_to_account`. Each payment is allocated to
+    the customer's outstanding invoices oldest first. The response has one
+    result per payment, in the same order, with either its `payment_entry`
+    and allocations or `error`.
+    """
+    data = frappe.form_dict.get('data')
+    if not data:
+        return {"error": "No data provided"}
+
+    payments = frappe.parse_json(data)
+    if not isinstance(payments, list):
+        return {"error": "Expected a list of payments"}
+
+    results = insert_payments(payments)
+
+    return {
+        "message": "Processed {} Payment Entries".format(len(results)),
+        "results": results
+    }
+
+@frappe.whitelist()
+def get_metrics():
+    """
+    Get the per-endpoint call metrics in the Prometheus text format.
+    """
+    frappe.only_for("System Manager")
+
+    return Response(response=get_prometheus_metrics(),
+            status=200,
+            mimetype='text/plain; version=0.0.4')
+
+@frappe.whitelist()
+def get_recent_api_calls(slow=0, limit=100):
+    """
+    Get the most recent instrumented calls, newest first. Pass `slow=1` for
+    the calls over the slow call threshold, with their SQL trace.
+    """
+    frappe.only_for("System Manager")
+
+    return get_recent_calls(slow=cint(slow), limit=min(cint(limit) or 100, 1000))
@@ -0,0 +1,338 @@
+import json
+
+import frappe
+from frappe.utils import flt, fmt_money, now
+
+
+def get_customer_balances(customers=None):
+    """
+    Get the advance balance and total due of customers, keyed by customer.
+
+    Balances are read from the `Retail Customer Balance` summary table, which
+    holds one row per customer, so the cost does not depend on the size of
+    the ledger. Pass `customers` to restrict the result to those customers;
+    every one of them is present in the result even if it has no balance.
+    """
+    conditions = ""
+    values = {}
+    if customers is not None:
+        customers = list(customers)
+        if not customers:
+            return {}
+        conditions = "WHERE `customer` IN %(customers)s"
+        values["customers"] = customers
+
+    rows = frappe.db.sql("""
+        SELECT `customer`, `debit` - `credit` AS balance
+        FROM `tabRetail Customer Balance`
+        {}
+    """.format(conditions), values)
+
+    balances = {customer: make_balance(0) for customer in customers or []}
+    for customer, balance in rows:
+        balances[customer] = make_balance(balance)
+
+    return balances
+
+
+def get_customer_list(currency):
+    """
+    Get every customer with its balances formatted in `currency`.
+    """
+    customers = frappe.get_all('Customer', fields=['name', 'customer_name'])
+    balances = get_customer_balances()
+
+    customer_list = []
+    for customer in customers:
+        balance = balances.get(customer.name) or make_balance(0)
+        customer_list.append(serialize_customer(customer.name, customer.customer_name, balance, currency))
+
+    return customer_list
+
+
+def get_customer_list_payload(currency):
+    """
+    Get the JSON of `get_customer_list`.
+    """
+    return json.dumps(get_customer_list(currency))
+
+
+def serialize_customer(name, customer_name, balance, currency):
+    return {
+        "id": name,
+        "name": customer_name,
+        "advance_balance": fmt_money(balance["advance_balance"], currency=currency),
+        "total_due": fmt_money(balance["total_due"], currency=currency)
+    }
+
+
+def get_customers_query():
+    """
+    Build a single query returning every customer with its net balance.
+    """
+    query = """
+        SELECT `tabCustomer`.`name`, `tabCustomer`.`customer_name`,
+            IFNULL(`tabRetail Customer Balance`.`debit` - `tabRetail Customer Balance`.`credit`, 0) AS balance
+        FROM `tabCustomer`
+        LEFT JOIN `tabRetail Customer Balance` ON `tabRetail Customer Balance`.`customer` = `tabCustomer`.`name`
+        ORDER BY `tabCustomer`.`name`
+    """
+
+    return query, {}
+
+
+def get_customers_with_balances_query(page_length, last_customer=None, start=0):
+    """
+    Build the query for a page of customers with a non-zero balance, with
+    their primary address and contact.
+
+    The page is cut from the balance summary table first (one row per
+    customer, seeking past `last_customer` on its primary key), so the
+    address and contact lookups only run for the customers on the page and
+    cannot multiply the balances.
+    """
+    conditions = ""
+    values = {"page_length": int(page_length), "start": int(start)}
+    if last_customer:
+        conditions = "AND `customer` > %(last_customer)s"
+        values["last_customer"] = last_customer
+
+    query = """
+        SELECT
+            `tabCustomer`.`name` AS customer,
+            `tabCustomer`.`customer_name`,
+            IFNULL((
+                SELECT `tabAddress`.`address_line1`
+                FROM `tabDynamic Link`
+                INNER JOIN `tabAddress` ON `tabAddress`.`name` = `tabDynamic Link`.`parent`
+                WHERE `tabDynamic Link`.`link_doctype` = 'Customer'
+                AND `tabDynamic Link`.`link_name` = `tabCustomer`.`name`
+                AND `tabDynamic Link`.`parenttype` = 'Address'
+                AND `tabAddress`.`disabled` = 0
+                ORDER BY `tabAddress`.`is_primary_address` DESC, `tabAddress`.`name`
+                LIMIT 1
+            ), '') AS address,
+            IFNULL((
+                SELECT `tabContact`.`mobile_no`
+                FROM `tabDynamic Link`
+                INNER JOIN `tabContact` ON `tabContact`.`name` = `tabDynamic Link`.`parent`
+                WHERE `tabDynamic Link`.`link_doctype` = 'Customer'
+                AND `tabDynamic Link`.`link_name` = `tabCustomer`.`name`
+                AND `tabDynamic Link`.`parenttype` = 'Contact'
+                ORDER BY `tabContact`.`is_primary_contact` DESC, `tabContact`.`name`
+                LIMIT 1
+            ), '') AS contact,
+            `balance`.`total_debits`,
+            `balance`.`total_credits`
+        FROM (
+            SELECT
+                `customer`,
+                GREATEST(`debit` - `credit`, 0) AS total_debits,
+                GREATEST(`credit` - `debit`, 0) AS total_credits
+            FROM `tabRetail Customer Balance`
+            WHERE `debit` != `credit` {conditions}
+            ORDER BY `customer`
+            LIMIT %(start)s, %(page_length)s
+        ) AS `balance`
+        INNER JOIN `tabCustomer` ON `tabCustomer`.`name` = `balance`.`customer`
+        ORDER BY `tabCustomer`.`name`
+    """.format(conditions=conditions)
+
+    return query, values
+
+
+def make_balance(balance):
+    """
+    Split a net ledger balance (debit - credit) into advance and due amounts.
+    """
+    balance = flt(balance)
+    return {
+        "advance_balance": -balance if balance < 0 else 0.0,
+        "total_due": balance if balance > 0 else 0.0
+    }
+
+
+def update_customer_balance(customer, debit, credit):
+    """
+    Add `debit` and `credit` to the customer's summary row, creating it if
+    needed. The upsert is a single statement, so concurrent postings for the
+    same customer cannot overwrite each other.
+    """
+    timestamp = now()
+    frappe.db.sql("""
+        INSERT INTO `tabRetail Customer Balance`
+            (`name`, `customer`, `debit`, `credit`, `creation`, `modified`, `owner`, `modified_by`, `docstatus`)
+        VALUES
+            (%(customer)s, %(customer)s, %(debit)s, %(credit)s, %(now)s, %(now)s, %(user)s, %(user)s, 0)
+        ON DUPLICATE KEY UPDATE
+            `debit` = `debit` + VALUES(`debit`),
+            `credit` = `credit` + VALUES(`credit`),
+            `modified` = VALUES(`modified`),
+            `modified_by` = VALUES(`modified_by`)
+    """, {
+        "customer": customer,
+        "debit": flt(debit),
+        "credit": flt(credit),
+        "now": timestamp,
+        "user": frappe.session.user
+    })
+
+
+def on_gl_entry_insert(doc, method=None):
+    """
+    Post a new customer GL Entry to the summary table.
+
+    Cancelling a voucher inserts reversing entries with debit and credit
+    swapped, so applying every inserted entry keeps the summary equal to the
+    balance of the active entries. Reposts delete a voucher's entries with
+    plain SQL before inserting them again, so the customers of reposted
+    entries are rebuilt from the ledger instead.
+    """
+    if doc.party_type != "Customer" or not doc.party:
+        return
+
+    if doc.flags.from_repost:
+        queue_customer_rebuild(doc.party)
+    else:
+        update_customer_balance(doc.party, doc.debit, doc.credit)
+
+
+def queue_customer_rebuild(customer):
+    """
+    Rebuild the summary row of `customer` in a background job once the
+    transaction is committed, with the other customers queued in it.
+    """
+    customers = frappe.flags.setdefault("retail_rebuild_customers", set())
+    if not customers:
+        frappe.db.after_commit.add(enqueue_customer_rebuild)
+        frappe.db.after_rollback.add(lambda: frappe.flags.pop("retail_rebuild_customers", None))
+
+    customers.add(customer)
+
+
+def enqueue_customer_rebuild():
+    customers = frappe.flags.pop("retail_rebuild_customers", None)
+    if customers:
+        frappe.enqueue("retail_app.balances.rebuild_customer_batches", queue="long", customers=sorted(customers))
+
+
+def rebuild_customer_batches(customers):
+    """
+    Rebuild the summary rows of `customers`, committing every 1000.
+    """
+    for start in range(0, len(customers), 1000):
+        rebuild_customers(customers[start:start + 1000])
+        frappe.db.commit()
+
+
+def rebuild_customer_balances(batch_size=1000):
+    """
+    Reconcile the summary table with the ledger from scratch.
+
+    Customers are processed in batches ordered by name and each batch is
+    committed on its own, so the rebuild can run on a live site without
+    holding long locks. Returns the number of customers processed.
+    """
+    batch_size = int(batch_size)
+    last_customer = ""
+    processed = 0
+
+    while True:
+        customers = frappe.db.sql_list("""
+            SELECT `name` FROM `tabCustomer`
+            WHERE `name` > %s
+            ORDER BY `name`
+            LIMIT %s
+        """, (last_customer, batch_size))
+        if not customers:
+            break
+
+        rebuild_customers(customers)
+        frappe.db.commit()
+        processed += len(customers)
+        last_customer = customers[-1]
+
+    # Drop rows left behind by deleted customers
+    frappe.db.sql("""
+        DELETE FROM `tabRetail Customer Balance`
+        WHERE `customer` NOT IN (SELECT `name` FROM `tabCustomer`)
+    """)
+    frappe.db.commit()
+
+    return processed
+
+
+def rebuild_customers(customers):
+    """
+    Overwrite the summary rows of `customers` with their ledger totals,
+    dropping the rows of customers without ledger entries.
+    """
+    # Overwrite each customer's row with its ledger totals in one statement
+    timestamp = now()
+    frappe.db.sql("""
+        INSERT INTO `tabRetail Customer Balance`
+            (`name`, `customer`, `debit`, `credit`, `creation`, `modified`, `owner`, `modified_by`, `docstatus`)
+        SELECT `party`, `party`, SUM(`debit`), SUM(`credit`), %(now)s, %(now)s, %(user)s, %(user)s, 0
+        FROM `tabGL Entry`
+        WHERE `party_type` = 'Customer' AND `is_cancelled` = 0 AND `party` IN %(customers)s
+        GROUP BY `party`
+        ON DUPLICATE KEY UPDATE
+            `debit` = VALUES(`debit`),
+            `credit` = VALUES(`credit`),
+            `modified` = VALUES(`modified`),
+            `modified_by` = VALUES(`modified_by`)
+    """, {"customers": customers, "now": timestamp, "user": frappe.session.user})
+
+    # Customers without ledger entries no longer carry a balance
+    frappe.db.sql("""
+        DELETE FROM `tabRetail Customer Balance`
+        WHERE `customer` IN %(customers)s
+        AND `modified` != %(now)s
+    """, {"customers": customers, "now": timestamp})
+
+
+def get_balance_drift():
+    """
+    Compare the summary table against the live ledger.
+
+    Returns one row per customer whose stored balance differs from the
+    ledger, with both balances and the difference.
+    """
+    stored = dict(frappe.db.sql("""
+        SELECT `customer`, `debit` - `credit` FROM `tabRetail Customer Balance`
+    """))
+    ledger = dict(frappe.db.sql("""
+        SELECT `party`, SUM(`debit`) - SUM(`credit`)
+        FROM `tabGL Entry`
+        WHERE `party_type` = 'Customer' AND `is_cancelled` = 0
+        GROUP BY `party`
+    """))
+
+    drift = []
+    for customer in sorted(set(stored) | set(ledger)):
+        stored_balance = flt(stored.get(customer))
+        ledger_balance = flt(ledger.get(customer))
+        difference = flt(stored_balance - ledger_balance, 9)
+        if difference:
+            drift.append(frappe._dict(
+                customer=customer,
+                stored_balance=stored_balance,
+                ledger_balance=ledger_balance,
+                difference=difference
+            ))
+
+    return drift
+
+
+def reconcile_customer_balances():
+    """
+    Scheduled job rebuilding the summary rows of the customers whose balance
+    drifted from the ledger, e.g. through ledger changes made with plain SQL
+    outside of reposts.
+
+    It compares the whole ledger, so it runs weekly.
+    """
+    customers = [row.customer for row in get_balance_drift()]
+    rebuild_customer_batches(customers)
+
+    return len(customers)
@@ -0,0 +1,313 @@
+"""
+Benchmarks for the retail APIs.
+
+Each module exposes a `run` function meant to be called on a development
+site, for example:
+
+    bench --site retail.localhost execute retail_app.benchmark.customers.run
+
+Synthetic records are written inside a transaction that is rolled back once
+the measurements are taken, so the site data is left untouched.
+
+This module holds what the benchmarks share: the synthetic datasets and the
+timing loops. Each benchmark module only declares its scenario.
+"""
+import copy
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import frappe
+import requests
+from frappe.utils import add_days, now, nowdate
+
+from retail_app.utils import capture_queries
+
+# Synthetic price lists, each pricing every synthetic item
+PRICE_LISTS = ("_Bench Retail", "_Bench Wholesale")
+
+
+@contextmanager
+def rolled_back():
+    """
+    Discard everything written to the database inside the block.
+
+    Coalescing is turned off meanwhile: repeated calls must measure the
+    endpoint rather than a shared result, and results built from rows that
+    are rolled back must not be shared with later calls or other workers.
+    """
+    frappe.db.rollback()
+    coalescing_disabled = frappe.conf.get("retail_disable_coalescing")
+    frappe.conf.retail_disable_coalescing = True
+    try:
+        yield
+    finally:
+        frappe.conf.retail_disable_coalescing = coalescing_disabled
+        frappe.db.rollback()
+
+
+def insert_rows(doctype, rows):
+    """
+    Bulk insert synthetic rows, filling in the standard columns.
+    """
+    if not rows:
+        return
+
+    timestamp = now()
+    standard = {
+        "creation": timestamp,
+        "modified": timestamp,
+        "owner": "Administrator",
+        "modified_by": "Administrator",
+        "docstatus": 0
+    }
+    fields = list(standard) + [field for field in rows[0] if field not in standard]
+    values = [tuple(row.get(field, standard.get(field)) for field in fields) for row in rows]
+    frappe.db.bulk_insert(doctype, fields, values)
+
+
+def make_customers(count, entries_per_customer):
+    """
+    Insert `count` synthetic customers with a few GL entries each, and their
+    rows in the balance summary table.
+    """
+    customers = []
+    gl_entries = []
+    balances = []
+    for i in range(count):
+        name = "_Bench Customer {:06d}".format(i)
+        customers.append({"name": name, "customer_name": name})
+        debit = credit = 0.0
+        for j in range(entries_per_customer):
+            entry = {
+                "name": "_bench-gle-{:06d}-{:03d}".format(i, j),
+                "docstatus": 1,
+                "posting_date": nowdate(),
+                "party_type": "Customer",
+                "party": name,
+                "debit": 100.0 if j % 2 == 0 else 0.0,
+                "credit": 0.0 if j % 2 == 0 else 40.0,
+                "is_cancelled": 0
+            }
+            debit += entry["debit"]
+            credit += entry["credit"]
+            gl_entries.append(entry)
+        balances.append({"name": name, "customer": name, "debit": debit, "credit": credit})
+
+    insert_rows("Customer", customers)
+    insert_rows("GL Entry", gl_entries)
+    insert_rows("Retail Customer Balance", balances)
+
+
+def make_items(count, warehouses):
+    """
+    Insert `count` synthetic items with a bin in each of `warehouses`.
+    """
+    items = []
+    bins = []
+    for i in range(count):
+        item_code = "_Bench Item {:06d}".format(i)
+        items.append({
+            "name": item_code,
+            "item_code": item_code,
+            "item_name": item_code,
+            "stock_uom": "Nos",
+            "is_stock_item": 1
+        })
+        for j, warehouse in enumerate(warehouses):
+            bins.append({
+                "name": "_bench-bin-{:06d}-{:03d}".format(i, j),
+                "item_code": item_code,
+                "warehouse": warehouse,
+                "actual_qty": (i + j) % 50
+            })
+
+    insert_rows("Item", items)
+    insert_rows("Bin", bins)
+
+
+def make_item_prices(count):
+    """
+    Insert the synthetic selling price lists with a price for each of the
+    first `count` synthetic items.
+    """
+    currency = frappe.db.get_value('Global Defaults', None, 'default_currency')
+    insert_rows("Price List", [
+        {"name": price_list, "price_list_name": price_list, "selling": 1, "enabled": 1, "currency": currency}
+        for price_list in PRICE_LISTS
+    ])
+
+    prices = []
+    for i in range(count):
+        item_code = "_Bench Item {:06d}".format(i)
+        for j, price_list in enumerate(PRICE_LISTS):
+            prices.append({
+                "name": "_bench-ip-{:06d}-{:02d}".format(i, j),
+                "item_code": item_code,
+                "price_list": price_list,
+                "uom": "Nos",
+                "selling": 1,
+                "currency": currency,
+                "price_list_rate": 100.0 - 10 * j + i % 50
+            })
+
+    insert_rows("Item Price", prices)
+
+
+def make_sales_invoices(count, items_per_invoice):
+    """
+    Insert `count` synthetic submitted invoices with a few line items each.
+    """
+    invoices = []
+    items = []
+    for i in range(count):
+        name = "_BENCH-SINV-{:07d}".format(i)
+        invoices.append({
+            "name": name,
+            "docstatus": 1,
+            "customer": "_Bench Customer {:06d}".format(i % 1000),
+            "posting_date": add_days(nowdate(), -(i % 365)),
+            "due_date": nowdate(),
+            "posting_time": "10:00:00",
+            "status": "Unpaid",
+            "grand_total": 100.0 * items_per_invoice,
+            "outstanding_amount": 50.0 * items_per_invoice
+        })
+        for j in range(items_per_invoice):
+            items.append({
+                "name": "{}-{:03d}".format(name, j),
+                "docstatus": 1,
+                "parent": name,
+                "parenttype": "Sales Invoice",
+                "parentfield": "items",
+                "idx": j + 1,
+                "item_code": "_Bench Item {:06d}".format(j),
+                "item_name": "_Bench Item {:06d}".format(j),
+                "qty": 1,
+                "rate": 100.0,
+                "uom": "Nos"
+            })
+
+    insert_rows("Sales Invoice", invoices)
+    insert_rows("Sales Invoice Item", items)
+
+
+def make_invoices(count, customer, item_code, warehouse, qty=1):
+    """
+    Build `count` invoice payloads the way a terminal sends them.
+    """
+    invoice = {
+        "doctype": "Sales Invoice",
+        "customer": customer,
+        "items": [{"item_code": item_code, "qty": qty, "warehouse": warehouse}]
+    }
+    return [copy.deepcopy(invoice) for _i in range(count)]
+
+
+def run_sizes(sizes, scenario):
+    """
+    Run `scenario` once per dataset size, each in its own rolled back
+    transaction, and return its results in order.
+    """
+    results = []
+    for size in frappe.parse_json(sizes):
+        with rolled_back():
+            results.append(scenario(int(size)))
+
+    return results
+
+
+def measure(fn, *args, **kwargs):
+    """
+    Call `fn` once and return its wall time and the number of queries it ran.
+    """
+    with capture_queries() as queries:
+        start = time.perf_counter()
+        fn(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+
+    return {
+        "seconds": round(elapsed, 4),
+        "queries": len(queries)
+    }
+
+
+def percentiles(samples, points=(50, 90, 99)):
+    """
+    Summarize latency samples (in seconds) as milliseconds percentiles.
+    """
+    samples = sorted(samples)
+    if not samples:
+        return {}
+
+    summary = {}
+    for point in points:
+        index = min(len(samples) - 1, int(round(point / 100 * (len(samples) - 1))))
+        summary[f"p{point}_ms"] = round(samples[index] * 1000, 2)
+
+    return summary
+
+
+def time_samples(fn, samples, prepare=None):
+    """
+    Call `fn(sample)` for each sample, after an untimed `prepare(sample)`
+    when given, and return the latency of each call in seconds.
+    """
+    latencies = []
+    for sample in samples:
+        if prepare:
+            prepare(sample)
+        start = time.perf_counter()
+        fn(sample)
+        latencies.append(time.perf_counter() - start)
+
+    return latencies
+
+
+def measure_rate(fn, count, unit):
+    """
+    Call `fn` once to process `count` records and return its wall time,
+    records per second and result.
+    """
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+
+    return {"seconds": round(elapsed, 4), f"{unit}_per_second": round(count / elapsed, 2)}, result
+
+
+def time_calls(url, calls, concurrency, prepare=None, **kwargs):
+    """
+    POST to `url` `calls` times from `concurrency` threads and return the
+    latency of each call and the total wall time.
+
+    Threads only use `requests` and the given callables, as the Frappe
+    context of the benchmark belongs to the main thread.
+    """
+    def worker(count):
+        latencies = []
+        with requests.Session() as session:
+            for _i in range(count):
+                if prepare:
+                    prepare()
+                start = time.perf_counter()
+                response = session.post(url, **kwargs)
+                latencies.append(time.perf_counter() - start)
+                response.raise_for_status()
+        return latencies
+
+    counts = [calls // concurrency + (1 if i < calls % concurrency else 0) for i in range(concurrency)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = [latency for result in executor.map(worker, counts) for latency in result]
+
+    return latencies, time.perf_counter() - start
+
+
+def summarize(latencies, elapsed):
+    """
+    Summarize concurrent calls as latency percentiles and calls per second.
+    """
+    result = percentiles(latencies)
+    result["calls_per_second"] = round(len(latencies) / elapsed, 2)
+    return result
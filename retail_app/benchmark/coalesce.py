@@ -0,0 +1,64 @@
+import frappe
+from frappe.installer import update_site_config
+from frappe.utils import get_url
+
+from retail_app.benchmark import summarize, time_calls
+from retail_app.coalesce import get_coalesce_stats
+
+ENDPOINTS = ("get_items", "get_item_prices", "get_customers")
+
+
+def get_questions():
+    """
+    Get the number of statements the database server has run.
+    """
+    return int(frappe.db.sql("SHOW GLOBAL STATUS LIKE 'Questions'")[0][1])
+
+
+def load_test(base_url, headers, terminals):
+    """
+    Have `terminals` concurrent terminals call each read endpoint once, and
+    report latency and the statements the database ran meanwhile.
+    """
+    results = {}
+    for endpoint in ENDPOINTS:
+        questions = get_questions()
+        latencies, elapsed = time_calls(base_url + "/api/method/retail_app.api." + endpoint,
+                                        terminals, terminals, headers=headers)
+        results[endpoint] = summarize(latencies, elapsed)
+        results[endpoint]["db_statements"] = get_questions() - questions
+
+    return results
+
+
+def run(api_key, api_secret, terminals=200, url=None):
+    """
+    Compare the database load of 200 terminals opening at once with request
+    coalescing disabled and enabled.
+
+    Needs a running site reachable at `url` (the site URL by default) and
+    the API credentials of a terminal user. Statement counts are server
+    wide, so run it on an otherwise idle server.
+    """
+    base_url = (url or get_url()).rstrip("/")
+    headers = {"Authorization": "token {}:{}".format(api_key, api_secret)}
+    terminals = int(terminals)
+
+    update_site_config("retail_disable_coalescing", 1)
+    try:
+        uncoalesced = load_test(base_url, headers, terminals)
+    finally:
+        update_site_config("retail_disable_coalescing", 0)
+
+    before = get_coalesce_stats()
+    coalesced = load_test(base_url, headers, terminals)
+    after = get_coalesce_stats()
+
+    for endpoint in ENDPOINTS:
+        counts = after.get(endpoint, {})
+        coalesced[endpoint]["calls"] = {
+            outcome: count - before.get(endpoint, {}).get(outcome, 0)
+            for outcome, count in counts.items()
+        }
+
+    return {"terminals": terminals, "uncoalesced": uncoalesced, "coalesced": coalesced}
@@ -0,0 +1,76 @@
+import json
+import time
+
+import frappe
+
+from retail_app import api
+from retail_app.balances import get_customer_balances, get_customer_list, get_customers_with_balances_query
+from retail_app.benchmark import make_customers, measure, run_sizes
+from retail_app.settings_cache import get_retail_config
+from retail_app.sync import get_customer_changes
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+def run(sizes=(100, 1000, 5000, 20000), entries_per_customer=5):
+    """
+    Show that `get_customers` runs a fixed number of queries as the number of
+    customers grows.
+    """
+    def scenario(size):
+        make_customers(size, int(entries_per_customer))
+        frappe.form_dict.update({"page_length": 20, "page_number": 1})
+        return {
+            "customers": size,
+            "get_customer_balances": measure(get_customer_balances),
+            "get_customers": measure(api.get_customers),
+            "get_customers_with_balances": measure(api.get_customers_with_balances),
+            "query_plan": explain_customers_with_balances()["full_scans"]
+        }
+
+    return run_sizes(sizes, scenario)
+
+
+def explain_customers_with_balances(page_length=20):
+    """
+    Check the query plan of a `get_customers_with_balances` page.
+
+    Only the derived page of balances may be read with a full scan; any
+    other table listed in `full_scans` means an index is no longer used and
+    the page will slow down as customers grow.
+    """
+    query, values = get_customers_with_balances_query(page_length, last_customer="_")
+    plan = frappe.db.sql("EXPLAIN " + query, values, as_dict=True)
+    full_scans = [row.table for row in plan if row.type == "ALL" and not row.table.startswith("<derived")]
+
+    return {"plan": plan, "full_scans": full_scans}
+
+
+def run_payload(sizes=(1000, 10000, 50000)):
+    """
+    Compare the size and serialization time of the full `get_customers`
+    list with the columnar `sync_customers` payload, in JSON and MessagePack.
+    """
+    def serialize(build, dump):
+        start = time.perf_counter()
+        payload = dump(build())
+        return {"seconds": round(time.perf_counter() - start, 4), "kb": round(len(payload) / 1024, 1)}
+
+    currency = get_retail_config().default_currency
+
+    def scenario(size):
+        make_customers(size, 1)
+        result = {
+            "customers": size,
+            "get_customers": serialize(lambda: get_customer_list(currency), json.dumps),
+            "sync_customers_json": serialize(lambda: get_customer_changes(limit=size * 2),
+                                             lambda data: json.dumps(data, separators=(",", ":")))
+        }
+        if msgpack:
+            result["sync_customers_msgpack"] = serialize(lambda: get_customer_changes(limit=size * 2), msgpack.packb)
+        return result
+
+    return run_sizes(sizes, scenario)
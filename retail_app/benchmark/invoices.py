@@ -0,0 +1,56 @@
+import json
+
+import frappe
+
+from retail_app import api
+from retail_app.benchmark import make_invoices, measure_rate, percentiles, rolled_back, time_samples
+from retail_app.invoices import insert_invoices
+
+
+def time_requests(endpoint, invoices):
+    """
+    Call an invoice endpoint once per payload and return each call's latency.
+    """
+    return time_samples(lambda _invoice: endpoint(), invoices, prepare=lambda invoice: frappe.form_dict.update(data=json.dumps(invoice)))
+
+
+def run(customer, item_code, warehouse, count=200):
+    """
+    Compare invoices/sec of replaying an offline queue one call at a time
+    with the batch path.
+
+    Uses an existing customer and a stock item with enough stock in
+    `warehouse`; every invoice created is rolled back.
+    """
+    count = int(count)
+    results = {"invoices": count}
+
+    with rolled_back():
+        elapsed = sum(time_requests(api.create_sales_invoice, make_invoices(count, customer, item_code, warehouse)))
+        results["single"] = {"seconds": round(elapsed, 4), "invoices_per_second": round(count / elapsed, 2)}
+
+    with rolled_back():
+        invoices = make_invoices(count, customer, item_code, warehouse)
+        results["batch"], _results = measure_rate(lambda: insert_invoices(invoices, commit=False), count, "invoices")
+
+    return results
+
+
+def run_latency(customer, item_code, warehouse, count=200):
+    """
+    Compare the request latency percentiles of synchronous submission with
+    the queued mode, which only saves a draft within the request.
+
+    Nothing is enqueued, as jobs are only sent once the transaction commits
+    and every invoice created is rolled back.
+    """
+    count = int(count)
+    results = {"invoices": count}
+
+    with rolled_back():
+        results["sync"] = percentiles(time_requests(api.create_sales_invoice, make_invoices(count, customer, item_code, warehouse)))
+
+    with rolled_back():
+        results["queued"] = percentiles(time_requests(api.queue_sales_invoice, make_invoices(count, customer, item_code, warehouse)))
+
+    return results
@@ -0,0 +1,54 @@
+import time
+
+from retail_app.benchmark import insert_rows, make_items, percentiles, rolled_back, time_samples
+from retail_app.item_search import ItemIndex, get_item_records
+
+
+def make_barcodes(count):
+    """
+    Insert a barcode for each of the first `count` synthetic items.
+    """
+    insert_rows("Item Barcode", [{
+        "name": "_bench-barcode-{:06d}".format(i),
+        "parent": "_Bench Item {:06d}".format(i),
+        "parenttype": "Item",
+        "parentfield": "barcodes",
+        "idx": 1,
+        "barcode": "2{:011d}".format(i)
+    } for i in range(count)])
+
+
+def time_searches(index, queries, repeat=50):
+    return percentiles(time_samples(index.search, [query for _i in range(repeat) for query in queries]))
+
+
+def run(size=200000):
+    """
+    Measure the build time of the item search index and its lookup latency
+    by barcode, item code, name prefix and name substring.
+
+    The index is built in this process from rolled back synthetic items and
+    is never published to Redis.
+    """
+    size = int(size)
+    with rolled_back():
+        make_items(size, [])
+        make_barcodes(size)
+
+        start = time.perf_counter()
+        records = get_item_records()
+        loaded = time.perf_counter() - start
+        start = time.perf_counter()
+        index = ItemIndex("benchmark", records)
+        built = time.perf_counter() - start
+
+    step = max(size // 100, 1)
+    return {
+        "items": len(records),
+        "load_seconds": round(loaded, 4),
+        "build_seconds": round(built, 4),
+        "barcode": time_searches(index, ["2{:011d}".format(i) for i in range(0, size, step)]),
+        "item_code": time_searches(index, ["_bench item {:06d}".format(i) for i in range(0, size, step)]),
+        "prefix": time_searches(index, ["_be", "_bench item 1", "_bench item 0123"]),
+        "substring": time_searches(index, ["item 1234", "0042", "999"])
+    }
@@ -0,0 +1,25 @@
+import frappe
+
+from retail_app import api
+from retail_app.benchmark import make_items, measure, run_sizes
+
+
+def run(sizes=(1000, 5000, 20000, 50000), warehouse_count=3):
+    """
+    Show that `get_items` runs a fixed number of queries and that its time
+    grows linearly with the size of the catalog.
+    """
+    warehouses = frappe.get_all("Warehouse", filters={"is_group": 0}, pluck="name", limit=int(warehouse_count))
+
+    def scenario(size):
+        make_items(size, warehouses)
+        full = measure(api.get_items)
+        return {
+            "items": size,
+            "get_items": full,
+            "seconds_per_1000_items": round(full["seconds"] * 1000 / size, 4),
+            "get_items_by_warehouse": measure(api.get_items, warehouse=warehouses[0] if warehouses else None),
+            "get_items_page": measure(api.get_items, page_length=500, cursor="_Bench Item {:06d}".format(size // 2))
+        }
+
+    return run_sizes(sizes, scenario)
@@ -0,0 +1,42 @@
+import frappe
+import requests
+from frappe.utils import get_url
+
+from retail_app.benchmark import summarize, time_calls
+from retail_app.login import LOGIN_CACHE_KEY
+
+
+def run(email, password, concurrency=(1, 10, 30), calls=300, url=None):
+    """
+    Compare login throughput over HTTP as terminals log in concurrently:
+    `custom_login` with the login details cache cleared before every call
+    (the cost of an uncached login), with the cache warm, and
+    `refresh_login` with the returned token.
+
+    Needs a running site reachable at `url` (the site URL by default).
+    """
+    base_url = (url or get_url()).rstrip("/")
+    login_url = base_url + "/api/method/retail_app.api.custom_login"
+    refresh_url = base_url + "/api/method/retail_app.api.refresh_login"
+    credentials = {"email": email, "password": password}
+
+    token = requests.post(login_url, data=credentials).json()["message"]
+    user = frappe.db.get_value("User", {"api_key": token["key"]}, "name")
+
+    # Computed here, as the key prefix depends on the site context
+    cache = frappe.cache()
+    cache_key = cache.make_key(LOGIN_CACHE_KEY.format(user))
+
+    results = []
+    for threads in frappe.parse_json(concurrency):
+        threads = int(threads)
+        results.append({
+            "concurrency": threads,
+            "login_uncached": summarize(*time_calls(login_url, int(calls), threads,
+                                                    prepare=lambda: cache.delete(cache_key), data=credentials)),
+            "login": summarize(*time_calls(login_url, int(calls), threads, data=credentials)),
+            "refresh": summarize(*time_calls(refresh_url, int(calls), threads,
+                                             headers={"Authorization": "token {}:{}".format(token["key"], token["secret"])}))
+        })
+
+    return results
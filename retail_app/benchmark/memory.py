@@ -0,0 +1,52 @@
+import time
+import tracemalloc
+
+import frappe
+
+from retail_app import api
+from retail_app.benchmark import make_customers, make_items, run_sizes
+
+
+def measure_memory(fn, *args, **kwargs):
+    """
+    Call an endpoint, consume its whole response body and return the peak
+    Python memory allocated while doing so.
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        response = fn(*args, **kwargs)
+        size = 0
+        # Iterate the body the way the WSGI server does
+        for chunk in response.response:
+            size += len(chunk)
+        _current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "seconds": round(time.perf_counter() - start, 4),
+        "peak_mb": round(peak / 1024 / 1024, 2),
+        "response_mb": round(size / 1024 / 1024, 2)
+    }
+
+
+def run(sizes=(10000, 50000, 100000)):
+    """
+    Compare the peak memory of the buffered and streamed modes of the catalog
+    endpoints as the catalog grows.
+    """
+    warehouses = frappe.get_all("Warehouse", filters={"is_group": 0}, pluck="name", limit=1)
+
+    def scenario(size):
+        make_items(size, warehouses)
+        make_customers(size, 1)
+        return {
+            "rows": size,
+            "get_items": measure_memory(api.get_items),
+            "get_items_stream": measure_memory(api.get_items, stream="json"),
+            "get_customers": measure_memory(api.get_customers),
+            "get_customers_stream": measure_memory(api.get_customers, stream="ndjson")
+        }
+
+    return run_sizes(sizes, scenario)
@@ -0,0 +1,53 @@
+import json
+
+import frappe
+from frappe.utils import nowdate
+
+from retail_app import api
+from retail_app.benchmark import measure_rate, rolled_back, time_samples
+from retail_app.payments import insert_payments
+
+
+def make_payments(count, customers, paid_from_account, paid_to_account, amount=10):
+    """
+    Build `count` payment payloads spread over `customers`.
+    """
+    return [{
+        "customer": customers[i % len(customers)],
+        "paid_from_account": paid_from_account,
+        "paid_to_account": paid_to_account,
+        "amount": amount,
+        "reference_no": "_bench-{}".format(i),
+        "reference_date": nowdate()
+    } for i in range(count)]
+
+
+def run(paid_from_account, paid_to_account, count=200, customer_count=20):
+    """
+    Compare payments/sec of looping over `make_customer_payment_entry` with
+    the batch path, which also allocates each payment to outstanding
+    invoices.
+
+    Uses existing customers with outstanding invoices; every payment created
+    is rolled back.
+    """
+    count = int(count)
+    customers = frappe.db.sql_list("""
+        SELECT DISTINCT `customer` FROM `tabSales Invoice`
+        WHERE `docstatus` = 1 AND `outstanding_amount` > 0
+        LIMIT %s
+    """, int(customer_count))
+    results = {"payments": count, "customers": len(customers)}
+
+    with rolled_back():
+        elapsed = sum(time_samples(lambda _payment: api.make_customer_payment_entry(),
+                                   make_payments(count, customers, paid_from_account, paid_to_account),
+                                   prepare=lambda payment: frappe.form_dict.update(data=json.dumps(payment))))
+        results["single"] = {"seconds": round(elapsed, 4), "payments_per_second": round(count / elapsed, 2)}
+
+    with rolled_back():
+        payments = make_payments(count, customers, paid_from_account, paid_to_account)
+        results["batch"], batch = measure_rate(lambda: insert_payments(payments, commit=False), count, "payments")
+        results["batch"]["allocated"] = sum(1 for result in batch if result.get("allocations"))
+
+    return results
@@ -0,0 +1,61 @@
+from retail_app.benchmark import PRICE_LISTS, insert_rows, make_item_prices, make_items, measure, percentiles, rolled_back, time_samples
+from retail_app.quotes import quote_carts
+
+
+def make_pricing_rules(count, step=10):
+    """
+    Insert a discount rule for every `step`th of the first `count` synthetic
+    items.
+    """
+    rules = []
+    targets = []
+    for i in range(0, count, step):
+        name = "_Bench Rule {:06d}".format(i)
+        rules.append({
+            "name": name,
+            "title": name,
+            "apply_on": "Item Code",
+            "price_or_product_discount": "Price",
+            "selling": 1,
+            "rate_or_discount": "Discount Percentage",
+            "discount_percentage": 10,
+            "priority": 1
+        })
+        targets.append({
+            "name": "_bench-rule-item-{:06d}".format(i),
+            "parent": name,
+            "parenttype": "Pricing Rule",
+            "parentfield": "items",
+            "idx": 1,
+            "item_code": "_Bench Item {:06d}".format(i)
+        })
+
+    insert_rows("Pricing Rule", rules)
+    insert_rows("Pricing Rule Item Code", targets)
+
+
+def run(lines=200, carts=20, samples=20):
+    """
+    Measure the latency and query count of quoting one cart of `lines`
+    lines, and a batch of `carts` such carts.
+    """
+    lines, carts, samples = int(lines), int(carts), int(samples)
+
+    def make_cart():
+        return {
+            "selling_price_list": PRICE_LISTS[0],
+            "items": [{"item_code": "_Bench Item {:06d}".format(i), "qty": 1 + i % 5} for i in range(lines)]
+        }
+
+    with rolled_back():
+        make_items(lines, [])
+        make_item_prices(lines)
+        make_pricing_rules(lines)
+
+        latencies = time_samples(lambda _i: quote_carts([make_cart()]), range(samples))
+
+        return {
+            "lines": lines,
+            "single_cart": dict(percentiles(latencies), **measure(quote_carts, [make_cart()])),
+            "batch": dict(carts=carts, **measure(quote_carts, [make_cart() for _j in range(carts)]))
+        }
@@ -0,0 +1,25 @@
+import frappe
+
+from retail_app import api
+from retail_app.benchmark import make_sales_invoices, measure, rolled_back
+
+
+def run(page_sizes=(20, 50, 100, 200, 500), invoices=5000, items_per_invoice=5):
+    """
+    Show that `get_sales_invoices` runs a fixed number of queries per page,
+    with and without line items, as the page size grows.
+    """
+    results = []
+    with rolled_back():
+        make_sales_invoices(int(invoices), int(items_per_invoice))
+        for page_size in frappe.parse_json(page_sizes):
+            frappe.form_dict.update({"page": 1, "per_page": page_size, "summary": 0})
+            with_items = measure(api.get_sales_invoices)
+            frappe.form_dict.summary = 1
+            results.append({
+                "per_page": int(page_size),
+                "with_items": with_items,
+                "summary": measure(api.get_sales_invoices)
+            })
+
+    return results
@@ -0,0 +1,202 @@
+"""
+Benchmark every retail endpoint against synthetic datasets of growing size.
+
+Run it with the `run-retail-benchmark` bench command, or:
+
+    bench --site retail.localhost execute retail_app.benchmark.suite.run
+
+The dataset is generated deterministically from the scale, so two runs at
+the same scale read the same rows and their reports can be compared.
+"""
+import json
+import time
+import tracemalloc
+
+import frappe
+from frappe.utils import now, nowdate
+
+import retail_app
+from retail_app import api
+from retail_app.benchmark import (PRICE_LISTS, make_customers, make_invoices, make_item_prices, make_items,
+    make_sales_invoices, percentiles, rolled_back)
+from retail_app.price_cache import SELLING_PRICE_LISTS_VERSION_KEY, clear_price_list, get_selling_price_lists, increment
+from retail_app.utils import capture_queries
+
+
+def make_dataset(scale, warehouses, entries_per_customer=5, invoices_per_customer=2, items_per_invoice=3):
+    """
+    Insert a synthetic dataset of `scale` customers and `scale` items: bins
+    in each of `warehouses`, prices in two price lists, GL entries and
+    historical invoices.
+    """
+    make_customers(scale, entries_per_customer)
+    make_items(scale, warehouses)
+    make_item_prices(scale)
+    # Historical invoices are spread over the first thousand customers
+    make_sales_invoices(min(scale, 1000) * invoices_per_customer, items_per_invoice)
+
+    return {
+        "customers": scale,
+        "gl_entries": scale * entries_per_customer,
+        "items": scale,
+        "bins": scale * len(warehouses),
+        "item_prices": scale * len(PRICE_LISTS),
+        "sales_invoices": min(scale, 1000) * invoices_per_customer
+    }
+
+
+def reset_price_cache():
+    """
+    Drop the cached selling prices, which bulk inserted rows do not
+    invalidate.
+    """
+    increment(SELLING_PRICE_LISTS_VERSION_KEY)
+    for price_list in get_selling_price_lists():
+        clear_price_list(price_list)
+
+
+def get_response_size(result):
+    """
+    Consume an endpoint's response and return its size in bytes.
+    """
+    if hasattr(result, "iter_encoded"):
+        return sum(len(chunk) for chunk in result.iter_encoded())
+
+    return len(frappe.as_json(result, indent=None))
+
+
+def call(endpoint, form, kwargs):
+    frappe.form_dict.clear()
+    frappe.form_dict.update(form() if callable(form) else form)
+    return get_response_size(endpoint(**kwargs))
+
+
+def benchmark_endpoint(endpoint, samples, form=None, kwargs=None, warmup=1):
+    """
+    Call an endpoint `samples` times and summarize its latency, queries and
+    response size, then once more under tracemalloc for its peak memory.
+
+    `form` is the `frappe.form_dict` of each call, or a function returning it
+    for endpoints that must not receive the same payload twice.
+    """
+    form = form or {}
+    kwargs = kwargs or {}
+    for _i in range(warmup):
+        call(endpoint, form, kwargs)
+
+    latencies = []
+    query_counts = []
+    size = 0
+    for _i in range(samples):
+        with capture_queries() as queries:
+            start = time.perf_counter()
+            size = call(endpoint, form, kwargs)
+            latencies.append(time.perf_counter() - start)
+        query_counts.append(len(queries))
+
+    tracemalloc.start()
+    try:
+        call(endpoint, form, kwargs)
+        _current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    result = percentiles(latencies)
+    result.update({
+        "samples": samples,
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 2),
+        "queries": max(query_counts),
+        "response_bytes": size,
+        "peak_memory_mb": round(peak / 1024 / 1024, 2)
+    })
+
+    return result
+
+
+def get_payment_accounts():
+    """
+    Get the receivable and cash accounts of the default company, used to
+    post benchmark payments.
+    """
+    company = frappe.defaults.get_global_default("company")
+    if not company:
+        return None, None
+
+    return frappe.get_cached_value("Company", company, ["default_receivable_account", "default_cash_account"])
+
+
+def run_scale(scale, samples, warehouses, customer=None, item_code=None, warehouse=None):
+    """
+    Generate the dataset of one scale and benchmark every endpoint on it.
+    Everything written, including the invoices and payments created by the
+    write endpoints, is rolled back.
+    """
+    with rolled_back():
+        reset_price_cache()
+        dataset = make_dataset(scale, warehouses)
+        try:
+            endpoints = {
+                "get_customers": benchmark_endpoint(api.get_customers, samples),
+                "get_items": benchmark_endpoint(api.get_items, samples),
+                "get_items_by_warehouse": benchmark_endpoint(api.get_items, samples,
+                                                             kwargs={"warehouse": warehouses[0] if warehouses else None}),
+                "get_item_prices": benchmark_endpoint(api.get_item_prices, samples),
+                # The total is cached across calls, so it is left out to keep runs comparable
+                "get_sales_invoices": benchmark_endpoint(api.get_sales_invoices, samples,
+                                                         form={"page": 1, "per_page": 20, "summary": 0, "with_count": 0}),
+                "get_customers_with_balances": benchmark_endpoint(api.get_customers_with_balances, samples,
+                                                                  form={"page_length": 20})
+            }
+
+            # Posting invoices needs a real customer and a stock item with stock
+            if customer and item_code and warehouse:
+                endpoints["create_sales_invoice"] = benchmark_endpoint(
+                    api.create_sales_invoice, samples,
+                    form=lambda: {"data": json.dumps(make_invoices(1, customer, item_code, warehouse)[0])})
+            else:
+                endpoints["create_sales_invoice"] = {"skipped": "pass customer, item_code and warehouse"}
+
+            paid_from, paid_to = get_payment_accounts()
+            if paid_from and paid_to:
+                endpoints["make_customer_payment_entry"] = benchmark_endpoint(
+                    api.make_customer_payment_entry, samples,
+                    form={"data": json.dumps({
+                        "paid_from_account": paid_from,
+                        "paid_to_account": paid_to,
+                        "amount": 10,
+                        "reference_no": "_bench",
+                        "reference_date": nowdate()
+                    })})
+            else:
+                endpoints["make_customer_payment_entry"] = {"skipped": "default company has no receivable or cash account"}
+        finally:
+            frappe.form_dict.clear()
+            reset_price_cache()
+
+    return {"scale": scale, "dataset": dataset, "endpoints": endpoints}
+
+
+def run(scales=(1000, 10000, 50000), samples=20, warehouse_count=3, customer=None, item_code=None, warehouse=None):
+    """
+    Benchmark every endpoint at each scale and return a JSON-serializable
+    report of latency percentiles, query counts and peak memory.
+
+    `create_sales_invoice` is only measured when an existing `customer` and
+    an `item_code` with stock in `warehouse` are given.
+    """
+    warehouses = frappe.get_all("Warehouse", filters={"is_group": 0}, pluck="name", limit=int(warehouse_count))
+
+    return {
+        "generated_at": now(),
+        "site": frappe.local.site,
+        "versions": {
+            "retail_app": retail_app.__version__,
+            "frappe": frappe.__version__
+        },
+        "samples": int(samples),
+        "warehouses": len(warehouses),
+        "results": [
+            run_scale(int(scale), int(samples), warehouses, customer, item_code, warehouse)
+            for scale in frappe.parse_json(scales)
+        ]
+    }
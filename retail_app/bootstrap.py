@@ -0,0 +1,143 @@
+import hashlib
+import json
+
+import frappe
+from frappe.utils import add_to_date, get_datetime, now_datetime
+
+from retail_app.balances import get_customer_list
+from retail_app.catalog import get_item_list
+from retail_app.login import get_login_details
+from retail_app.price_cache import get_item_prices_payload
+from retail_app.settings_cache import get_retail_config, get_retail_settings
+
+# Bumped whenever the layout of the bootstrap document changes
+BOOTSTRAP_VERSION = 1
+
+# A section is only told unchanged from its marker once its rows were last
+# modified this many seconds ago, so a row stamped before the marker was
+# read but committed after it cannot go unnoticed
+MARKER_SETTLE_SECONDS = 5 * 60
+
+# Tables whose latest `modified` and, where rows get deleted, row count
+# change whenever a section does
+SECTION_TABLES = {
+    "items": (("tabItem", True), ("tabBin", False), ("tabWarehouse", True)),
+    "customers": (("tabCustomer", True), ("tabRetail Customer Balance", True)),
+}
+
+
+class InvalidKnownHashesError(frappe.ValidationError):
+    pass
+
+
+def get_user_section():
+    details = get_login_details(frappe.session.user)
+    return {
+        "user": frappe.session.user,
+        "full_name": details["full_name"],
+        "dp": details["dp"]
+    }
+
+
+def get_settings_section():
+    return get_retail_settings(no_default_fields=True)
+
+
+def dump(data):
+    return json.dumps(data, default=str, separators=(",", ":")).encode()
+
+
+def digest(payload):
+    return hashlib.sha1(payload).hexdigest()
+
+
+def get_marker(name, *args):
+    """
+    Get a hash of the tables a section is built from, or `None` while they
+    were modified too recently to be trusted.
+    """
+    values = [name, *args]
+    for table, count in SECTION_TABLES[name]:
+        latest, rows = frappe.db.sql("""
+            SELECT MAX(`modified`), {} FROM `{}`
+        """.format("COUNT(*)" if count else "0", table))[0]
+        if latest and get_datetime(latest) > add_to_date(now_datetime(), seconds=-MARKER_SETTLE_SECONDS):
+            return None
+        values += [str(latest), rows]
+
+    return digest(dump(values))
+
+
+def get_sections(known=None, warehouse=None, warehouse_group=None):
+    """
+    Build the serialized payload and hash of every bootstrap section, with a
+    `None` payload for the sections unchanged from their hash in `known`.
+
+    Items and customers are hashed from a marker of their tables when it is
+    settled, so those the terminal holds are not built at all. Lookups
+    shared by several sections, such as the default currency, are made
+    once. Item prices come straight from the price list cache, already
+    serialized, with its ETag as the hash. Sections are built one after
+    the other.
+    """
+    known = known or {}
+    default_currency = get_retail_config().default_currency
+
+    sections = {}
+    for name, build, marker in (
+        ("user", get_user_section, None),
+        ("settings", get_settings_section, None),
+        ("items", lambda: get_item_list(warehouse, warehouse_group)[0], lambda: get_marker("items", warehouse, warehouse_group)),
+        ("customers", lambda: get_customer_list(default_currency), lambda: get_marker("customers", default_currency)),
+    ):
+        section_hash = marker and marker()
+        if section_hash and known.get(name) == section_hash:
+            sections[name] = (None, section_hash)
+            continue
+
+        payload = dump(build())
+        sections[name] = (payload, section_hash or digest(payload))
+
+    sections["item_prices"] = get_item_prices_payload()
+
+    return sections
+
+
+def parse_known(known):
+    """
+    Parse `known`, given as an object or its JSON, checking it maps section
+    names to hashes.
+    """
+    if not known:
+        return {}
+
+    if isinstance(known, str):
+        try:
+            known = json.loads(known)
+        except ValueError:
+            raise InvalidKnownHashesError("known is not valid JSON")
+
+    if not isinstance(known, dict) or not all(isinstance(value, str) for value in known.values()):
+        raise InvalidKnownHashesError("known must be an object mapping section names to hashes")
+
+    return known
+
+
+def build_bootstrap(known=None, warehouse=None, warehouse_group=None):
+    """
+    Build the bootstrap document as JSON bytes.
+
+    `known` maps section names to the hashes the terminal already holds, as
+    an object or its JSON; those sections are sent with their hash only and
+    `"unchanged": true`. Raises `InvalidKnownHashesError` when it does not.
+    """
+    known = parse_known(known)
+    parts = []
+    for name, (payload, section_hash) in get_sections(known, warehouse, warehouse_group).items():
+        header = '"{}":{{"hash":"{}"'.format(name, section_hash).encode()
+        if known.get(name) == section_hash:
+            parts.append(header + b',"unchanged":true}')
+        else:
+            parts.append(header + b',"data":' + payload + b'}')
+
+    return b'{"version":' + str(BOOTSTRAP_VERSION).encode() + b',"sections":{' + b",".join(parts) + b'}}'
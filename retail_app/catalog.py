@@ -0,0 +1,161 @@
+import json
+
+import frappe
+from frappe.utils import flt
+
+
+def get_item_list(warehouse=None, warehouse_group=None, page_length=None, cursor=None):
+    """
+    Get the items after `cursor`, in name order, with their remaining stock.
+
+    Returns the serialized items and the cursor of the next page, which is
+    `None` when unpaged or on the last page.
+    """
+    filters = {}
+    if cursor:
+        filters['name'] = ['>', cursor]
+
+    items = frappe.get_all('Item',
+                           fields=['name', 'item_name', 'stock_uom', 'item_code'],
+                           filters=filters,
+                           order_by='name asc',
+                           limit=int(page_length) if page_length else None)
+
+    # Calculate remaining stock for the whole page in one query
+    item_codes = [item.item_code for item in items] if page_length else None
+    stock = get_item_stock(item_codes, warehouse=warehouse, warehouse_group=warehouse_group)
+
+    item_list = []
+    for item in items:
+        item.remaining_stock = stock.get(item.item_code, 0)
+        item_list.append(serialize_item(item))
+
+    next_cursor = items[-1].name if page_length and len(items) == int(page_length) else None
+
+    return item_list, next_cursor
+
+
+def get_item_list_payload(warehouse=None, warehouse_group=None, page_length=None, cursor=None):
+    """
+    Get the JSON of `get_item_list` and the cursor of the next page.
+    """
+    item_list, next_cursor = get_item_list(warehouse, warehouse_group, page_length, cursor)
+    return json.dumps(item_list), next_cursor
+
+
+def get_item_stock(item_codes=None, warehouse=None, warehouse_group=None):
+    """
+    Get the stock of items, keyed by item code.
+
+    Computed with one grouped query on `tabBin`. Stock is summed over all
+    warehouses unless it is restricted to a single `warehouse` or to the
+    warehouses under `warehouse_group`. Pass `item_codes` to restrict the
+    result to those items.
+    """
+    if item_codes is not None:
+        item_codes = list(item_codes)
+        if not item_codes:
+            return {}
+
+    query, values = get_stock_query(item_codes, warehouse, warehouse_group)
+    rows = frappe.db.sql(query, values)
+
+    return {item_code: flt(qty) for item_code, qty in rows}
+
+
+def get_stock_query(item_codes=None, warehouse=None, warehouse_group=None):
+    """
+    Build the grouped `tabBin` query selecting `item_code` and `actual_qty`.
+
+    Returns the query and its values, so it can be run on its own or joined
+    onto an item query as a derived table.
+    """
+    joins = ""
+    conditions = []
+    values = {}
+    if item_codes is not None:
+        conditions.append("`tabBin`.`item_code` IN %(item_codes)s")
+        values["item_codes"] = item_codes
+
+    if warehouse:
+        conditions.append("`tabBin`.`warehouse` = %(warehouse)s")
+        values["warehouse"] = warehouse
+
+    if warehouse_group:
+        # Warehouses form a nested set, so a group covers every warehouse inside its bounds
+        joins = """
+            INNER JOIN `tabWarehouse` ON `tabWarehouse`.`name` = `tabBin`.`warehouse`
+            INNER JOIN `tabWarehouse` AS `parent_warehouse` ON `parent_warehouse`.`name` = %(warehouse_group)s
+        """
+        conditions.append("`tabWarehouse`.`lft` >= `parent_warehouse`.`lft`")
+        conditions.append("`tabWarehouse`.`rgt` <= `parent_warehouse`.`rgt`")
+        values["warehouse_group"] = warehouse_group
+
+    query = """
+        SELECT `tabBin`.`item_code`, SUM(`tabBin`.`actual_qty`) AS actual_qty
+        FROM `tabBin`
+        {joins}
+        {conditions}
+        GROUP BY `tabBin`.`item_code`
+    """.format(
+        joins=joins,
+        conditions="WHERE " + " AND ".join(conditions) if conditions else ""
+    )
+
+    return query, values
+
+
+def get_items_query(warehouse=None, warehouse_group=None, cursor=None):
+    """
+    Build a single query returning every item with its remaining stock, in
+    item name order, starting after `cursor` if given.
+    """
+    stock_query, values = get_stock_query(warehouse=warehouse, warehouse_group=warehouse_group)
+    conditions = ""
+    if cursor:
+        conditions = "WHERE `tabItem`.`name` > %(cursor)s"
+        values["cursor"] = cursor
+
+    query = """
+        SELECT `tabItem`.`item_name`, `tabItem`.`item_code`, `tabItem`.`stock_uom`,
+            IFNULL(`stock`.`actual_qty`, 0) AS remaining_stock
+        FROM `tabItem`
+        LEFT JOIN ({stock_query}) AS `stock` ON `stock`.`item_code` = `tabItem`.`name`
+        {conditions}
+        ORDER BY `tabItem`.`name`
+    """.format(stock_query=stock_query, conditions=conditions)
+
+    return query, values
+
+
+def get_item_prices_query():
+    """
+    Build a single query returning the item prices of every selling price list.
+    """
+    query = """
+        SELECT `tabItem Price`.`item_code`, `tabItem Price`.`name`, `tabItem Price`.`uom`,
+            `tabItem Price`.`price_list_rate`
+        FROM `tabItem Price`
+        INNER JOIN `tabPrice List` ON `tabPrice List`.`name` = `tabItem Price`.`price_list`
+        WHERE `tabPrice List`.`selling` = 1
+        ORDER BY `tabItem Price`.`price_list`, `tabItem Price`.`name`
+    """
+
+    return query, {}
+
+
+def serialize_item(item):
+    return {
+        "item_name": item.item_name,
+        "item_code": item.item_code,
+        "remaining_stock": "{} {}".format(item.remaining_stock or 0, item.stock_uom),
+    }
+
+
+def serialize_item_price(price):
+    return {
+        "item_code": price.item_code,
+        "name": price.name,
+        "uom": price.uom,
+        "price": price.price_list_rate
+    }
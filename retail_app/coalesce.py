@@ -0,0 +1,112 @@
+import hashlib
+import json
+import pickle
+import time
+
+import frappe
+from redis.exceptions import LockError
+
+from retail_app.utils import redis_call
+
+RESULT_KEY = "retail_app:coalesce:result:{}"
+LOCK_KEY = "retail_app:coalesce:lock:{}"
+STATS_KEY = "retail_app:coalesce:stats"
+
+# Seconds a computed result is shared with later callers
+RESULT_TTL = 5
+
+# Seconds a caller waits for another worker's computation before running
+# it itself
+WAIT_TIMEOUT = 30
+
+# Seconds between checks for the result while waiting
+POLL_INTERVAL = 0.025
+
+# Seconds the computing worker holds its lock; longer than the slowest
+# computation, so the lock never expires while the result is being built
+LOCK_TIMEOUT = 5 * 60
+
+
+def get_flight_key(name, *args):
+    """
+    Build the key under which calls of `name` with the same arguments share
+    their result.
+    """
+    digest = hashlib.sha1(json.dumps(args, default=str).encode()).hexdigest()
+    return "{}:{}".format(name, digest)
+
+
+def single_flight(name, compute, *args, ttl=RESULT_TTL):
+    """
+    Get the result of `compute(*args)`, computing it at most once across
+    workers for concurrent calls with the same arguments.
+
+    The first caller computes under a Redis lock and shares its result for
+    `ttl` seconds; callers arriving meanwhile wait for it instead of running
+    the same queries. If the computing worker fails, a waiting caller takes
+    over. The result must be picklable.
+
+    Set `retail_disable_coalescing` in the site config to compute every call.
+    """
+    if frappe.conf.get("retail_disable_coalescing"):
+        return compute(*args)
+
+    cache = frappe.cache()
+    flight_key = get_flight_key(name, *args)
+    result_key = cache.make_key(RESULT_KEY.format(flight_key))
+    lock_key = cache.make_key(LOCK_KEY.format(flight_key))
+
+    deadline = time.monotonic() + WAIT_TIMEOUT
+    waited = False
+    while True:
+        cached = cache.get(result_key)
+        if cached is not None:
+            increment(name, "waited" if waited else "shared")
+            return pickle.loads(cached)
+
+        lock = cache.lock(lock_key, timeout=LOCK_TIMEOUT)
+        if lock.acquire(blocking=False):
+            try:
+                result = compute(*args)
+                cache.set(result_key, pickle.dumps(result), ex=ttl)
+            finally:
+                release(lock)
+            increment(name, "computed")
+            return result
+
+        if time.monotonic() > deadline:
+            break
+
+        waited = True
+        time.sleep(POLL_INTERVAL)
+
+    increment(name, "timed_out")
+    return compute(*args)
+
+
+def release(lock):
+    # A computation outliving the lock has already shared its result, so
+    # losing the lock must not fail the call
+    try:
+        lock.release()
+    except LockError:
+        pass
+
+
+def increment(name, outcome):
+    cache = frappe.cache()
+    cache.hincrby(cache.make_key(STATS_KEY), "{}|{}".format(name, outcome), 1)
+
+
+def get_coalesce_stats():
+    """
+    Get how many calls of each coalesced endpoint computed their result,
+    reused a shared one (`shared`, or `waited` when it was still being
+    computed) or gave up waiting (`timed_out`).
+    """
+    stats = {}
+    for field, value in redis_call("hgetall", frappe.cache().make_key(STATS_KEY)).items():
+        name, outcome = frappe.safe_decode(field).rsplit("|", 1)
+        stats.setdefault(name, {"computed": 0, "shared": 0, "waited": 0, "timed_out": 0})[outcome] = int(value)
+
+    return stats
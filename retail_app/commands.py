@@ -0,0 +1,83 @@
+import click
+from frappe.commands import get_site, pass_context
+
+
+@click.command("rebuild-customer-balances")
+@click.option("--batch-size", default=1000, type=int, help="Number of customers reconciled per transaction")
+@pass_context
+def rebuild_customer_balances(context, batch_size):
+    "Rebuild the Retail Customer Balance table from the GL Entry ledger"
+    import frappe
+    from retail_app.balances import rebuild_customer_balances
+
+    site = get_site(context)
+    frappe.init(site=site)
+    frappe.connect()
+    try:
+        processed = rebuild_customer_balances(batch_size=batch_size)
+        click.echo(f"Rebuilt balances for {processed} customers")
+    finally:
+        frappe.destroy()
+
+
+@click.command("run-retail-benchmark")
+@click.option("--scales", default="1000,10000,50000", help="Comma-separated dataset sizes, in customers and items")
+@click.option("--samples", default=20, type=int, help="Number of timed calls per endpoint and scale")
+@click.option("--warehouses", default=3, type=int, help="Number of warehouses the synthetic bins are spread over")
+@click.option("--customer", help="Existing customer to post benchmark invoices for")
+@click.option("--item-code", help="Existing stock item to post benchmark invoices for")
+@click.option("--warehouse", help="Warehouse holding stock of the benchmark item")
+@click.option("--output", type=click.Path(dir_okay=False, writable=True), help="Write the JSON report to this file")
+@pass_context
+def run_retail_benchmark(context, scales, samples, warehouses, customer, item_code, warehouse, output):
+    "Benchmark the retail APIs on synthetic datasets and report the results as JSON"
+    import json
+
+    import frappe
+    from retail_app.benchmark.suite import run
+
+    site = get_site(context)
+    frappe.init(site=site)
+    frappe.connect()
+    try:
+        report = run(scales=[int(scale) for scale in scales.split(",")],
+                     samples=samples,
+                     warehouse_count=warehouses,
+                     customer=customer,
+                     item_code=item_code,
+                     warehouse=warehouse)
+        report = json.dumps(report, indent=2, default=str)
+        if output:
+            with open(output, "w") as f:
+                f.write(report)
+            click.echo(f"Benchmark report written to {output}")
+        else:
+            click.echo(report)
+    finally:
+        frappe.destroy()
+
+
+@click.command("rebuild-sales-summary")
+@click.option("--from-date", help="First posting date to rebuild (YYYY-MM-DD)")
+@click.option("--to-date", help="Last posting date to rebuild (YYYY-MM-DD)")
+@pass_context
+def rebuild_sales_summary(context, from_date, to_date):
+    "Rebuild the Retail Sales Summary table from submitted Sales Invoices"
+    import frappe
+    from retail_app.sales_summary import rebuild_sales_summary
+
+    site = get_site(context)
+    frappe.init(site=site)
+    frappe.connect()
+    try:
+        days = rebuild_sales_summary(from_date=from_date, to_date=to_date)
+        click.echo(f"Rebuilt sales summary for {days} days")
+    finally:
+        frappe.destroy()
+
+
+commands = [
+    rebuild_customer_balances,
+    rebuild_sales_summary,
+    run_retail_benchmark,
+]
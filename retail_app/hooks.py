@@ -7,18 +7,108 @@ app_license = "mit"
 
 doc_events = {
     "Retail Settings": {
-        "on_update": "retail_app.api.update_settings"
+        "on_update": "retail_app.settings_cache.clear_retail_config"
+    },
+    "Global Defaults": {
+        "on_update": "retail_app.settings_cache.clear_retail_config"
+    },
+    "Payment Terms Template": {
+        "after_insert": "retail_app.settings_cache.clear_retail_config",
+        "after_rename": "retail_app.settings_cache.clear_retail_config",
+        "on_trash": "retail_app.settings_cache.clear_retail_config"
+    },
+    "User": {
+        "on_update": "retail_app.login.clear_login_cache",
+        "on_trash": "retail_app.login.clear_login_cache"
+    },
+    "GL Entry": {
+        "after_insert": "retail_app.balances.on_gl_entry_insert"
+    },
+    "Item": {
+        "on_update": [
+            "retail_app.snapshots.request_snapshot_update",
+            "retail_app.item_search.on_item_change"
+        ],
+        "on_trash": [
+            "retail_app.snapshots.request_snapshot_update",
+            "retail_app.item_search.on_item_change"
+        ],
+        "after_rename": "retail_app.item_search.on_item_rename"
+    },
+    "Item Price": {
+        "on_update": [
+            "retail_app.price_cache.on_item_price_change",
+            "retail_app.snapshots.request_snapshot_update"
+        ],
+        "on_trash": [
+            "retail_app.price_cache.on_item_price_change",
+            "retail_app.snapshots.request_snapshot_update"
+        ]
+    },
+    "Price List": {
+        "on_update": [
+            "retail_app.price_cache.on_price_list_change",
+            "retail_app.snapshots.request_snapshot_update"
+        ],
+        "on_trash": [
+            "retail_app.price_cache.on_price_list_change",
+            "retail_app.snapshots.request_snapshot_update"
+        ]
+    },
+    "Sales Invoice": {
+        "on_submit": [
+            "retail_app.sales_summary.on_sales_invoice_submit",
+            "retail_app.stock_reservations.on_sales_invoice_submit"
+        ],
+        "on_cancel": [
+            "retail_app.sales_summary.on_sales_invoice_cancel"
+        ]
+    },
+    "Stock Ledger Entry": {
+        "on_submit": "retail_app.snapshots.request_snapshot_update",
+        "after_insert": "retail_app.stock_reservations.on_stock_ledger_entry"
+    }
+}
+
+scheduler_events = {
+    "daily": [
+        "retail_app.item_search.rebuild_item_search_index"
+    ],
+    "weekly_long": [
+        "retail_app.balances.reconcile_customer_balances"
+    ],
+    "cron": {
+        "*/5 * * * *": [
+            "retail_app.stock_reservations.reconcile_stock_reservations"
+        ],
+        "*/10 * * * *": [
+            "retail_app.snapshots.update_snapshots"
+        ]
     }
 }
 
 
 override_whitelisted_methods = {
+    "retail_app.api.refresh_login": "retail_app.api.refresh_login",
+    "retail_app.api.bootstrap": "retail_app.api.bootstrap",
     "retail_app.api.get_customers": "retail_app.api.get_customers",
+    "retail_app.api.sync_customers": "retail_app.api.sync_customers",
     "retail_app.api.get_items": "retail_app.api.get_items",
+    "retail_app.api.search_items": "retail_app.api.search_items",
+    "retail_app.api.sync_catalog": "retail_app.api.sync_catalog",
+    "retail_app.api.get_catalog_manifest": "retail_app.api.get_catalog_manifest",
     "retail_app.api.create_sales_invoice": "retail_app.api.create_sales_invoice",
+    "retail_app.api.create_sales_invoices": "retail_app.api.create_sales_invoices",
+    "retail_app.api.quote_carts": "retail_app.api.quote_carts",
+    "retail_app.api.queue_sales_invoice": "retail_app.api.queue_sales_invoice",
+    "retail_app.api.get_sales_invoice_status": "retail_app.api.get_sales_invoice_status",
     "retail_app.api.get_sales_invoices": "retail_app.api.get_sales_invoices",
+    "retail_app.api.get_sales_summary": "retail_app.api.get_sales_summary",
     "retail_app.api.get_customers_with_balances": "retail_app.api.get_customers_with_balances",
     "retail_app.api.make_customer_payment_entry": "retail_app.api.make_customer_payment_entry",
+    "retail_app.api.make_customer_payment_entries": "retail_app.api.make_customer_payment_entries",
+    "retail_app.api.get_metrics": "retail_app.api.get_metrics",
+    "retail_app.api.get_recent_api_calls": "retail_app.api.get_recent_api_calls",
 }
 # required_apps = []
 
@@ -84,7 +174,7 @@ override_whitelisted_methods = {
 # ------------
 
 # before_install = "retail_app.install.before_install"
-# after_install = "retail_app.install.after_install"
+after_install = "retail_app.balances.rebuild_customer_balances"
 
 # Uninstallation
 # ------------
@@ -0,0 +1,217 @@
+import functools
+import inspect
+import json
+import random
+import threading
+import time
+import tracemalloc
+
+import frappe
+from frappe.utils import cint, now
+from werkzeug import Response
+
+from retail_app.settings_cache import get_retail_settings
+from retail_app.utils import capture_queries, redis_call
+
+CALLS_KEY = "retail_app:metrics:calls"
+SLOW_CALLS_KEY = "retail_app:metrics:slow_calls"
+TOTALS_KEY = "retail_app:metrics:totals"
+
+# Number of recent calls, and of recent slow calls, kept in Redis
+CALLS_BUFFER_SIZE = 1000
+SLOW_CALLS_BUFFER_SIZE = 100
+
+# Counters exported for each method, with their Prometheus help text
+METRICS = (
+    ("calls", "retail_api_calls_total", "Number of calls"),
+    ("seconds", "retail_api_call_seconds_total", "Wall time spent in calls"),
+    ("queries", "retail_api_queries_total", "SQL queries run by calls"),
+    ("query_seconds", "retail_api_query_seconds_total", "Time spent in SQL queries"),
+    ("rows", "retail_api_rows_total", "Rows returned or affected by SQL queries"),
+    ("bytes", "retail_api_response_bytes_total", "Response bytes, where known before sending"),
+    ("errors", "retail_api_errors_total", "Calls that raised an exception"),
+    ("slow", "retail_api_slow_calls_total", "Calls slower than the configured threshold"),
+)
+
+# Calls of this process tracing memory, and whether tracing was started by
+# them rather than by something else, such as a profiler
+_memory_lock = threading.Lock()
+_memory_tracing = {"calls": 0, "started": False}
+
+
+def get_instrumentation_settings():
+    """
+    Get whether instrumentation is on, the slow call threshold in seconds
+    and the memory sample rate.
+
+    Read from the settings cache, so toggling it takes effect on the next
+    call without a restart.
+    """
+    settings = get_retail_settings()
+    return (cint(settings.get("enable_instrumentation")), cint(settings.get("slow_call_threshold_ms")) / 1000,
+        cint(settings.get("memory_sample_rate")))
+
+
+def start_memory_trace():
+    """
+    Start tracing memory for a call, unless calls on other threads already
+    did.
+    """
+    with _memory_lock:
+        if not _memory_tracing["calls"] and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _memory_tracing["started"] = True
+        _memory_tracing["calls"] += 1
+
+
+def stop_memory_trace():
+    """
+    Get the peak memory traced, stopping tracing once the last call tracing
+    it is done. The peak is the process's, so it includes concurrent calls.
+    """
+    with _memory_lock:
+        peak = tracemalloc.get_traced_memory()[1]
+        _memory_tracing["calls"] -= 1
+        if not _memory_tracing["calls"] and _memory_tracing["started"]:
+            tracemalloc.stop()
+            _memory_tracing["started"] = False
+
+    return peak
+
+
+def instrument(fn):
+    """
+    Record wall time, SQL queries, rows and response size of every call to a
+    whitelisted method, when enabled in Retail Settings, and the peak memory
+    of a sample of the calls.
+
+    Apply it below `@frappe.whitelist()`.
+    """
+    # Frappe passes every form field to a method taking `**kwargs`, so only
+    # forward the arguments the wrapped method accepts
+    parameters = inspect.signature(fn).parameters
+    accepts_any = any(parameter.kind == parameter.VAR_KEYWORD for parameter in parameters.values())
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not accepts_any:
+            kwargs = {key: value for key, value in kwargs.items() if key in parameters}
+
+        enabled, slow_threshold, memory_sample_rate = get_instrumentation_settings()
+        if not enabled:
+            return fn(*args, **kwargs)
+
+        trace_memory = memory_sample_rate > 0 and random.randrange(memory_sample_rate) == 0
+        if trace_memory:
+            start_memory_trace()
+
+        error = None
+        result = None
+        queries = []
+        start = time.perf_counter()
+        try:
+            with capture_queries() as queries:
+                result = fn(*args, **kwargs)
+            return result
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            peak = None
+            if trace_memory:
+                peak = stop_memory_trace()
+
+            try:
+                record_call(fn.__name__, elapsed, queries, get_response_size(result), peak, error, slow_threshold)
+            except Exception:
+                # Metrics must never break the call they observe
+                frappe.log_error(frappe.get_traceback(), 'Retail Instrumentation Error')
+
+    return wrapper
+
+
+def get_response_size(result):
+    """
+    Get the size in bytes of a method's response, or `None` for streamed
+    responses whose size is only known once sent.
+    """
+    if isinstance(result, Response):
+        if result.is_streamed:
+            return None
+        return result.content_length if result.content_length is not None else len(result.get_data())
+
+    if result is None:
+        return 0
+
+    return len(frappe.as_json(result, indent=None))
+
+
+def record_call(method, elapsed, queries, response_bytes, peak_memory, error, slow_threshold):
+    """
+    Add a call to the ring buffer and to the per-method totals in Redis.
+    """
+    query_seconds = sum(query.duration for query in queries)
+    slow = bool(slow_threshold) and elapsed >= slow_threshold
+    call = {
+        "method": method,
+        "timestamp": now(),
+        "user": frappe.session.user,
+        "seconds": round(elapsed, 6),
+        "queries": len(queries),
+        "query_seconds": round(query_seconds, 6),
+        "rows": sum(query.rows for query in queries),
+        "response_bytes": response_bytes,
+        "peak_memory_bytes": peak_memory,
+        "error": str(error) if error else None,
+        "slow": slow
+    }
+
+    cache = frappe.cache()
+    pipeline = cache.pipeline()
+    pipeline.lpush(cache.make_key(CALLS_KEY), json.dumps(call))
+    pipeline.ltrim(cache.make_key(CALLS_KEY), 0, CALLS_BUFFER_SIZE - 1)
+
+    if slow:
+        call["trace"] = [{"query": query.query, "seconds": round(query.duration, 6)} for query in queries]
+        pipeline.lpush(cache.make_key(SLOW_CALLS_KEY), json.dumps(call))
+        pipeline.ltrim(cache.make_key(SLOW_CALLS_KEY), 0, SLOW_CALLS_BUFFER_SIZE - 1)
+
+    totals_key = cache.make_key(TOTALS_KEY)
+    pipeline.hincrby(totals_key, f"{method}|calls", 1)
+    pipeline.hincrbyfloat(totals_key, f"{method}|seconds", elapsed)
+    pipeline.hincrby(totals_key, f"{method}|queries", len(queries))
+    pipeline.hincrbyfloat(totals_key, f"{method}|query_seconds", query_seconds)
+    pipeline.hincrby(totals_key, f"{method}|rows", call["rows"])
+    pipeline.hincrby(totals_key, f"{method}|bytes", response_bytes or 0)
+    pipeline.hincrby(totals_key, f"{method}|errors", 1 if error else 0)
+    pipeline.hincrby(totals_key, f"{method}|slow", 1 if slow else 0)
+    pipeline.execute()
+
+
+def get_recent_calls(slow=False, limit=100):
+    """
+    Get the most recent calls, or the most recent slow calls with their SQL
+    trace, newest first.
+    """
+    key = frappe.cache().make_key(SLOW_CALLS_KEY if slow else CALLS_KEY)
+    return [json.loads(call) for call in redis_call("lrange", key, 0, int(limit) - 1)]
+
+
+def get_prometheus_metrics():
+    """
+    Render the per-method totals in the Prometheus text exposition format.
+    """
+    totals = {}
+    for field, value in redis_call("hgetall", frappe.cache().make_key(TOTALS_KEY)).items():
+        method, metric = frappe.safe_decode(field).rsplit("|", 1)
+        totals.setdefault(metric, {})[method] = frappe.safe_decode(value)
+
+    lines = []
+    for metric, name, help_text in METRICS:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} counter")
+        for method, value in sorted(totals.get(metric, {}).items()):
+            lines.append(f'{name}{{method="{method}"}} {value}')
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,294 @@
+import frappe
+
+from retail_app.settings_cache import get_retail_config
+from retail_app.stock_reservations import release_reservation, reserve_invoice_stock
+from retail_app.utils import rollback_to_savepoint, set_savepoint
+
+
+class InvoiceInProgressError(frappe.ValidationError):
+    pass
+
+
+class InvoiceFailedError(frappe.ValidationError):
+    pass
+
+
+def prefetch_invoice_lookups(invoices):
+    """
+    Load the records shared by a batch of invoices in a fixed number of
+    queries: customers with their payment terms, items and price lists. The
+    default payment terms come from the settings cache.
+    """
+    customers = {invoice.get('customer') for invoice in invoices if invoice.get('customer')}
+    item_codes = {
+        item.get('item_code')
+        for invoice in invoices
+        for item in invoice.get('items') or []
+        if item.get('item_code')
+    }
+    price_lists = {invoice.get('selling_price_list') for invoice in invoices if invoice.get('selling_price_list')}
+
+    return frappe._dict(
+        customers=dict(frappe.get_all('Customer',
+                                      filters={'name': ['in', list(customers)]},
+                                      fields=['name', 'payment_terms'],
+                                      as_list=True)) if customers else {},
+        items=set(frappe.get_all('Item', filters={'name': ['in', list(item_codes)]}, pluck='name')) if item_codes else set(),
+        price_lists=set(frappe.get_all('Price List', filters={'name': ['in', list(price_lists)]}, pluck='name')) if price_lists else set(),
+        default_payment_terms=get_retail_config().default_payment_terms
+    )
+
+
+def prepare_invoice(invoice_data, lookups):
+    """
+    Validate an invoice payload against the prefetched lookups and fill in
+    the defaults the POS relies on.
+
+    Returns an error message, or `None` when the invoice can be inserted.
+    """
+    invoice_data['doctype'] = 'Sales Invoice'
+    invoice_data['update_stock'] = 1
+
+    if invoice_data.get('customer') not in lookups.customers:
+        return f"Customer {invoice_data.get('customer')} not found"
+
+    for item in invoice_data.get('items') or []:
+        if item.get('item_code') not in lookups.items:
+            return f"Item {item.get('item_code')} not found"
+
+    if invoice_data.get('selling_price_list') and invoice_data['selling_price_list'] not in lookups.price_lists:
+        return f"Price List {invoice_data['selling_price_list']} not found"
+
+    # Check if payment_terms_template is provided, if not set a default
+    if 'payment_terms_template' not in invoice_data:
+        payment_terms = lookups.customers[invoice_data['customer']]
+        if payment_terms:
+            invoice_data['payment_terms_template'] = payment_terms
+        else:
+            # Set a default payment terms template if not set for the customer
+            if not lookups.default_payment_terms:
+                return "Payment Terms Template 'Standard' does not exist. Please create it."
+
+            invoice_data['payment_terms_template'] = lookups.default_payment_terms
+
+
+def pop_idempotency_key(invoice_data):
+    """
+    Take the client idempotency key off an invoice payload, falling back to
+    the `Idempotency-Key` request header.
+    """
+    return invoice_data.pop('idempotency_key', None) or frappe.get_request_header('Idempotency-Key')
+
+
+def claim_idempotency_key(idempotency_key):
+    """
+    Claim `idempotency_key` for the invoice about to be created.
+
+    Returns the name of the invoice already created for the key, or `None`
+    once the key is claimed. The claim is a row inserted in the current
+    transaction, so a concurrent request with the same key blocks on its
+    unique index until this transaction commits (and then finds the
+    invoice) or rolls back (and then claims the key itself).
+
+    Raises `InvoiceFailedError` when the queued invoice of the key failed
+    to submit, as its draft will never be submitted; the terminal has to
+    send it again under a new key.
+    """
+    sales_invoice = get_claimed_invoice(idempotency_key)
+    if sales_invoice:
+        return sales_invoice
+
+    try:
+        frappe.get_doc({
+            "doctype": "Retail Invoice Request",
+            "idempotency_key": idempotency_key
+        }).insert(ignore_permissions=True)
+    except frappe.DuplicateEntryError:
+        # A locking read sees the row committed by the other request
+        sales_invoice = get_claimed_invoice(idempotency_key, for_update=True)
+        if not sales_invoice:
+            raise InvoiceInProgressError(f"Sales Invoice for key {idempotency_key} is still being processed")
+        return sales_invoice
+    except frappe.QueryTimeoutError:
+        raise InvoiceInProgressError(f"Sales Invoice for key {idempotency_key} is still being processed")
+
+
+def get_claimed_invoice(idempotency_key, for_update=False):
+    request = frappe.db.get_value('Retail Invoice Request', idempotency_key, ['sales_invoice', 'status', 'error'],
+                                  as_dict=True, for_update=for_update)
+    if request and request.status == 'Failed':
+        raise InvoiceFailedError(f"Sales Invoice {request.sales_invoice} for key {idempotency_key} failed: {request.error}")
+
+    return request.sales_invoice if request else None
+
+
+def record_idempotency_key(idempotency_key, sales_invoice, status="Submitted"):
+    """
+    Link a claimed idempotency key to the invoice created for it.
+    """
+    frappe.db.set_value('Retail Invoice Request', idempotency_key, {
+        'sales_invoice': sales_invoice,
+        'status': status
+    })
+
+
+def get_submit_queue():
+    """
+    Get the background queue that submits queued invoices.
+
+    Falls back to the default queue when the configured one has no workers
+    set up in `common_site_config.json`.
+    """
+    from frappe.utils.background_jobs import get_queues_timeout
+
+    queue = get_retail_config().invoice_submit_queue
+    return queue if queue in get_queues_timeout() else 'default'
+
+
+def queue_invoice(invoice_data, ticket):
+    """
+    Save an invoice as a draft and enqueue its submission.
+
+    `ticket` is the idempotency key the terminal polls the status with. Returns
+    the name of the draft, or of the invoice already created for the ticket.
+    """
+    existing = claim_idempotency_key(ticket)
+    if existing:
+        return existing
+
+    sales_invoice = frappe.get_doc(invoice_data)
+    sales_invoice.insert()
+    # The stock stays reserved until the background job submits the draft
+    reserve_invoice_stock(sales_invoice)
+    record_idempotency_key(ticket, sales_invoice.name, status="Queued")
+
+    frappe.enqueue('retail_app.invoices.submit_queued_invoice',
+                   queue=get_submit_queue(),
+                   enqueue_after_commit=True,
+                   ticket=ticket)
+
+    return sales_invoice.name
+
+
+def submit_queued_invoice(ticket):
+    """
+    Background job submitting the draft invoice of a queued ticket.
+    """
+    request = frappe.db.get_value('Retail Invoice Request', ticket, ['sales_invoice', 'status'], as_dict=True, for_update=True)
+    if not request or request.status != 'Queued':
+        return
+
+    try:
+        frappe.get_doc('Sales Invoice', request.sales_invoice).submit()
+        frappe.db.set_value('Retail Invoice Request', ticket, 'status', 'Submitted')
+    except Exception as e:
+        frappe.db.rollback()
+        release_reservation(request.sales_invoice)
+        frappe.log_error(frappe.get_traceback(), 'Sales Invoice Submission Error')
+        frappe.db.set_value('Retail Invoice Request', ticket, {
+            'status': 'Failed',
+            'error': str(e)
+        })
+
+
+def get_invoice_status(ticket):
+    """
+    Get the status of a ticket returned by `queue_invoice`.
+    """
+    return frappe.db.get_value('Retail Invoice Request', ticket, ['sales_invoice', 'status', 'error'], as_dict=True)
+
+
+def insert_invoices(invoices, commit=True):
+    """
+    Validate, insert and submit a batch of invoice payloads.
+
+    Every invoice is validated before any is inserted. Valid invoices are
+    then inserted and submitted one transaction each: submitting locks the
+    customer's balance row and the bins of the invoice's items, and
+    committing per invoice releases them before the next one instead of
+    holding them for the whole batch. A failing invoice is rolled back to
+    its savepoint.
+
+    Invoices may carry an `idempotency_key`; one whose key was already
+    processed is reported with the original invoice instead of being
+    created again.
+
+    Returns one result per invoice, in the order they were given.
+    """
+    lookups = prefetch_invoice_lookups(invoices)
+    results = []
+    pending = []
+    for index, invoice_data in enumerate(invoices):
+        error = prepare_invoice(invoice_data, lookups)
+        if error:
+            results.append({"index": index, "status": "failed", "error": error})
+        else:
+            results.append(None)
+            pending.append(index)
+
+    for index in pending:
+        results[index] = submit_invoice(index, invoices[index])
+        if commit:
+            frappe.db.commit()
+
+    return results
+
+
+def submit_invoice(index, invoice_data):
+    """
+    Insert and submit one invoice of a batch inside its own savepoint.
+    """
+    idempotency_key = invoice_data.pop('idempotency_key', None)
+    savepoint = f"retail_invoice_{index}"
+    sales_invoice = None
+    after_commit = set_savepoint(savepoint)
+    try:
+        if idempotency_key:
+            existing = claim_idempotency_key(idempotency_key)
+            if existing:
+                return {"index": index, "status": "success", "invoice_name": existing, "duplicate": True}
+
+        sales_invoice = frappe.get_doc(invoice_data)
+        sales_invoice.insert()
+        reserve_invoice_stock(sales_invoice)
+        sales_invoice.submit()
+
+        if idempotency_key:
+            record_idempotency_key(idempotency_key, sales_invoice.name)
+    except Exception as e:
+        # Drops the commit callbacks of the submission, e.g. applying its
+        # stock ledger entries to the counters; rolling back to a savepoint
+        # does not run the rollback callbacks, so the reservation is given
+        # back here
+        rollback_to_savepoint(savepoint, after_commit)
+        if sales_invoice and sales_invoice.name:
+            release_reservation(sales_invoice.name)
+        frappe.log_error(frappe.get_traceback(), 'Sales Invoice Creation Error')
+        return {"index": index, "status": "failed", "error": str(e)}
+
+    return {"index": index, "status": "success", "invoice_name": sales_invoice.name}
+
+
+def get_invoice_items(invoice_names):
+    """
+    Get the line items of several invoices in one query, keyed by invoice.
+    """
+    if not invoice_names:
+        return {}
+
+    rows = frappe.get_all('Sales Invoice Item',
+                          filters={'parenttype': 'Sales Invoice', 'parent': ['in', invoice_names]},
+                          fields=['parent', 'item_code', 'item_name', 'qty', 'rate', 'uom'],
+                          order_by='parent asc, idx asc')
+
+    items = {}
+    for row in rows:
+        items.setdefault(row.parent, []).append({
+            "item_code": row.item_code,
+            "item_name": row.item_name,
+            "qty": row.qty,
+            "rate": row.rate,
+            "uom": row.uom
+        })
+
+    return items
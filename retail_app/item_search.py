@@ -0,0 +1,351 @@
+import bisect
+import json
+import uuid
+from array import array
+
+import frappe
+
+from retail_app.catalog import get_item_stock, serialize_item
+from retail_app.utils import redis_call
+
+GENERATION_KEY = "retail_app:item_search:generation"
+SNAPSHOT_KEY = "retail_app:item_search:snapshot:{}"
+LOG_KEY = "retail_app:item_search:log:{}"
+LOCK_KEY = "retail_app:item_search:lock"
+
+# Item changes logged since the last snapshot before a rebuild is queued
+LOG_COMPACT_THRESHOLD = 5000
+
+# Seconds an unused snapshot or change log is kept in Redis
+SNAPSHOT_TTL = 7 * 24 * 60 * 60
+
+# Items containing the query ranked per search; broader queries rank the
+# first matches found, keeping their cost bounded
+MATCH_LIMIT = 1000
+
+# Indexes loaded by this process, keyed by site
+_indexes = {}
+
+
+def normalize(text):
+    return " ".join((text or "").lower().split())
+
+
+def get_trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class ItemIndex:
+    """
+    In-process search index over the items of a site.
+
+    Items are numbered in the order they are added; a changed item is added
+    again under a new number and its old one is left dead, so the posting
+    arrays of the trigram index only ever grow at the end and stay sorted.
+    """
+
+    def __init__(self, generation, records):
+        self.generation = generation
+        self.position = 0
+        self.items = []
+        self.ids = {}
+        self.codes = {}
+        self.barcodes = {}
+        self.names = []
+        self.trigrams = {}
+
+        postings = {}
+        for record in records:
+            self.add(record, postings)
+        self.trigrams = {trigram: array("i", ids) for trigram, ids in postings.items()}
+        self.names.sort()
+
+    def add(self, record, postings=None):
+        item_id = len(self.items)
+        name = normalize(record["item_name"])
+        self.items.append(frappe._dict(
+            item_code=record["item_code"],
+            item_name=record["item_name"],
+            stock_uom=record["stock_uom"],
+            barcodes=record["barcodes"],
+            search_name=name
+        ))
+        self.ids[record["item_code"]] = item_id
+        self.codes[record["item_code"].lower()] = item_id
+        for barcode in record["barcodes"]:
+            self.barcodes[barcode] = item_id
+
+        if postings is not None:
+            # Bulk load: postings are lists, and names are sorted once at the end
+            self.names.append((name, item_id))
+            for trigram in get_trigrams(name):
+                postings.setdefault(trigram, []).append(item_id)
+        else:
+            bisect.insort(self.names, (name, item_id))
+            for trigram in get_trigrams(name):
+                self.trigrams.setdefault(trigram, array("i")).append(item_id)
+
+    def remove(self, item_code):
+        item_id = self.ids.pop(item_code, None)
+        if item_id is None:
+            return
+
+        item = self.items[item_id]
+        self.items[item_id] = None
+        if self.codes.get(item_code.lower()) == item_id:
+            del self.codes[item_code.lower()]
+        for barcode in item.barcodes:
+            if self.barcodes.get(barcode) == item_id:
+                del self.barcodes[barcode]
+
+    def apply(self, change):
+        self.remove(change["item_code"])
+        if not change.get("deleted"):
+            self.add(change)
+
+    def lookup(self, query):
+        """
+        Get the item whose barcode or item code is exactly `query`.
+        """
+        item_id = self.barcodes.get(query)
+        if item_id is None:
+            item_id = self.codes.get(query.lower())
+
+        return item_id
+
+    def search(self, query, limit=20):
+        """
+        Get the items matching `query`, best matches first: an exact
+        barcode or item code, then names starting with the query in
+        alphabetical order, then names with a word starting with it and names
+        containing it, shortest first.
+        """
+        query = query.strip()
+        name = normalize(query)
+        if not name:
+            return []
+
+        exact = self.lookup(query)
+        ranked = [exact] if exact is not None else []
+        ranked += [item_id for item_id in self.prefix_matches(name, limit + 1) if item_id != exact]
+
+        if len(ranked) < limit and len(name) >= 3:
+            seen = set(ranked)
+            matches = [item_id for item_id in self.trigram_matches(name, MATCH_LIMIT) if item_id not in seen]
+            ranked += sorted(matches, key=lambda item_id: self.rank(item_id, name))
+
+        return [self.items[item_id] for item_id in ranked[:limit]]
+
+    def prefix_matches(self, name, limit):
+        matches = []
+        index = bisect.bisect_left(self.names, (name, -1))
+        while index < len(self.names) and len(matches) < limit:
+            indexed_name, item_id = self.names[index]
+            if not indexed_name.startswith(name):
+                break
+            if self.items[item_id] is not None:
+                matches.append(item_id)
+            index += 1
+
+        return matches
+
+    def trigram_matches(self, name, limit):
+        """
+        Get up to `limit` items whose name contains `name`, checking the
+        items with its rarest trigram against the postings of the others.
+        """
+        postings = []
+        for trigram in get_trigrams(name):
+            posting = self.trigrams.get(trigram)
+            if not posting:
+                return []
+            postings.append(posting)
+        postings.sort(key=len)
+
+        matches = []
+        for item_id in postings[0]:
+            if self.items[item_id] is None:
+                continue
+            for posting in postings[1:]:
+                index = bisect.bisect_left(posting, item_id)
+                if index == len(posting) or posting[index] != item_id:
+                    break
+            else:
+                if name in self.items[item_id].search_name:
+                    matches.append(item_id)
+                    if len(matches) == limit:
+                        break
+
+        return matches
+
+    def rank(self, item_id, name):
+        search_name = self.items[item_id].search_name
+        return 0 if (" " + name) in search_name else 1, len(search_name), search_name
+
+
+def get_item_records(item_codes=None):
+    """
+    Get the searchable fields of enabled items with their barcodes.
+    """
+    filters = {"disabled": 0}
+    if item_codes is not None:
+        filters["name"] = ["in", list(item_codes)]
+
+    items = frappe.get_all("Item", filters=filters, fields=["item_code", "item_name", "stock_uom"], order_by="name asc")
+    barcode_filters = {"parenttype": "Item"}
+    if item_codes is not None:
+        barcode_filters["parent"] = ["in", list(item_codes)]
+
+    barcodes = {}
+    for parent, barcode in frappe.get_all("Item Barcode", filters=barcode_filters, fields=["parent", "barcode"], as_list=True):
+        barcodes.setdefault(parent, []).append(barcode)
+
+    return [{
+        "item_code": item.item_code,
+        "item_name": item.item_name or item.item_code,
+        "stock_uom": item.stock_uom,
+        "barcodes": barcodes.get(item.item_code, [])
+    } for item in items]
+
+
+def rebuild_item_search_index():
+    """
+    Publish a new snapshot of every item for the workers to load, replacing
+    the change log.
+
+    Changes logged while the items are read are carried over to the log of
+    the new snapshot, so none are lost. The logs are raw Redis lists under
+    `make_key`'d names.
+    """
+    cache = frappe.cache()
+    lock = cache.lock(cache.make_key(LOCK_KEY), timeout=10 * 60)
+    if not lock.acquire(blocking=True, blocking_timeout=60):
+        return
+
+    try:
+        previous = cache.get_value(GENERATION_KEY)
+        previous_log = cache.make_key(LOG_KEY.format(previous))
+        start = redis_call("llen", previous_log) if previous else 0
+
+        generation = uuid.uuid4().hex
+        cache.set_value(SNAPSHOT_KEY.format(generation), get_item_records(), expires_in_sec=SNAPSHOT_TTL)
+        cache.set_value(GENERATION_KEY, generation)
+
+        log = cache.make_key(LOG_KEY.format(generation))
+        if previous:
+            changes = redis_call("lrange", previous_log, start, -1)
+            if changes:
+                redis_call("rpush", log, *changes)
+            cache.delete_value(SNAPSHOT_KEY.format(previous))
+            cache.delete(previous_log)
+        cache.expire(log, SNAPSHOT_TTL)
+    finally:
+        lock.release()
+
+    return generation
+
+
+def get_index():
+    """
+    Get this process's index of the site's items, brought up to date with
+    the shared snapshot and change log in Redis.
+
+    Up to date indexes cost one Redis round trip; the snapshot is only
+    loaded when a new one was published.
+    """
+    cache = frappe.cache()
+    site = frappe.local.site
+    index = _indexes.get(site)
+
+    generation = cache.get_value(GENERATION_KEY)
+    if not generation:
+        generation = rebuild_item_search_index() or cache.get_value(GENERATION_KEY)
+
+    if not index or index.generation != generation:
+        records = cache.get_value(SNAPSHOT_KEY.format(generation))
+        if records is None:
+            generation = rebuild_item_search_index()
+            records = cache.get_value(SNAPSHOT_KEY.format(generation)) or []
+        index = _indexes[site] = ItemIndex(generation, records)
+
+    changes = redis_call("lrange", cache.make_key(LOG_KEY.format(generation)), index.position, -1)
+    for change in changes:
+        index.apply(json.loads(change))
+    index.position += len(changes)
+
+    return index
+
+
+def log_item_changes(item_codes):
+    """
+    Append the current state of items to the change log of the shared index.
+    """
+    cache = frappe.cache()
+    generation = cache.get_value(GENERATION_KEY)
+    if not generation:
+        return
+
+    records = {record["item_code"]: record for record in get_item_records(item_codes)}
+    changes = [json.dumps(records.get(item_code) or {"item_code": item_code, "deleted": True}) for item_code in item_codes]
+    log = cache.make_key(LOG_KEY.format(generation))
+    # The log may only be created here, after the rebuild set its expiry
+    pipeline = cache.pipeline()
+    pipeline.rpush(log, *changes)
+    pipeline.expire(log, SNAPSHOT_TTL)
+    length, _expired = pipeline.execute()
+    if length > LOG_COMPACT_THRESHOLD:
+        frappe.enqueue("retail_app.item_search.rebuild_item_search_index",
+                       queue="long",
+                       job_id="retail_app_rebuild_item_search_index",
+                       deduplicate=True)
+
+
+def on_item_change(doc, method=None):
+    """
+    Doc event handler logging a changed or deleted Item once the change is
+    committed. Barcodes are a child table of Item, so their changes arrive
+    through it too.
+    """
+    item_codes = [doc.name]
+    frappe.db.after_commit.add(lambda: log_item_changes(item_codes))
+
+
+def on_item_rename(doc, method=None, old=None, new=None, merge=False):
+    """
+    Doc event handler logging a renamed Item under both names once the
+    rename is committed, so the old name is dropped from the index.
+    """
+    item_codes = [old, new]
+    frappe.db.after_commit.add(lambda: log_item_changes(item_codes))
+
+
+def get_search_results(query, limit=20, warehouse=None, warehouse_group=None, price_list=None):
+    """
+    Search items by barcode, item code or name, with the stock and selling
+    prices of the matches.
+    """
+    items = get_index().search(query, limit=int(limit))
+    if not items:
+        return []
+
+    item_codes = [item.item_code for item in items]
+    stock = get_item_stock(item_codes, warehouse=warehouse, warehouse_group=warehouse_group)
+    price_filters = {"item_code": ["in", item_codes], "selling": 1}
+    if price_list:
+        price_filters["price_list"] = price_list
+
+    prices = {}
+    for price in frappe.get_all("Item Price", filters=price_filters, fields=["item_code", "price_list", "uom", "price_list_rate"]):
+        prices.setdefault(price.item_code, []).append({
+            "price_list": price.price_list,
+            "uom": price.uom,
+            "price": price.price_list_rate
+        })
+
+    results = []
+    for item in items:
+        result = serialize_item(frappe._dict(item, remaining_stock=stock.get(item.item_code, 0)))
+        result["prices"] = prices.get(item.item_code, [])
+        results.append(result)
+
+    return results
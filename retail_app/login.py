@@ -0,0 +1,77 @@
+import frappe
+
+LOGIN_CACHE_KEY = "retail_app:login:{}"
+
+# Seconds a user's resolved login details are reused; changes to the User
+# clear them earlier
+LOGIN_CACHE_TTL = 15 * 60
+
+
+def get_profile_picture(user):
+    """
+    Get the URL of a user's profile picture, falling back to a generated
+    avatar with their initials.
+    """
+    profile_picture = user.user_image
+    if not profile_picture:
+        full_name = user.full_name or user.first_name + " " + user.last_name
+        profile_picture = f"https://ui-avatars.com/api/?name={full_name}&color=16794c&background=daf0e1"
+
+    return profile_picture
+
+
+def get_login_details(user):
+    """
+    Get the API key, full name and profile picture URL of a user,
+    generating the API key on first login.
+
+    Both are cached for `LOGIN_CACHE_TTL` seconds so logins after the first
+    only read the API secret, instead of loading the whole User document.
+    """
+    key = LOGIN_CACHE_KEY.format(user)
+    details = frappe.cache().get_value(key)
+    if details:
+        return details
+
+    doc = frappe.db.get_value("User", user, ["api_key", "user_image", "full_name", "first_name", "last_name"], as_dict=True)
+    api_key = doc.api_key
+    if not api_key:
+        api_key = frappe.generate_hash(length=15)
+        frappe.db.set_value("User", user, "api_key", api_key)
+
+    details = {"key": api_key, "full_name": doc.full_name, "dp": get_profile_picture(doc)}
+    frappe.cache().set_value(key, details, expires_in_sec=LOGIN_CACHE_TTL)
+
+    return details
+
+
+def get_api_secret(user):
+    """
+    Get the user's API secret, generating one if it does not exist.
+    """
+    try:
+        return frappe.utils.password.get_decrypted_password('User', user, fieldname='api_secret')
+    except frappe.exceptions.AuthenticationError:
+        # Generate a new API secret if it does not exist
+        api_secret = frappe.generate_hash(length=15)
+        frappe.utils.password.update_password('User', user, api_secret, fieldname='api_secret')
+        return api_secret
+
+
+def get_login_response(user):
+    details = get_login_details(user)
+    return {
+        "key": details["key"],
+        "secret": get_api_secret(user),
+        "dp": details["dp"]
+    }
+
+
+def clear_login_cache(doc, method=None):
+    """
+    Doc event handler dropping a User's cached login details once the
+    change is committed, so a new API key or picture is served on the next
+    login and no login caches the details from before it.
+    """
+    key = LOGIN_CACHE_KEY.format(doc.name)
+    frappe.db.after_commit.add(lambda: frappe.cache().delete_value(key))
@@ -0,0 +1,5 @@
+from retail_app.balances import rebuild_customer_balances
+
+
+def execute():
+    rebuild_customer_balances()
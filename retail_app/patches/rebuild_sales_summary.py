@@ -0,0 +1,5 @@
+from retail_app.sales_summary import rebuild_sales_summary
+
+
+def execute():
+    rebuild_sales_summary()
@@ -0,0 +1,178 @@
+import frappe
+from frappe.utils import flt, nowdate
+
+from retail_app.utils import rollback_to_savepoint, set_savepoint
+
+# Payments inserted and submitted per committed transaction in a batch
+PAYMENT_CHUNK_SIZE = 50
+
+
+def get_outstanding_invoices(customers):
+    """
+    Get the submitted invoices with an outstanding amount of several
+    customers in one query, oldest first, keyed by customer.
+    """
+    if not customers:
+        return {}
+
+    rows = frappe.db.sql("""
+        SELECT `name`, `customer`, `company`, `debit_to`, `posting_date`, `due_date`, `grand_total`, `outstanding_amount`
+        FROM `tabSales Invoice`
+        WHERE `customer` IN %(customers)s AND `docstatus` = 1 AND `outstanding_amount` > 0
+        ORDER BY `customer`, `posting_date`, `name`
+    """, {"customers": list(customers)}, as_dict=True)
+
+    outstanding = {}
+    for row in rows:
+        outstanding.setdefault(row.customer, []).append(row)
+
+    return outstanding
+
+
+def get_payable_invoices(payment_data, invoices):
+    """
+    Get the invoices a payment can settle: those of its company receivable
+    in the account it is paid from, which Payment Entry validation requires.
+    """
+    paid_from = payment_data['paid_from_account']
+    company = payment_data.get('company') or frappe.get_cached_value('Account', paid_from, 'company')
+    return [invoice for invoice in invoices if invoice.company == company and invoice.debit_to == paid_from]
+
+
+def allocate_payment(amount, invoices):
+    """
+    Allocate `amount` to `invoices` oldest first.
+
+    Returns the allocations as `(invoice, allocated_amount)` pairs; whatever
+    is left of the amount stays unallocated on the payment as an advance.
+    """
+    allocations = []
+    remaining = flt(amount)
+    for invoice in invoices:
+        if remaining <= 0:
+            break
+        if invoice.outstanding_amount <= 0:
+            continue
+
+        allocated = min(remaining, flt(invoice.outstanding_amount))
+        allocations.append((invoice, allocated))
+        remaining = flt(remaining - allocated)
+
+    return allocations
+
+
+def validate_payment(payment_data):
+    """
+    Check a payment payload has what a Payment Entry needs.
+
+    Returns an error message, or `None` when the payment can be created.
+    """
+    for field in ('customer', 'paid_from_account', 'paid_to_account', 'amount'):
+        if not payment_data.get(field):
+            return f"Required field {field} not provided"
+
+    if flt(payment_data['amount']) <= 0:
+        return "Amount must be greater than zero"
+
+
+def make_payment_entry(payment_data, allocations):
+    """
+    Build a Payment Entry receiving a customer payment, with a reference row
+    for each allocation.
+    """
+    payment_entry = frappe.new_doc('Payment Entry')
+    payment_entry.payment_type = 'Receive'
+    payment_entry.party_type = 'Customer'
+    payment_entry.party = payment_data['customer']
+    if payment_data.get('company'):
+        payment_entry.company = payment_data['company']
+    elif allocations:
+        payment_entry.company = allocations[0][0].company
+    payment_entry.posting_date = payment_data.get('posting_date') or nowdate()
+    payment_entry.mode_of_payment = payment_data.get('mode_of_payment')
+    payment_entry.paid_from = payment_data['paid_from_account']
+    payment_entry.paid_to = payment_data['paid_to_account']
+    payment_entry.paid_amount = flt(payment_data['amount'])
+    payment_entry.received_amount = flt(payment_data['amount'])
+    payment_entry.reference_no = payment_data.get('reference_no', '')
+    payment_entry.reference_date = payment_data.get('reference_date', nowdate())
+    payment_entry.remarks = payment_data.get('remarks', '')
+
+    for invoice, allocated in allocations:
+        payment_entry.append('references', {
+            'reference_doctype': 'Sales Invoice',
+            'reference_name': invoice.name,
+            'due_date': invoice.due_date,
+            'total_amount': invoice.grand_total,
+            'outstanding_amount': invoice.outstanding_amount,
+            'allocated_amount': allocated
+        })
+
+    return payment_entry
+
+
+def insert_payments(payments, chunk_size=PAYMENT_CHUNK_SIZE, commit=True):
+    """
+    Create and submit a batch of customer payments, each allocated to the
+    customer's outstanding invoices oldest first.
+
+    The outstanding invoices of every customer in the batch are read in one
+    query, and allocations are tracked in memory so several payments of the
+    same customer settle successive invoices. Payments are submitted in
+    chunks of `chunk_size`, each committed as one transaction; a failing
+    payment is rolled back to its savepoint without affecting the rest of
+    its chunk.
+
+    Returns one result per payment, in the order they were given.
+    """
+    results = []
+    pending = []
+    for index, payment_data in enumerate(payments):
+        error = validate_payment(payment_data)
+        if error:
+            results.append({"index": index, "status": "failed", "error": error})
+        else:
+            results.append(None)
+            pending.append(index)
+
+    outstanding = get_outstanding_invoices({payments[index]['customer'] for index in pending})
+
+    for start in range(0, len(pending), int(chunk_size)):
+        for index in pending[start:start + int(chunk_size)]:
+            payment_data = payments[index]
+            results[index] = submit_payment(index, payment_data, outstanding.get(payment_data['customer'], []))
+
+        if commit:
+            frappe.db.commit()
+
+    return results
+
+
+def submit_payment(index, payment_data, invoices):
+    """
+    Insert and submit one payment of a batch inside its own savepoint, and
+    deduct its allocations from the customer's outstanding invoices once it
+    is submitted.
+    """
+    allocations = allocate_payment(payment_data['amount'], get_payable_invoices(payment_data, invoices))
+    savepoint = f"retail_payment_{index}"
+    after_commit = set_savepoint(savepoint)
+    try:
+        payment_entry = make_payment_entry(payment_data, allocations)
+        payment_entry.insert()
+        payment_entry.submit()
+    except Exception as e:
+        rollback_to_savepoint(savepoint, after_commit)
+        frappe.log_error(frappe.get_traceback(), 'Payment Entry Creation Error')
+        return {"index": index, "status": "failed", "error": str(e)}
+
+    for invoice, allocated in allocations:
+        invoice.outstanding_amount = flt(invoice.outstanding_amount - allocated)
+
+    return {
+        "index": index,
+        "status": "success",
+        "payment_entry": payment_entry.name,
+        "allocations": [{"sales_invoice": invoice.name, "allocated_amount": allocated} for invoice, allocated in allocations],
+        "unallocated_amount": payment_entry.unallocated_amount
+    }
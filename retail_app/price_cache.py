@@ -0,0 +1,135 @@
+import hashlib
+import json
+import zlib
+
+import frappe
+
+from retail_app.catalog import serialize_item_price
+
+PRICE_LIST_KEY = "retail_app:item_prices:{}:{}"
+SELLING_PRICE_LISTS_KEY = "retail_app:selling_price_lists:{}"
+HITS_KEY = "retail_app:item_prices:hits"
+MISSES_KEY = "retail_app:item_prices:misses"
+
+# Bumped on every invalidation. Entries are stored under the version read
+# before they were built, so an entry built from data older than a change
+# is stored under a version no longer read.
+PRICE_LIST_VERSION_KEY = "retail_app:item_prices:version:{}"
+SELLING_PRICE_LISTS_VERSION_KEY = "retail_app:selling_price_lists:version"
+
+# Cached entries expire even without invalidation, in case prices are
+# changed through paths that skip doc events (e.g. direct SQL), and so
+# entries of superseded versions do not linger
+CACHE_TTL = 60 * 60
+
+# Payloads larger than this are stored zlib-compressed
+COMPRESS_THRESHOLD = 64 * 1024
+
+
+def get_selling_price_lists():
+    """
+    Get the names of the price lists used for selling.
+    """
+    key = SELLING_PRICE_LISTS_KEY.format(get_version(SELLING_PRICE_LISTS_VERSION_KEY))
+    price_lists = frappe.cache().get_value(key)
+    if price_lists is None:
+        price_lists = frappe.get_all('Price List', filters={'selling': 1}, pluck='name', order_by='name asc')
+        frappe.cache().set_value(key, price_lists, expires_in_sec=CACHE_TTL)
+
+    return price_lists
+
+
+def get_price_list_entry(price_list):
+    """
+    Get the cached serialized prices of a price list, building them on a miss.
+
+    The entry holds the comma-separated JSON objects of the list's prices
+    (without the enclosing brackets) and a digest of them for ETags.
+    """
+    key = PRICE_LIST_KEY.format(price_list, get_version(PRICE_LIST_VERSION_KEY.format(price_list)))
+    entry = frappe.cache().get_value(key)
+    if entry is not None:
+        increment(HITS_KEY)
+        return entry
+
+    increment(MISSES_KEY)
+    item_prices = frappe.get_all('Item Price', filters={"price_list": price_list}, fields=['item_code','name', 'uom', 'price_list_rate'])
+    data = ",".join(json.dumps(serialize_item_price(price)) for price in item_prices).encode()
+    entry = {
+        "digest": hashlib.sha1(data).hexdigest(),
+        "compressed": len(data) > COMPRESS_THRESHOLD,
+    }
+    entry["data"] = zlib.compress(data, 1) if entry["compressed"] else data
+    frappe.cache().set_value(key, entry, expires_in_sec=CACHE_TTL)
+
+    return entry
+
+
+def get_item_prices_payload():
+    """
+    Get the JSON array of all selling item prices and its ETag.
+    """
+    entries = [get_price_list_entry(price_list) for price_list in get_selling_price_lists()]
+    etag = hashlib.sha1("".join(entry["digest"] for entry in entries).encode()).hexdigest()
+    parts = [zlib.decompress(entry["data"]) if entry["compressed"] else entry["data"] for entry in entries]
+
+    return b"[" + b",".join(part for part in parts if part) + b"]", etag
+
+
+def increment(key):
+    cache = frappe.cache()
+    cache.incr(cache.make_key(key))
+
+
+def get_version(key):
+    cache = frappe.cache()
+    return int(cache.get(cache.make_key(key)) or 0)
+
+
+def get_cache_stats():
+    """
+    Get the hit and miss counters of the price list cache.
+    """
+    cache = frappe.cache()
+    hits = int(cache.get(cache.make_key(HITS_KEY)) or 0)
+    misses = int(cache.get(cache.make_key(MISSES_KEY)) or 0)
+
+    return {"hits": hits, "misses": misses}
+
+
+def clear_price_list(price_list):
+    if price_list:
+        increment(PRICE_LIST_VERSION_KEY.format(price_list))
+
+
+def on_item_price_change(doc, method=None):
+    """
+    Invalidate the cached prices of the Item Price's price list, and of its
+    previous price list if it was moved, once the change is committed so no
+    request caches the prices from before it.
+    """
+    price_lists = {doc.price_list}
+    previous = doc.get_doc_before_save()
+    if previous and previous.price_list != doc.price_list:
+        price_lists.add(previous.price_list)
+
+    frappe.db.after_commit.add(lambda: clear_price_lists(price_lists))
+
+
+def on_price_list_change(doc, method=None):
+    """
+    Invalidate the list of selling price lists and the Price List's prices
+    once the change is committed.
+    """
+    price_list = doc.name
+
+    def clear():
+        increment(SELLING_PRICE_LISTS_VERSION_KEY)
+        clear_price_list(price_list)
+
+    frappe.db.after_commit.add(clear)
+
+
+def clear_price_lists(price_lists):
+    for price_list in price_lists:
+        clear_price_list(price_list)
@@ -0,0 +1,103 @@
+import frappe
+from erpnext.controllers.accounts_controller import get_default_taxes_and_charges, get_taxes_and_charges
+from frappe.utils import flt
+
+from retail_app.settings_cache import get_retail_config
+
+
+def make_quote_invoice(cart):
+    """
+    Build the unsaved Sales Invoice a cart would become, priced and taxed by
+    ERPNext: price list rates, pricing rules and item tax templates come
+    from `get_item_details`, and the taxes from the cart's Sales Taxes and
+    Charges Template, or the company's default one.
+    """
+    config = get_retail_config()
+    sales_invoice = frappe.new_doc("Sales Invoice")
+    sales_invoice.update({
+        "customer": cart.get("customer") or config.walk_in_customer,
+        "company": cart.get("company") or config.default_company,
+        "selling_price_list": cart.get("selling_price_list"),
+        "items": [{
+            "item_code": line.get("item_code"),
+            "qty": flt(line.get("qty")) or 1,
+            "uom": line.get("uom")
+        } for line in cart.get("items") or []]
+    })
+    sales_invoice.set_missing_values()
+
+    if cart.get("taxes_and_charges"):
+        sales_invoice.taxes_and_charges = cart["taxes_and_charges"]
+        sales_invoice.set("taxes", get_taxes_and_charges("Sales Taxes and Charges Template", cart["taxes_and_charges"]))
+    else:
+        defaults = get_default_taxes_and_charges("Sales Taxes and Charges Template", company=sales_invoice.company)
+        sales_invoice.taxes_and_charges = defaults.get("taxes_and_charges")
+        sales_invoice.set("taxes", defaults.get("taxes") or [])
+
+    sales_invoice.calculate_taxes_and_totals()
+
+    return sales_invoice
+
+
+def serialize_quote(sales_invoice):
+    return {
+        "customer": sales_invoice.customer,
+        "selling_price_list": sales_invoice.selling_price_list,
+        "taxes_and_charges": sales_invoice.taxes_and_charges,
+        "items": [{
+            "item_code": item.item_code,
+            "qty": item.qty,
+            "uom": item.uom,
+            "conversion_factor": item.conversion_factor,
+            "price_list_rate": item.price_list_rate,
+            "rate": item.rate,
+            "amount": item.amount,
+            "item_tax_template": item.item_tax_template,
+            "pricing_rules": item.pricing_rules
+        } for item in sales_invoice.items],
+        "taxes": [{
+            "account_head": tax.account_head,
+            "description": tax.description,
+            "rate": tax.rate,
+            "tax_amount": tax.tax_amount,
+            "total": tax.total
+        } for tax in sales_invoice.taxes],
+        "total_qty": sales_invoice.total_qty,
+        "net_total": sales_invoice.net_total,
+        "total_taxes_and_charges": sales_invoice.total_taxes_and_charges,
+        "grand_total": sales_invoice.grand_total
+    }
+
+
+def quote_carts(carts):
+    """
+    Price a batch of carts exactly as their Sales Invoices would be, by
+    running ERPNext's pricing and tax calculation on unsaved invoices.
+
+    Carts with items that do not exist are reported without being built,
+    from one lookup for the whole batch. A cart ERPNext rejects, e.g. for a
+    UOM the item cannot be sold in, gets an `error` instead of a quote.
+    Nothing is written.
+
+    Returns one quote per cart, in the order they were given.
+    """
+    item_codes = list({line.get("item_code") for cart in carts for line in cart.get("items") or []})
+    items = set(frappe.get_all("Item",
+        filters={"name": ["in", item_codes], "disabled": 0},
+        pluck="name")) if item_codes else set()
+
+    quotes = []
+    for cart in carts:
+        missing = [line.get("item_code") for line in cart.get("items") or [] if line.get("item_code") not in items]
+        if missing:
+            quotes.append({"customer": cart.get("customer"), "error": f"Item {missing[0]} not found"})
+            continue
+
+        try:
+            quotes.append(serialize_quote(make_quote_invoice(cart)))
+        except frappe.ValidationError as e:
+            # The error is returned with the quote, not as a message
+            frappe.clear_messages()
+            quotes.append({"customer": cart.get("customer"), "error": str(e)})
+
+    return quotes
@@ -0,0 +1,34 @@
+from frappe import _
+from frappe.utils import flt
+
+from retail_app.coalesce import get_coalesce_stats
+from retail_app.price_cache import get_cache_stats
+
+
+def execute(filters=None):
+    columns = [
+        {"fieldname": "cache", "label": _("Cache"), "fieldtype": "Data", "width": 240},
+        {"fieldname": "hits", "label": _("Hits"), "fieldtype": "Int", "width": 120},
+        {"fieldname": "misses", "label": _("Misses"), "fieldtype": "Int", "width": 120},
+        {"fieldname": "hit_ratio", "label": _("Hit Ratio (%)"), "fieldtype": "Percent", "width": 120}
+    ]
+
+    caches = [(_("Item Prices"), get_cache_stats())]
+    # A coalesced call is a hit when it reused the result of another call
+    for endpoint, stats in sorted(get_coalesce_stats().items()):
+        caches.append((_("Coalesced {0}").format(endpoint), {
+            "hits": stats["shared"] + stats["waited"],
+            "misses": stats["computed"] + stats["timed_out"]
+        }))
+
+    data = []
+    for cache, stats in caches:
+        lookups = stats["hits"] + stats["misses"]
+        data.append({
+            "cache": cache,
+            "hits": stats["hits"],
+            "misses": stats["misses"],
+            "hit_ratio": flt(stats["hits"] * 100 / lookups, 2) if lookups else 0
+        })
+
+    return columns, data
@@ -0,0 +1,14 @@
+from frappe import _
+
+from retail_app.balances import get_balance_drift
+
+
+def execute(filters=None):
+    columns = [
+        {"fieldname": "customer", "label": _("Customer"), "fieldtype": "Link", "options": "Customer", "width": 240},
+        {"fieldname": "stored_balance", "label": _("Stored Balance"), "fieldtype": "Currency", "width": 160},
+        {"fieldname": "ledger_balance", "label": _("Ledger Balance"), "fieldtype": "Currency", "width": 160},
+        {"fieldname": "difference", "label": _("Difference"), "fieldtype": "Currency", "width": 160}
+    ]
+
+    return columns, get_balance_drift()
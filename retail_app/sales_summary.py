@@ -0,0 +1,241 @@
+import hashlib
+
+import frappe
+from frappe.utils import flt, get_time, getdate, now, nowdate
+
+# Invoice total, after rounding when the invoice is rounded
+INVOICE_TOTAL = "IF(`tabSales Invoice`.`base_rounded_total`, `tabSales Invoice`.`base_rounded_total`, `tabSales Invoice`.`base_grand_total`)"
+
+# Amount of an invoice left unpaid at submission, sold on credit
+CREDIT_AMOUNT = INVOICE_TOTAL + " - `tabSales Invoice`.`base_paid_amount` + `tabSales Invoice`.`base_change_amount`"
+
+# Columns grouping a summary row, in the order they are hashed into its name
+GROUP_COLUMNS = """
+    `tabSales Invoice`.`posting_date`,
+    HOUR(`tabSales Invoice`.`posting_time`),
+    IFNULL(`tabSales Invoice`.`pos_profile`, ''),
+    `tabSales Invoice`.`owner`
+"""
+
+
+def get_row_name(posting_date, hour, pos_profile, cashier, dimension, key):
+    """
+    Name of the summary row of a group. Must agree with `row_name_sql`.
+    """
+    parts = [str(getdate(posting_date)), str(hour), pos_profile or "", cashier, dimension, key or ""]
+    return hashlib.sha1("|".join(parts).encode()).hexdigest()
+
+
+def row_name_sql(dimension, key):
+    """
+    SQL expression naming the summary row of a group, `key` being an SQL
+    expression.
+    """
+    # CONCAT_WS skips NULL arguments, so NULL keys are hashed as empty ones
+    return "SHA1(CONCAT_WS('|', {}, '{}', IFNULL({}, '')))".format(GROUP_COLUMNS, dimension, key)
+
+
+def get_invoice_rows(doc):
+    """
+    Get the `(dimension, key, qty, amount)` contributions of an invoice.
+    """
+    total = flt(doc.base_rounded_total) or flt(doc.base_grand_total)
+    rows = {("Total", ""): [flt(doc.total_qty), total]}
+
+    for payment in doc.get("payments") or []:
+        row = rows.setdefault(("Payment Mode", payment.mode_of_payment), [0, 0])
+        row[1] += flt(payment.base_amount)
+    if flt(doc.base_change_amount):
+        rows[("Payment Mode", "Change")] = [0, -flt(doc.base_change_amount)]
+    credit = flt(total - flt(doc.base_paid_amount) + flt(doc.base_change_amount), 2)
+    if credit:
+        rows[("Payment Mode", "Credit")] = [0, credit]
+
+    for item in doc.get("items") or []:
+        row = rows.setdefault(("Item", item.item_code), [0, 0])
+        row[0] += flt(item.stock_qty)
+        row[1] += flt(item.base_net_amount)
+
+    return [(dimension, key, qty, amount) for (dimension, key), (qty, amount) in rows.items()]
+
+
+def update_sales_summary(doc, sign):
+    """
+    Add an invoice to the summary rows of its date, hour, POS profile and
+    cashier, or subtract it with `sign=-1`, in one upsert.
+    """
+    hour = get_time(doc.posting_time).hour
+    timestamp = now()
+    values = []
+    for dimension, key, qty, amount in get_invoice_rows(doc):
+        values.append((
+            get_row_name(doc.posting_date, hour, doc.pos_profile, doc.owner, dimension, key),
+            doc.posting_date, hour, doc.pos_profile, doc.owner, dimension, key,
+            sign, sign * qty, sign * amount,
+            timestamp, timestamp, frappe.session.user, frappe.session.user
+        ))
+
+    frappe.db.sql("""
+        INSERT INTO `tabRetail Sales Summary`
+            (`name`, `posting_date`, `hour`, `pos_profile`, `cashier`, `dimension`, `key`,
+            `invoice_count`, `qty`, `amount`, `creation`, `modified`, `owner`, `modified_by`)
+        VALUES {}
+        ON DUPLICATE KEY UPDATE
+            `invoice_count` = `invoice_count` + VALUES(`invoice_count`),
+            `qty` = `qty` + VALUES(`qty`),
+            `amount` = `amount` + VALUES(`amount`),
+            `modified` = VALUES(`modified`),
+            `modified_by` = VALUES(`modified_by`)
+    """.format(", ".join(["%s"] * len(values))), values)
+
+
+def on_sales_invoice_submit(doc, method=None):
+    update_sales_summary(doc, 1)
+
+
+def on_sales_invoice_cancel(doc, method=None):
+    update_sales_summary(doc, -1)
+
+
+def rebuild_sales_summary(from_date=None, to_date=None):
+    """
+    Recompute the summary rows from the submitted invoices between
+    `from_date` and `to_date` (all dates by default).
+
+    Each day is rebuilt and committed on its own, so the backfill can run on
+    a live site. Returns the number of days rebuilt.
+    """
+    conditions = []
+    values = {"from_date": from_date, "to_date": to_date}
+    if from_date:
+        conditions.append("`posting_date` >= %(from_date)s")
+    if to_date:
+        conditions.append("`posting_date` <= %(to_date)s")
+    conditions = " AND ".join(conditions) or "1 = 1"
+
+    # Days whose invoices were all cancelled only have rows to delete
+    dates = frappe.db.sql_list("""
+        SELECT `posting_date` FROM `tabSales Invoice` WHERE `docstatus` = 1 AND {conditions}
+        UNION SELECT `posting_date` FROM `tabRetail Sales Summary` WHERE {conditions}
+        ORDER BY `posting_date`
+    """.format(conditions=conditions), values)
+
+    for posting_date in dates:
+        rebuild_day(posting_date)
+        frappe.db.commit()
+
+    return len(dates)
+
+
+def rebuild_day(posting_date):
+    values = {"posting_date": posting_date, "now": now(), "user": frappe.session.user}
+    frappe.db.sql("DELETE FROM `tabRetail Sales Summary` WHERE `posting_date` = %(posting_date)s", values)
+
+    # Invoices submitted meanwhile may have added rows already; the totals read here include them
+    insert = """
+        INSERT INTO `tabRetail Sales Summary`
+            (`name`, `posting_date`, `hour`, `pos_profile`, `cashier`, `dimension`, `key`,
+            `invoice_count`, `qty`, `amount`, `creation`, `modified`, `owner`, `modified_by`)
+        SELECT {name}, {group_columns}, '{dimension}', {key},
+            {invoice_count}, {qty}, {amount}, %(now)s, %(now)s, %(user)s, %(user)s
+        FROM `tabSales Invoice`
+        {join}
+        WHERE `tabSales Invoice`.`docstatus` = 1 AND `tabSales Invoice`.`posting_date` = %(posting_date)s
+        {conditions}
+        GROUP BY {group_columns}, {key}
+        ON DUPLICATE KEY UPDATE
+            `invoice_count` = VALUES(`invoice_count`),
+            `qty` = VALUES(`qty`),
+            `amount` = VALUES(`amount`),
+            `modified` = VALUES(`modified`),
+            `modified_by` = VALUES(`modified_by`)
+    """
+
+    for dimension, key, join, conditions, invoice_count, qty, amount in (
+        ("Total", "''", "", "",
+            "COUNT(*)", "SUM(`tabSales Invoice`.`total_qty`)", "SUM({})".format(INVOICE_TOTAL)),
+        ("Payment Mode", "`tabSales Invoice Payment`.`mode_of_payment`",
+            """INNER JOIN `tabSales Invoice Payment` ON `tabSales Invoice Payment`.`parent` = `tabSales Invoice`.`name`
+            AND `tabSales Invoice Payment`.`parenttype` = 'Sales Invoice'""", "",
+            "COUNT(DISTINCT `tabSales Invoice`.`name`)", "0", "SUM(`tabSales Invoice Payment`.`base_amount`)"),
+        ("Payment Mode", "'Change'", "", "AND `tabSales Invoice`.`base_change_amount` != 0",
+            "COUNT(*)", "0", "-SUM(`tabSales Invoice`.`base_change_amount`)"),
+        ("Payment Mode", "'Credit'", "", "AND ROUND({}, 2) != 0".format(CREDIT_AMOUNT),
+            "COUNT(*)", "0", "SUM(ROUND({}, 2))".format(CREDIT_AMOUNT)),
+        ("Item", "`tabSales Invoice Item`.`item_code`",
+            """INNER JOIN `tabSales Invoice Item` ON `tabSales Invoice Item`.`parent` = `tabSales Invoice`.`name`
+            AND `tabSales Invoice Item`.`parenttype` = 'Sales Invoice'""", "",
+            "COUNT(DISTINCT `tabSales Invoice`.`name`)", "SUM(`tabSales Invoice Item`.`stock_qty`)",
+            "SUM(`tabSales Invoice Item`.`base_net_amount`)"),
+    ):
+        frappe.db.sql(insert.format(
+            name=row_name_sql(dimension, key),
+            group_columns=GROUP_COLUMNS,
+            dimension=dimension,
+            key=key,
+            join=join,
+            conditions=conditions,
+            invoice_count=invoice_count,
+            qty=qty,
+            amount=amount
+        ), values)
+
+
+def get_sales_summary(from_date=None, to_date=None, pos_profile=None, cashier=None):
+    """
+    Get the sales totals of a date range, overall and by payment mode, item,
+    cashier and hour, for a Z report.
+
+    Read from the summary rows, whose number depends on the hours, cashiers
+    and items sold rather than on the number of invoices.
+    """
+    from_date = getdate(from_date or nowdate())
+    to_date = getdate(to_date or from_date)
+    conditions = ["`posting_date` BETWEEN %(from_date)s AND %(to_date)s"]
+    values = {"from_date": from_date, "to_date": to_date}
+    if pos_profile:
+        conditions.append("`pos_profile` = %(pos_profile)s")
+        values["pos_profile"] = pos_profile
+    if cashier:
+        conditions.append("`cashier` = %(cashier)s")
+        values["cashier"] = cashier
+
+    rows = frappe.db.sql("""
+        SELECT `dimension`, `key`, `cashier`, `hour`,
+            SUM(`invoice_count`) AS invoice_count, SUM(`qty`) AS qty, SUM(`amount`) AS amount
+        FROM `tabRetail Sales Summary`
+        WHERE {}
+        GROUP BY `dimension`, `key`, `cashier`, `hour`
+    """.format(" AND ".join(conditions)), values, as_dict=True)
+
+    summary = {
+        "from_date": str(from_date),
+        "to_date": str(to_date),
+        "pos_profile": pos_profile,
+        "totals": {"invoice_count": 0, "qty": 0.0, "amount": 0.0},
+        "by_payment_mode": {},
+        "by_item": {},
+        "by_cashier": {},
+        "by_hour": {}
+    }
+
+    def add(totals, row):
+        totals["invoice_count"] = totals.get("invoice_count", 0) + int(row.invoice_count)
+        totals["qty"] = flt(totals.get("qty", 0) + flt(row.qty), 6)
+        totals["amount"] = flt(totals.get("amount", 0) + flt(row.amount), 2)
+
+    for row in rows:
+        if row.dimension == "Total":
+            add(summary["totals"], row)
+            add(summary["by_cashier"].setdefault(row.cashier, {}), row)
+            add(summary["by_hour"].setdefault(row.hour, {}), row)
+        elif row.dimension == "Payment Mode":
+            add(summary["by_payment_mode"].setdefault(row.key, {}), row)
+        elif row.dimension == "Item":
+            add(summary["by_item"].setdefault(row.key, {}), row)
+
+    # Drop groups cancelled out entirely
+    for dimension in ("by_payment_mode", "by_item", "by_cashier", "by_hour"):
+        summary[dimension] = {key: totals for key, totals in sorted(summary[dimension].items()) if totals["invoice_count"]}
+
+    return summary
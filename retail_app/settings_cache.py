@@ -0,0 +1,88 @@
+import uuid
+
+import frappe
+from frappe.model import default_fields
+
+VERSION_KEY = "retail_app:settings:version"
+VALUES_KEY = "retail_app:settings:values:{}"
+
+# Seconds the shared values of a version are kept, so those of a version
+# bumped by a process that died before deleting them do not linger
+VALUES_TTL = 24 * 60 * 60
+
+# Values loaded by this process, keyed by site, with the version they were
+# loaded at
+_local = {}
+
+
+def load_retail_config():
+    """
+    Read the rarely changing values the endpoints need from the database.
+    """
+    settings = frappe.get_single("Retail Settings").as_dict()
+    global_defaults = frappe.db.get_value('Global Defaults', None, ['default_currency', 'default_company'], as_dict=True)
+    return frappe._dict(
+        settings=settings,
+        default_currency=global_defaults.default_currency,
+        default_company=global_defaults.default_company,
+        walk_in_customer=settings.get('walk_in_customer'),
+        # Invoices of customers without payment terms default to the 'Standard' template
+        default_payment_terms='Standard' if frappe.db.exists('Payment Terms Template', 'Standard') else None,
+        invoice_submit_queue=settings.get('invoice_submit_queue')
+    )
+
+
+def get_retail_config():
+    """
+    Get the Retail Settings, default currency and company, walk-in customer
+    and default payment terms of the site.
+
+    The values are memoized in the process and shared through Redis under a
+    version key, so an up to date process pays one Redis read and the
+    database is only read once per change. The returned values are shared
+    and must not be modified.
+    """
+    cache = frappe.cache()
+    version = cache.get_value(VERSION_KEY)
+    if not version:
+        version = bump_version()
+
+    site = frappe.local.site
+    local = _local.get(site)
+    if local and local[0] == version:
+        return local[1]
+
+    config = cache.get_value(VALUES_KEY.format(version))
+    if config is None:
+        config = load_retail_config()
+        cache.set_value(VALUES_KEY.format(version), config, expires_in_sec=VALUES_TTL)
+
+    _local[site] = (version, config)
+    return config
+
+
+def get_retail_settings(no_default_fields=False):
+    settings = get_retail_config().settings
+    if no_default_fields:
+        return {key: value for key, value in settings.items() if key not in default_fields}
+
+    return settings
+
+
+def bump_version():
+    cache = frappe.cache()
+    previous = cache.get_value(VERSION_KEY)
+    version = uuid.uuid4().hex
+    cache.set_value(VERSION_KEY, version)
+    if previous:
+        cache.delete_value(VALUES_KEY.format(previous))
+
+    return version
+
+
+def clear_retail_config(doc=None, method=None):
+    """
+    Doc event handler invalidating the cached values once the change is
+    committed, so no process caches the values from before it.
+    """
+    frappe.db.after_commit.add(bump_version)
@@ -0,0 +1,270 @@
+import gzip
+import hashlib
+import json
+import os
+
+import frappe
+from frappe.utils import add_to_date, get_datetime, get_url, now
+
+from retail_app.catalog import get_stock_query, serialize_item, serialize_item_price
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Items are spread over this many shards per snapshot kind; changing it
+# regenerates every shard on the next run
+SHARD_COUNT = 16
+
+SNAPSHOT_FOLDER = "retail_snapshots"
+SNAPSHOT_KINDS = ("items", "item_prices")
+LOCK_KEY = "retail_app:snapshots:lock"
+PENDING_KEY = "retail_app:snapshots:pending"
+
+# Seconds the dirty check reaches back before the previous run, so rows
+# stamped before it but committed after it read them are picked up
+WATERMARK_OVERLAP = 5 * 60
+
+# Runs made in one job for changes requested while it was running
+MAX_PASSES = 3
+
+
+def get_snapshot_path(*path):
+    return frappe.get_site_path("public", "files", SNAPSHOT_FOLDER, *path)
+
+
+def get_shard(item_code):
+    """
+    Get the shard of an item. Must agree with `shard_condition`.
+    """
+    return int(hashlib.sha1(item_code.encode()).hexdigest()[:8], 16) % SHARD_COUNT
+
+
+def shard_condition(column):
+    """
+    SQL condition selecting the rows of shard `%(shard)s` by item code.
+    """
+    return "MOD(CONV(LEFT(SHA1({}), 8), 16, 10), {}) = %(shard)s".format(column, SHARD_COUNT)
+
+
+def get_items_shard(shard):
+    stock_query, values = get_stock_query()
+    values["shard"] = shard
+    items = frappe.db.sql("""
+        SELECT `tabItem`.`item_name`, `tabItem`.`item_code`, `tabItem`.`stock_uom`,
+            IFNULL(`stock`.`actual_qty`, 0) AS remaining_stock
+        FROM `tabItem`
+        LEFT JOIN ({stock_query}) AS `stock` ON `stock`.`item_code` = `tabItem`.`name`
+        WHERE {condition}
+        ORDER BY `tabItem`.`name`
+    """.format(stock_query=stock_query, condition=shard_condition("`tabItem`.`name`")), values, as_dict=True)
+
+    return [serialize_item(item) for item in items]
+
+
+def get_item_prices_shard(shard):
+    prices = frappe.db.sql("""
+        SELECT `tabItem Price`.`item_code`, `tabItem Price`.`name`, `tabItem Price`.`uom`,
+            `tabItem Price`.`price_list_rate`
+        FROM `tabItem Price`
+        INNER JOIN `tabPrice List` ON `tabPrice List`.`name` = `tabItem Price`.`price_list`
+        WHERE `tabPrice List`.`selling` = 1 AND {condition}
+        ORDER BY `tabItem Price`.`price_list`, `tabItem Price`.`name`
+    """.format(condition=shard_condition("`tabItem Price`.`item_code`")), {"shard": shard}, as_dict=True)
+
+    return [serialize_item_price(price) for price in prices]
+
+
+SHARD_BUILDERS = {
+    "items": get_items_shard,
+    "item_prices": get_item_prices_shard
+}
+
+
+def get_manifest():
+    """
+    Get the manifest of the current snapshot, or `None` before the first run.
+    """
+    try:
+        with open(get_snapshot_path("manifest.json")) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def get_dirty_shards(since):
+    """
+    Get the `(kind, shard)` pairs whose source rows changed after `since`.
+    """
+    dirty = set()
+    values = {"since": since}
+
+    item_codes = frappe.db.sql_list("""
+        SELECT `name` FROM `tabItem` WHERE `modified` > %(since)s
+        UNION SELECT `item_code` FROM `tabBin` WHERE `modified` > %(since)s
+        UNION SELECT `deleted_name` FROM `tabDeleted Document`
+            WHERE `deleted_doctype` = 'Item' AND `creation` > %(since)s
+    """, values)
+    dirty.update(("items", get_shard(item_code)) for item_code in item_codes)
+
+    price_item_codes = frappe.db.sql_list("""
+        SELECT `item_code` FROM `tabItem Price` WHERE `modified` > %(since)s
+    """, values)
+    dirty.update(("item_prices", get_shard(item_code)) for item_code in price_item_codes)
+
+    # Deleted prices and price list changes are rare and may touch any shard
+    if frappe.db.sql("""
+        SELECT 1 FROM `tabDeleted Document`
+        WHERE `deleted_doctype` IN ('Item Price', 'Price List') AND `creation` > %(since)s
+        UNION SELECT 1 FROM `tabPrice List` WHERE `modified` > %(since)s
+        LIMIT 1
+    """, values):
+        dirty.update(("item_prices", shard) for shard in range(SHARD_COUNT))
+
+    return dirty
+
+
+def write_shard(kind, shard, data):
+    """
+    Write a shard as compressed files named after its checksum, so a file's
+    content never changes once published and can be cached indefinitely.
+    """
+    payload = json.dumps(data, separators=(",", ":")).encode()
+    checksum = hashlib.sha256(payload).hexdigest()
+    name = "{}-{:02d}-{}.json".format(kind, shard, checksum[:16])
+
+    files = {"gzip": name + ".gz"}
+    write_file(files["gzip"], gzip.compress(payload, compresslevel=9))
+    if brotli:
+        files["br"] = name + ".br"
+        write_file(files["br"], brotli.compress(payload))
+
+    return {
+        "shard": shard,
+        "sha256": checksum,
+        "size": len(payload),
+        "files": files
+    }
+
+
+def write_file(name, content):
+    path = get_snapshot_path(name)
+    if os.path.exists(path):
+        return
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+def update_snapshots():
+    """
+    Regenerate the snapshot shards whose items, stock or prices changed
+    since the last run, and publish a new manifest.
+
+    Runs on the scheduler and after catalog changes; overlapping runs are
+    skipped. Changes requested while a run is in progress are picked up by
+    running again once it is done.
+    """
+    cache = frappe.cache()
+    lock = cache.lock(cache.make_key(LOCK_KEY), timeout=15 * 60)
+    if not lock.acquire(blocking=False):
+        return
+
+    try:
+        for _i in range(MAX_PASSES):
+            cache.delete_value(PENDING_KEY)
+            build_snapshots()
+            if not cache.get_value(PENDING_KEY):
+                break
+    finally:
+        lock.release()
+
+
+def build_snapshots():
+    os.makedirs(get_snapshot_path(), exist_ok=True)
+    # Taken before reading, so changes made during the run are picked up
+    # next time. `modified` and `creation` are stamped by Frappe from the
+    # system timezone, not the database session's, so the watermark is too
+    started = now()
+
+    previous = get_manifest()
+    if previous and previous.get("shard_count") == SHARD_COUNT:
+        shards = {kind: {entry["shard"]: entry for entry in previous["shards"][kind]} for kind in SNAPSHOT_KINDS}
+        dirty = get_dirty_shards(add_to_date(get_datetime(previous["generated_at"]), seconds=-WATERMARK_OVERLAP))
+    else:
+        shards = {kind: {} for kind in SNAPSHOT_KINDS}
+        dirty = {(kind, shard) for kind in SNAPSHOT_KINDS for shard in range(SHARD_COUNT)}
+
+    if previous and not dirty:
+        return
+
+    for kind, shard in sorted(dirty):
+        shards[kind][shard] = write_shard(kind, shard, SHARD_BUILDERS[kind](shard))
+
+    manifest = {
+        "shard_count": SHARD_COUNT,
+        "generated_at": started,
+        "shards": {kind: [shards[kind][shard] for shard in sorted(shards[kind])] for kind in SNAPSHOT_KINDS}
+    }
+    manifest["version"] = hashlib.sha256(
+        "".join(entry["sha256"] for kind in SNAPSHOT_KINDS for entry in manifest["shards"][kind]).encode()
+    ).hexdigest()
+
+    write_manifest(manifest)
+    remove_stale_files(manifest, previous)
+
+
+def write_manifest(manifest):
+    tmp_path = get_snapshot_path("manifest.json.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, get_snapshot_path("manifest.json"))
+
+
+def remove_stale_files(manifest, previous):
+    """
+    Delete shard files referenced by neither the new nor the previous
+    manifest; the previous ones are kept for terminals mid-download.
+    """
+    keep = {"manifest.json"}
+    for entries in (manifest, previous or {"shards": {}}):
+        for kind_shards in entries["shards"].values():
+            for entry in kind_shards:
+                keep.update(entry["files"].values())
+
+    for name in os.listdir(get_snapshot_path()):
+        if name not in keep and not name.endswith(".tmp"):
+            os.remove(get_snapshot_path(name))
+
+
+def request_snapshot_update(doc=None, method=None):
+    """
+    Doc event handler queueing a snapshot run once the change is committed.
+    Changes arriving while a run is queued share it; those arriving while a
+    run is in progress flag it to run again.
+    """
+    frappe.db.after_commit.add(lambda: frappe.cache().set_value(PENDING_KEY, 1, expires_in_sec=15 * 60))
+    frappe.enqueue("retail_app.snapshots.update_snapshots",
+                   queue="long",
+                   job_id="retail_app_update_snapshots",
+                   deduplicate=True,
+                   enqueue_after_commit=True)
+
+
+def get_snapshot_manifest():
+    """
+    Get the current manifest with the download URL of every shard file.
+    """
+    manifest = get_manifest()
+    if not manifest:
+        return None
+
+    base_url = get_url("/files/{}/".format(SNAPSHOT_FOLDER))
+    for kind_shards in manifest["shards"].values():
+        for entry in kind_shards:
+            entry["urls"] = {encoding: base_url + name for encoding, name in entry.pop("files").items()}
+
+    return manifest
@@ -0,0 +1,314 @@
+import time
+
+import frappe
+from frappe.utils import cint, flt
+
+from retail_app.settings_cache import get_retail_settings
+from retail_app.utils import redis_call
+
+# Stock available to sell per item and warehouse, net of reservations
+AVAILABLE_KEY = "retail_app:stock:available"
+
+# Quantities reserved by invoices that are not submitted yet
+RESERVED_KEY = "retail_app:stock:reserved"
+
+# Lines of each open reservation, keyed by invoice name
+RESERVATIONS_KEY = "retail_app:stock:reservations"
+
+# Open reservations scored by the time they were made
+RESERVATION_TIMES_KEY = "retail_app:stock:reservation_times"
+
+# Number of stock movements applied to each counter, so a reconciliation
+# does not overwrite a counter with a bin read before a movement
+VERSIONS_KEY = "retail_app:stock:versions"
+
+# Seconds after which an open reservation is assumed abandoned, e.g. by a
+# worker killed between reserving and submitting
+STALE_RESERVATION_SECONDS = 60 * 60
+
+# Counters reconciled with `tabBin` per script call
+RECONCILE_CHUNK_SIZE = 1000
+
+# Checks every line against the available stock and reserves all of them, or
+# none. Returns the lines not seeded yet, or those short of stock with their
+# available quantity.
+RESERVE_SCRIPT = """
+local missing = {}
+for i = 3, #ARGV, 2 do
+    if redis.call('HEXISTS', KEYS[1], ARGV[i]) == 0 then
+        table.insert(missing, ARGV[i])
+    end
+end
+if #missing > 0 then
+    return {'missing', unpack(missing)}
+end
+
+local short = {}
+for i = 3, #ARGV, 2 do
+    local available = tonumber(redis.call('HGET', KEYS[1], ARGV[i]))
+    if available < tonumber(ARGV[i + 1]) then
+        table.insert(short, ARGV[i])
+        table.insert(short, tostring(available))
+    end
+end
+if #short > 0 then
+    return {'short', unpack(short)}
+end
+
+local lines = {}
+for i = 3, #ARGV, 2 do
+    redis.call('HINCRBYFLOAT', KEYS[1], ARGV[i], -tonumber(ARGV[i + 1]))
+    redis.call('HINCRBYFLOAT', KEYS[2], ARGV[i], ARGV[i + 1])
+    table.insert(lines, ARGV[i])
+    table.insert(lines, ARGV[i + 1])
+end
+redis.call('HSET', KEYS[3], ARGV[1], cjson.encode(lines))
+redis.call('ZADD', KEYS[4], ARGV[2], ARGV[1])
+return {'ok'}
+"""
+
+# Closes a reservation, giving its stock back. Returns 0 when the
+# reservation was already closed.
+SETTLE_SCRIPT = """
+local encoded = redis.call('HGET', KEYS[3], ARGV[1])
+if not encoded then
+    return 0
+end
+
+local lines = cjson.decode(encoded)
+for i = 1, #lines, 2 do
+    redis.call('HINCRBYFLOAT', KEYS[2], lines[i], -tonumber(lines[i + 1]))
+    if redis.call('HEXISTS', KEYS[1], lines[i]) == 1 then
+        redis.call('HINCRBYFLOAT', KEYS[1], lines[i], lines[i + 1])
+    end
+end
+redis.call('HDEL', KEYS[3], ARGV[1])
+redis.call('ZREM', KEYS[4], ARGV[1])
+return 1
+"""
+
+# Applies stock movements to the available stock of the lines already
+# seeded, counting them in the versions
+ADJUST_SCRIPT = """
+for i = 1, #ARGV, 2 do
+    redis.call('HINCRBY', KEYS[2], ARGV[i], 1)
+    if redis.call('HEXISTS', KEYS[1], ARGV[i]) == 1 then
+        redis.call('HINCRBYFLOAT', KEYS[1], ARGV[i], ARGV[i + 1])
+    end
+end
+return 1
+"""
+
+# Sets the available stock of the lines to their `tabBin` quantity less what
+# is reserved, only seeding lines not seeded yet when ARGV[1] is 1. Lines
+# whose version changed since the bin was read are left alone.
+SEED_SCRIPT = """
+local skipped = {}
+for i = 2, #ARGV, 3 do
+    local version = redis.call('HGET', KEYS[3], ARGV[i]) or ''
+    if version ~= ARGV[i + 2] then
+        table.insert(skipped, ARGV[i])
+    elseif ARGV[1] ~= '1' or redis.call('HEXISTS', KEYS[1], ARGV[i]) == 0 then
+        local reserved = tonumber(redis.call('HGET', KEYS[2], ARGV[i])) or 0
+        redis.call('HSET', KEYS[1], ARGV[i], tostring(tonumber(ARGV[i + 1]) - reserved))
+    end
+end
+return skipped
+"""
+
+
+class InsufficientStockError(frappe.ValidationError):
+    pass
+
+
+def is_enabled():
+    return cint(get_retail_settings().get("enable_stock_reservation"))
+
+
+def get_field(item_code, warehouse):
+    return "{}|{}".format(item_code, warehouse)
+
+
+def get_keys():
+    cache = frappe.cache()
+    return [cache.make_key(key) for key in (AVAILABLE_KEY, RESERVED_KEY, RESERVATIONS_KEY, RESERVATION_TIMES_KEY, VERSIONS_KEY)]
+
+
+def run_script(script, keys, args):
+    return frappe.cache().register_script(script)(keys=keys, args=args)
+
+
+def get_stock_lines(doc):
+    """
+    Get the stock quantities an invoice takes out of each warehouse, keyed by
+    `item_code|warehouse`. Return invoices, non-stock items and lines without
+    a warehouse take nothing.
+    """
+    if not doc.get("update_stock") or doc.get("is_return"):
+        return {}
+
+    items = [item for item in doc.get("items") or [] if item.warehouse and flt(item.stock_qty) > 0]
+    if not items:
+        return {}
+
+    stock_items = set(frappe.get_all("Item",
+        filters={"name": ["in", list({item.item_code for item in items})], "is_stock_item": 1},
+        pluck="name"))
+
+    lines = {}
+    for item in items:
+        if item.item_code in stock_items:
+            field = get_field(item.item_code, item.warehouse)
+            lines[field] = lines.get(field, 0) + flt(item.stock_qty)
+
+    return lines
+
+
+def get_bin_quantities(fields):
+    """
+    Get the actual quantity in `tabBin` of each `item_code|warehouse`, 0 when
+    the item has no bin in the warehouse.
+    """
+    pairs = [field.rsplit("|", 1) for field in fields]
+    quantities = dict.fromkeys(fields, 0)
+    for item_code, warehouse, actual_qty in frappe.db.sql("""
+        SELECT `item_code`, `warehouse`, `actual_qty`
+        FROM `tabBin`
+        WHERE `item_code` IN %(item_codes)s AND `warehouse` IN %(warehouses)s
+    """, {"item_codes": list({pair[0] for pair in pairs}), "warehouses": list({pair[1] for pair in pairs})}):
+        field = get_field(item_code, warehouse)
+        if field in quantities:
+            quantities[field] = flt(actual_qty)
+
+    return quantities
+
+
+def seed(fields, only_missing=True):
+    """
+    Set the counters of `fields` from their bins, less what is reserved.
+
+    The versions are read before the bins, so a counter moved by a stock
+    movement committed after the bins were read is skipped rather than
+    overwritten with the older quantity. Returns the skipped fields.
+    """
+    keys = get_keys()
+    versions = redis_call("hmget", keys[4], fields)
+    args = ["1" if only_missing else "0"]
+    for (field, qty), version in zip(get_bin_quantities(fields).items(), versions):
+        args += [field, repr(qty), frappe.safe_decode(version) if version is not None else ""]
+
+    return [frappe.safe_decode(field) for field in run_script(SEED_SCRIPT, [keys[0], keys[1], keys[4]], args)]
+
+
+def reserve_invoice_stock(doc):
+    """
+    Reserve the stock an inserted invoice takes before it is submitted, so a
+    till is told at once when a warehouse cannot cover it instead of when
+    the submission fails on the bin.
+
+    Raises `InsufficientStockError` without reserving anything when a line
+    is short. The reservation is kept by invoice name until the invoice is
+    submitted, and given back if the transaction is rolled back.
+    """
+    if not is_enabled():
+        return
+
+    lines = get_stock_lines(doc)
+    if not lines:
+        return
+
+    args = [doc.name, repr(time.time())]
+    for field, qty in lines.items():
+        args += [field, repr(qty)]
+
+    keys = get_keys()[:4]
+    result = run_script(RESERVE_SCRIPT, keys, args)
+    for _i in range(3):
+        if frappe.safe_decode(result[0]) != "missing":
+            break
+        # Seed the counters from the bins on first use, then try again
+        seed([frappe.safe_decode(field) for field in result[1:]])
+        result = run_script(RESERVE_SCRIPT, keys, args)
+
+    outcome = frappe.safe_decode(result[0])
+    if outcome == "short":
+        field, available = frappe.safe_decode(result[1]), flt(frappe.safe_decode(result[2]))
+        item_code, warehouse = field.rsplit("|", 1)
+        raise InsufficientStockError(
+            f"Insufficient stock of Item {item_code} in Warehouse {warehouse}: "
+            f"{max(available, 0)} available, {lines[field]} needed")
+    if outcome != "ok":
+        frappe.throw(f"Could not reserve stock for Sales Invoice {doc.name}")
+
+    frappe.db.after_rollback.add(lambda: release_reservation(doc.name))
+
+
+def release_reservation(name):
+    """
+    Close the reservation of an invoice, giving its stock back: the invoice
+    will not be submitted, or its stock ledger entries took the stock out.
+    """
+    run_script(SETTLE_SCRIPT, get_keys()[:4], [name])
+
+
+def adjust_available(lines):
+    args = []
+    for field, qty in lines.items():
+        args += [field, repr(qty)]
+
+    if args:
+        keys = get_keys()
+        run_script(ADJUST_SCRIPT, [keys[0], keys[4]], args)
+
+
+def on_sales_invoice_submit(doc, method=None):
+    # The invoice's stock ledger entries take its stock out of the counters
+    if is_enabled():
+        name = doc.name
+        frappe.db.after_commit.add(lambda: release_reservation(name))
+
+
+def on_stock_ledger_entry(doc, method=None):
+    """
+    Doc event handler applying a stock movement to the counters once it is
+    committed: sales, receipts, transfers and the reversals of cancelled
+    documents. A stock reconciliation sets the quantity instead, so its
+    counter is seeded again from the bin.
+    """
+    if not is_enabled():
+        return
+
+    field = get_field(doc.item_code, doc.warehouse)
+    if doc.voucher_type == "Stock Reconciliation":
+        frappe.db.after_commit.add(lambda: seed([field], only_missing=False))
+    elif flt(doc.actual_qty):
+        lines = {field: flt(doc.actual_qty)}
+        frappe.db.after_commit.add(lambda: adjust_available(lines))
+
+
+def reconcile_stock_reservations():
+    """
+    Scheduled job correcting the drift of the available stock counters.
+
+    Reservations open for longer than `STALE_RESERVATION_SECONDS` are
+    given back, then every counter is reset to its `tabBin` quantity less
+    what is still reserved, unless a stock movement was applied to it
+    meanwhile. The counters are removed while reservations are disabled, so
+    they are seeded afresh once enabled.
+    """
+    cache = frappe.cache()
+    keys = get_keys()
+    if not is_enabled():
+        for key in keys:
+            cache.delete(key)
+        return
+
+    cutoff = time.time() - STALE_RESERVATION_SECONDS
+    for name in cache.zrangebyscore(keys[3], "-inf", cutoff):
+        release_reservation(frappe.safe_decode(name))
+
+    fields = [frappe.safe_decode(field) for field in redis_call("hkeys", keys[0])]
+    for start in range(0, len(fields), RECONCILE_CHUNK_SIZE):
+        # Read the bins in a fresh snapshot, after the versions
+        frappe.db.rollback()
+        seed(fields[start:start + RECONCILE_CHUNK_SIZE], only_missing=False)
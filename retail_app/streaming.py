@@ -0,0 +1,88 @@
+import json
+
+import frappe
+from werkzeug import Response
+
+# Rows serialized per chunk written to the client
+STREAM_BATCH_SIZE = 1000
+
+STREAM_FORMATS = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson"
+}
+
+
+def is_streaming(fmt):
+    """
+    Check whether the client asked for a streamed response.
+    """
+    return fmt in STREAM_FORMATS
+
+
+def stream_response(query, values=None, serialize=None, fmt="json", batch_size=STREAM_BATCH_SIZE):
+    """
+    Return a `Response` that streams the rows of `query` as a JSON array, or
+    as one JSON document per line when `fmt` is "ndjson".
+
+    Rows are read through an unbuffered (server-side) cursor and written out
+    in batches of `batch_size`, so memory use stays flat however many rows
+    the query returns. `serialize` maps each row dict to the object sent.
+    """
+    site = frappe.local.site
+    sites_path = frappe.local.sites_path
+    user = frappe.session.user
+
+    def generate():
+        # The body is sent after the request has been torn down: the request
+        # closes its connection and releases its locals before the server
+        # iterates the response, so the generator connects again unless the
+        # connection is still open (e.g. when called outside a request)
+        db = getattr(frappe.local, "db", None)
+        owns_connection = not (db and db._conn)
+        owns_locals = owns_connection and not getattr(frappe.local, "initialised", False)
+        if owns_locals:
+            frappe.init(site=site, sites_path=sites_path)
+        if owns_connection:
+            frappe.connect()
+            frappe.set_user(user)
+
+        try:
+            for chunk in generate_chunks():
+                # WSGI servers only accept bytes, and `direct_passthrough`
+                # sends the chunks as they are
+                yield chunk.encode()
+        finally:
+            if owns_locals:
+                frappe.destroy()
+            elif owns_connection:
+                frappe.db.close()
+
+    def generate_chunks():
+        if fmt == "json":
+            yield "["
+
+        batch = []
+        written = False
+        with frappe.db.unbuffered_cursor():
+            for row in frappe.db.sql(query, values, as_dict=True, as_iterator=True):
+                batch.append(json.dumps(serialize(row) if serialize else row))
+                if len(batch) >= batch_size:
+                    yield join_batch(batch, written)
+                    written = True
+                    batch = []
+
+        if batch:
+            yield join_batch(batch, written)
+
+        if fmt == "json":
+            yield "]"
+
+    def join_batch(batch, written):
+        if fmt == "ndjson":
+            return "\n".join(batch) + "\n"
+        return ("," if written else "") + ",".join(batch)
+
+    return Response(response=generate(),
+                    status=200,
+                    mimetype=STREAM_FORMATS[fmt],
+                    direct_passthrough=True)
@@ -0,0 +1,236 @@
+import base64
+import json
+
+import frappe
+from frappe import _
+from frappe.utils import add_to_date, now_datetime
+
+from retail_app.balances import make_balance
+from retail_app.catalog import get_item_stock
+from retail_app.settings_cache import get_retail_config
+
+# Change streams followed by the catalog sync, each with its own position
+CATALOG_STREAMS = ("item", "bin", "item_price", "deleted")
+
+# Change streams followed by the customer sync
+CUSTOMER_STREAMS = ("customer", "balance", "deleted")
+
+
+# Seconds a change waits before it is synced. A row is stamped before its
+# transaction commits, so a cursor moved past fresh stamps could skip rows
+# committed later with an earlier stamp; transactions saving catalog or
+# customer rows must commit within this window
+SYNC_LAG_SECONDS = 30
+
+
+class InvalidCursorError(frappe.ValidationError):
+    pass
+
+
+def encode_cursor(positions):
+    """
+    Encode stream positions into an opaque cursor string.
+    """
+    return base64.urlsafe_b64encode(json.dumps(positions, separators=(",", ":")).encode()).decode()
+
+
+def decode_cursor(cursor, streams):
+    """
+    Decode a cursor into `{stream: [modified, name]}`.
+
+    An empty cursor starts every stream from the beginning.
+    """
+    positions = {stream: ["", ""] for stream in streams}
+    if not cursor:
+        return positions
+
+    try:
+        decoded = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        for stream in streams:
+            if stream in decoded:
+                modified, name = decoded[stream]
+                positions[stream] = [str(modified), str(name)]
+    except (ValueError, TypeError):
+        raise InvalidCursorError(_("Invalid sync cursor"))
+
+    return positions
+
+
+def get_changes(query, position, limit, column="modified"):
+    """
+    Run a keyset query for rows changed after `position`.
+
+    `query` must select `name` and the timestamp `column` as `modified`, order
+    by `(column, name)` and contain a `{conditions}` placeholder. Rows
+    stamped within the last `SYNC_LAG_SECONDS` are left for a later call.
+    """
+    conditions = """
+        (`{column}` > %(last_modified)s
+        OR (`{column}` = %(last_modified)s AND `name` > %(last_name)s))
+        AND `{column}` <= %(horizon)s
+    """.format(column=column)
+    values = {
+        "last_modified": position[0],
+        "last_name": position[1],
+        "limit": limit,
+        "horizon": add_to_date(now_datetime(), seconds=-SYNC_LAG_SECONDS)
+    }
+    return frappe.db.sql(query.format(conditions=conditions), values, as_dict=True)
+
+
+def advance(positions, stream, rows):
+    """
+    Move `stream` past the last of `rows`.
+    """
+    if rows:
+        positions[stream] = [str(rows[-1].modified), rows[-1].name]
+
+
+def get_catalog_changes(cursor=None, limit=500):
+    """
+    Get the items, stock levels, prices and deletions changed since `cursor`.
+
+    Each stream returns at most `limit` rows per call; `has_more` tells the
+    terminal to call again with the returned cursor.
+    """
+    limit = int(limit)
+    positions = decode_cursor(cursor, CATALOG_STREAMS)
+
+    items = get_changes("""
+        SELECT `name`, `modified`, `item_code`, `item_name`, `stock_uom`, `disabled`
+        FROM `tabItem`
+        WHERE {conditions}
+        ORDER BY `modified`, `name`
+        LIMIT %(limit)s
+    """, positions["item"], limit)
+
+    bins = get_changes("""
+        SELECT `name`, `modified`, `item_code`
+        FROM `tabBin`
+        WHERE {conditions}
+        ORDER BY `modified`, `name`
+        LIMIT %(limit)s
+    """, positions["bin"], limit)
+
+    prices = get_changes("""
+        SELECT `name`, `modified`, `item_code`, `uom`, `price_list`, `price_list_rate`
+        FROM `tabItem Price`
+        WHERE {conditions}
+        AND `price_list` IN (SELECT `name` FROM `tabPrice List` WHERE `selling` = 1)
+        ORDER BY `modified`, `name`
+        LIMIT %(limit)s
+    """, positions["item_price"], limit)
+
+    deleted = get_changes("""
+        SELECT `name`, `creation` AS modified, `deleted_doctype`, `deleted_name`
+        FROM `tabDeleted Document`
+        WHERE `deleted_doctype` IN ('Item', 'Item Price')
+        AND {conditions}
+        ORDER BY `creation`, `name`
+        LIMIT %(limit)s
+    """, positions["deleted"], limit, column="creation")
+
+    # Stock is reported as the item's total, so only the affected items are summed
+    stock_items = list({row.item_code for row in bins})
+    stock = get_item_stock(stock_items)
+    stock_uoms = dict(frappe.get_all("Item",
+        filters={"name": ["in", stock_items]},
+        fields=["name", "stock_uom"],
+        as_list=True)) if stock_items else {}
+
+    for stream, rows in (("item", items), ("bin", bins), ("item_price", prices), ("deleted", deleted)):
+        advance(positions, stream, rows)
+
+    return {
+        "items": [{
+            "item_name": item.item_name,
+            "item_code": item.item_code,
+            "stock_uom": item.stock_uom,
+            "disabled": item.disabled
+        } for item in items],
+        "stock": [{
+            "item_code": item_code,
+            "remaining_stock": "{} {}".format(stock.get(item_code, 0), stock_uoms.get(item_code))
+        } for item_code in stock_items if item_code in stock_uoms],
+        "prices": [{
+            "item_code": price.item_code,
+            "name": price.name,
+            "uom": price.uom,
+            "price_list": price.price_list,
+            "price": price.price_list_rate
+        } for price in prices],
+        "deleted": {
+            "items": [row.deleted_name for row in deleted if row.deleted_doctype == "Item"],
+            "item_prices": [row.deleted_name for row in deleted if row.deleted_doctype == "Item Price"]
+        },
+        "cursor": encode_cursor(positions),
+        "has_more": any(len(rows) == limit for rows in (items, bins, prices, deleted))
+    }
+
+
+def get_customer_changes(cursor=None, limit=2000):
+    """
+    Get the customers whose details or balance changed since `cursor`, and
+    the customers deleted since then.
+
+    Customers are returned as parallel arrays, with balances as numbers in
+    the default currency, which is given once.
+    """
+    limit = int(limit)
+    positions = decode_cursor(cursor, CUSTOMER_STREAMS)
+
+    customers = get_changes("""
+        SELECT `name`, `modified`
+        FROM `tabCustomer`
+        WHERE {conditions}
+        ORDER BY `modified`, `name`
+        LIMIT %(limit)s
+    """, positions["customer"], limit)
+
+    balances = get_changes("""
+        SELECT `name`, `modified`
+        FROM `tabRetail Customer Balance`
+        WHERE {conditions}
+        ORDER BY `modified`, `name`
+        LIMIT %(limit)s
+    """, positions["balance"], limit)
+
+    deleted = get_changes("""
+        SELECT `name`, `creation` AS modified, `deleted_name`
+        FROM `tabDeleted Document`
+        WHERE `deleted_doctype` = 'Customer'
+        AND {conditions}
+        ORDER BY `creation`, `name`
+        LIMIT %(limit)s
+    """, positions["deleted"], limit, column="creation")
+
+    # Balance rows are named after their customer
+    changed = sorted({row.name for row in customers} | {row.name for row in balances})
+    rows = frappe.db.sql("""
+        SELECT `tabCustomer`.`name`, `tabCustomer`.`customer_name`, `tabCustomer`.`disabled`,
+            IFNULL(`tabRetail Customer Balance`.`debit` - `tabRetail Customer Balance`.`credit`, 0) AS balance
+        FROM `tabCustomer`
+        LEFT JOIN `tabRetail Customer Balance` ON `tabRetail Customer Balance`.`customer` = `tabCustomer`.`name`
+        WHERE `tabCustomer`.`name` IN %(customers)s
+        ORDER BY `tabCustomer`.`name`
+    """, {"customers": changed}) if changed else []
+
+    for stream, changes in (("customer", customers), ("balance", balances), ("deleted", deleted)):
+        advance(positions, stream, changes)
+
+    columns = {"id": [], "name": [], "disabled": [], "advance_balance": [], "total_due": []}
+    for name, customer_name, disabled, balance in rows:
+        balance = make_balance(balance)
+        columns["id"].append(name)
+        columns["name"].append(customer_name)
+        columns["disabled"].append(disabled)
+        columns["advance_balance"].append(balance["advance_balance"])
+        columns["total_due"].append(balance["total_due"])
+
+    return {
+        "currency": get_retail_config().default_currency,
+        "customers": columns,
+        "deleted": [row.deleted_name for row in deleted],
+        "cursor": encode_cursor(positions),
+        "has_more": any(len(changes) == limit for changes in (customers, balances, deleted))
+    }
@@ -0,0 +1,14 @@
+from frappe.tests.utils import FrappeTestCase
+
+from retail_app.benchmark import make_customers
+from retail_app.benchmark.customers import explain_customers_with_balances
+
+
+class TestCustomersWithBalancesQuery(FrappeTestCase):
+    def test_query_plan_uses_indexes(self):
+        # Enough customers for the optimizer to prefer the indexes to a scan;
+        # the rows are rolled back with the test
+        make_customers(1000, 2)
+
+        result = explain_customers_with_balances()
+        self.assertEqual(result["full_scans"], [], "Full table scans in plan: {}".format(result["plan"]))
@@ -0,0 +1,39 @@
+import tracemalloc
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from retail_app.instrumentation import (CALLS_KEY, SLOW_CALLS_KEY, TOTALS_KEY, get_prometheus_metrics,
+    get_recent_calls, record_call, start_memory_trace, stop_memory_trace)
+
+
+class TestInstrumentation(FrappeTestCase):
+    def setUp(self):
+        cache = frappe.cache()
+        for key in (CALLS_KEY, SLOW_CALLS_KEY, TOTALS_KEY):
+            cache.delete(cache.make_key(key))
+
+    def test_recorded_calls_are_read_back(self):
+        queries = [frappe._dict(query="SELECT 1", duration=0.002, rows=1)]
+        record_call("test_method", 0.5, queries, 120, None, None, 0.1)
+
+        calls = get_recent_calls()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(calls[0]["method"], "test_method")
+        self.assertEqual(calls[0]["queries"], 1)
+        self.assertEqual(get_recent_calls(slow=True)[0]["trace"][0]["query"], "SELECT 1")
+
+        metrics = get_prometheus_metrics()
+        self.assertIn('retail_api_calls_total{method="test_method"} 1', metrics)
+        self.assertIn('retail_api_response_bytes_total{method="test_method"} 120', metrics)
+        self.assertIn('retail_api_slow_calls_total{method="test_method"} 1', metrics)
+
+    def test_memory_trace_outlives_overlapping_calls(self):
+        self.assertFalse(tracemalloc.is_tracing())
+        start_memory_trace()
+        start_memory_trace()
+
+        stop_memory_trace()
+        self.assertTrue(tracemalloc.is_tracing())
+        self.assertGreater(stop_memory_trace(), 0)
+        self.assertFalse(tracemalloc.is_tracing())
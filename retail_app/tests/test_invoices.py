@@ -0,0 +1,91 @@
+from unittest.mock import MagicMock, patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from retail_app.invoices import (InvoiceFailedError, InvoiceInProgressError, claim_idempotency_key, get_invoice_status,
+    record_idempotency_key, submit_invoice, submit_queued_invoice)
+
+KEY = "retail-test-key"
+
+
+class TestSubmitInvoice(FrappeTestCase):
+    def test_failure_after_submit_drops_commit_callbacks(self):
+        taken = []
+        sales_invoice = MagicMock()
+        sales_invoice.name = "SINV-RETAIL-TEST"
+        # Stands for the submit hooks releasing the stock reservation at commit
+        sales_invoice.submit.side_effect = lambda: frappe.db.after_commit.add(lambda: taken.append(sales_invoice.name))
+
+        with patch("retail_app.invoices.frappe.get_doc", return_value=sales_invoice), \
+                patch("retail_app.invoices.claim_idempotency_key", return_value=None), \
+                patch("retail_app.invoices.reserve_invoice_stock"), \
+                patch("retail_app.invoices.release_reservation") as release_reservation, \
+                patch("retail_app.invoices.record_idempotency_key", side_effect=frappe.ValidationError("failed")):
+            result = submit_invoice(0, {"customer": "_Test Customer", "idempotency_key": "retail-test-key"})
+
+        self.assertEqual(result["status"], "failed")
+        release_reservation.assert_called_once_with(sales_invoice.name)
+
+        frappe.db.after_commit.run()
+        self.assertEqual(taken, [])
+
+
+class TestIdempotencyKeys(FrappeTestCase):
+    def test_duplicate_key_returns_the_invoice(self):
+        self.assertIsNone(claim_idempotency_key(KEY))
+        record_idempotency_key(KEY, "SINV-RETAIL-TEST")
+
+        self.assertEqual(claim_idempotency_key(KEY), "SINV-RETAIL-TEST")
+
+    def test_concurrent_claim(self):
+        # The other request inserted the key first; its invoice is found once
+        # it commits, and it is still in progress until then
+        with patch("retail_app.invoices.frappe.get_doc") as get_doc:
+            get_doc.return_value.insert.side_effect = frappe.DuplicateEntryError
+            with patch("retail_app.invoices.get_claimed_invoice", side_effect=[None, "SINV-RETAIL-TEST"]):
+                self.assertEqual(claim_idempotency_key(KEY), "SINV-RETAIL-TEST")
+            with patch("retail_app.invoices.get_claimed_invoice", return_value=None):
+                self.assertRaises(InvoiceInProgressError, claim_idempotency_key, KEY)
+
+    def test_failed_key_is_not_reused(self):
+        claim_idempotency_key(KEY)
+        frappe.db.set_value("Retail Invoice Request", KEY, {
+            "sales_invoice": "SINV-RETAIL-TEST",
+            "status": "Failed",
+            "error": "Insufficient stock"
+        })
+
+        self.assertRaises(InvoiceFailedError, claim_idempotency_key, KEY)
+
+
+class TestSubmitQueuedInvoice(FrappeTestCase):
+    def setUp(self):
+        claim_idempotency_key(KEY)
+        record_idempotency_key(KEY, "SINV-RETAIL-TEST", status="Queued")
+
+    def test_queued_to_submitted(self):
+        with patch("retail_app.invoices.frappe.get_doc") as get_doc:
+            submit_queued_invoice(KEY)
+
+        get_doc.return_value.submit.assert_called_once()
+        self.assertEqual(get_invoice_status(KEY).status, "Submitted")
+
+        # A second run of the job leaves the ticket alone
+        with patch("retail_app.invoices.frappe.get_doc") as get_doc:
+            submit_queued_invoice(KEY)
+        get_doc.assert_not_called()
+
+    def test_queued_to_failed(self):
+        # The job's rollback would also undo the ticket inserted by the test
+        with patch("retail_app.invoices.frappe.get_doc") as get_doc, \
+                patch.object(frappe.db, "rollback"), \
+                patch("retail_app.invoices.release_reservation") as release_reservation:
+            get_doc.return_value.submit.side_effect = frappe.ValidationError("Insufficient stock")
+            submit_queued_invoice(KEY)
+
+        release_reservation.assert_called_once_with("SINV-RETAIL-TEST")
+        status = get_invoice_status(KEY)
+        self.assertEqual(status.status, "Failed")
+        self.assertEqual(status.error, "Insufficient stock")
+        self.assertRaises(InvoiceFailedError, claim_idempotency_key, KEY)
@@ -0,0 +1,45 @@
+from frappe.tests.utils import FrappeTestCase
+
+from retail_app.item_search import ItemIndex
+
+
+def make_record(item_code, item_name, barcodes=()):
+    return {"item_code": item_code, "item_name": item_name, "stock_uom": "Nos", "barcodes": list(barcodes)}
+
+
+class TestItemIndex(FrappeTestCase):
+    def setUp(self):
+        self.index = ItemIndex("test", [
+            make_record("MILK-1L", "Fresh Milk 1L", ["6001234500011"]),
+            make_record("MILK-500", "Fresh Milk 500ml"),
+            make_record("BUTTERMILK", "Buttermilk"),
+            make_record("CHOC-MILK", "Chocolate Milk Drink"),
+            make_record("MILKSHAKE", "Milkshake Vanilla"),
+            make_record("MILK-POWDER", "Milk Powder 400g"),
+        ])
+
+    def search(self, query):
+        return [item.item_code for item in self.index.search(query)]
+
+    def test_exact_barcode_and_item_code_first(self):
+        self.assertEqual(self.search("6001234500011"), ["MILK-1L"])
+        self.assertEqual(self.search("milk-500")[0], "MILK-500")
+
+    def test_ranking(self):
+        self.assertEqual(self.search("milk"), [
+            # Names starting with the query, alphabetically
+            "MILK-POWDER", "MILKSHAKE",
+            # Then names with a word starting with it, shortest first
+            "MILK-1L", "MILK-500", "CHOC-MILK",
+            # Then names containing it
+            "BUTTERMILK",
+        ])
+
+    def test_changes_replace_and_remove_items(self):
+        self.index.apply(dict(make_record("MILK-1L", "Long Life Milk 1L", ["6001234500011"])))
+        self.index.apply({"item_code": "MILKSHAKE", "deleted": True})
+
+        self.assertEqual(self.search("6001234500011"), ["MILK-1L"])
+        self.assertNotIn("MILKSHAKE", self.search("milk"))
+        self.assertEqual(self.search("long life"), ["MILK-1L"])
+        self.assertEqual(self.search("fresh"), ["MILK-500"])
@@ -0,0 +1,59 @@
+from unittest.mock import patch
+
+from frappe.tests.utils import FrappeTestCase
+
+from retail_app.benchmark import insert_rows
+from retail_app.payments import get_outstanding_invoices, insert_payments
+
+CUSTOMER = "_Test Retail Payment Customer"
+
+
+class TestPaymentAllocation(FrappeTestCase):
+    def setUp(self):
+        insert_rows("Sales Invoice", [{
+            "name": name,
+            "docstatus": docstatus,
+            "customer": CUSTOMER,
+            "company": company,
+            "debit_to": debit_to,
+            "posting_date": posting_date,
+            "due_date": posting_date,
+            "grand_total": 100.0,
+            "outstanding_amount": outstanding_amount
+        } for name, posting_date, company, debit_to, docstatus, outstanding_amount in (
+            ("_TEST-PAY-SINV-3", "2026-01-03", "_Test Company", "Debtors - _TC", 1, 100.0),
+            ("_TEST-PAY-SINV-1", "2026-01-01", "_Test Company", "Debtors - _TC", 1, 60.0),
+            ("_TEST-PAY-SINV-2", "2026-01-02", "_Test Company", "Debtors - _TC", 1, 100.0),
+            # Never allocated: another company, another receivable account,
+            # a draft and a paid invoice
+            ("_TEST-PAY-SINV-0", "2025-12-01", "_Test Company 1", "Debtors - _TC1", 1, 100.0),
+            ("_TEST-PAY-SINV-4", "2025-12-02", "_Test Company", "_Test Receivable - _TC", 1, 100.0),
+            ("_TEST-PAY-SINV-5", "2025-12-03", "_Test Company", "Debtors - _TC", 0, 100.0),
+            ("_TEST-PAY-SINV-6", "2025-12-04", "_Test Company", "Debtors - _TC", 1, 0.0),
+        )])
+
+    def test_outstanding_invoices_oldest_first(self):
+        invoices = get_outstanding_invoices([CUSTOMER])[CUSTOMER]
+        self.assertEqual([invoice.name for invoice in invoices],
+                         ["_TEST-PAY-SINV-0", "_TEST-PAY-SINV-4", "_TEST-PAY-SINV-1", "_TEST-PAY-SINV-2", "_TEST-PAY-SINV-3"])
+
+    def test_payments_settle_invoices_of_their_company_and_account(self):
+        payment = {
+            "customer": CUSTOMER,
+            "company": "_Test Company",
+            "paid_from_account": "Debtors - _TC",
+            "paid_to_account": "Cash - _TC"
+        }
+
+        # Payment Entry validation is ERPNext's; only the allocations are checked here
+        with patch("retail_app.payments.make_payment_entry") as make_payment_entry:
+            make_payment_entry.return_value.unallocated_amount = 0
+            results = insert_payments([dict(payment, amount=100), dict(payment, amount=150)], commit=False)
+
+        self.assertEqual([result["allocations"] for result in results], [
+            [{"sales_invoice": "_TEST-PAY-SINV-1", "allocated_amount": 60.0},
+             {"sales_invoice": "_TEST-PAY-SINV-2", "allocated_amount": 40.0}],
+            # The second payment continues where the first one stopped
+            [{"sales_invoice": "_TEST-PAY-SINV-2", "allocated_amount": 60.0},
+             {"sales_invoice": "_TEST-PAY-SINV-3", "allocated_amount": 90.0}],
+        ])
@@ -0,0 +1,61 @@
+import json
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from retail_app import api
+from retail_app.benchmark import insert_rows
+
+
+class TestGetSalesInvoices(FrappeTestCase):
+    def setUp(self):
+        # Several invoices share a posting date, so pages split ties on the name
+        insert_rows("Sales Invoice", [{
+            "name": name,
+            "docstatus": 1,
+            "customer": "_Test Customer",
+            "posting_date": posting_date,
+            "posting_time": "10:00:00",
+            "status": "Unpaid",
+            "grand_total": 100.0,
+            "outstanding_amount": 100.0
+        } for name, posting_date in (
+            ("_TEST-SINV-0001", "2026-01-02"),
+            ("_TEST-SINV-0002", "2026-01-02"),
+            ("_TEST-SINV-0003", "2026-01-02"),
+            ("_TEST-SINV-0004", "2026-01-03"),
+            ("_TEST-SINV-0005", "2026-01-03"),
+            # Matches the prefix only if its underscore is taken as a wildcard
+            ("XTEST-SINV-0006", "2026-01-02"),
+        )])
+
+    def tearDown(self):
+        frappe.form_dict.clear()
+
+    def get_page(self, **form):
+        frappe.form_dict.clear()
+        frappe.form_dict.update(form)
+        return json.loads(api.get_sales_invoices().get_data())
+
+    def test_cursor_pages_walk_every_invoice_once(self):
+        names = []
+        counts = []
+        cursor = None
+        while True:
+            page = self.get_page(invoice_name="_TEST-SINV", per_page=2, summary=1, cursor=cursor)
+            names += [invoice["name"] for invoice in page["invoices"]]
+            counts.append(page["pagination"]["total_count"])
+            cursor = page["pagination"]["next_cursor"]
+            if not cursor:
+                break
+
+        self.assertEqual(names, ["_TEST-SINV-0005", "_TEST-SINV-0004", "_TEST-SINV-0003", "_TEST-SINV-0002", "_TEST-SINV-0001"])
+        # The total counts the filtered invoices on every page, not those left
+        self.assertEqual(set(counts), {5})
+
+    def test_prefix_wildcards_match_literally(self):
+        page = self.get_page(invoice_name="_TEST-SINV-000%", per_page=20, summary=1)
+        self.assertEqual(page["invoices"], [])
+
+        page = self.get_page(invoice_name="_TEST-SINV-000", per_page=20, summary=1)
+        self.assertNotIn("XTEST-SINV-0006", [invoice["name"] for invoice in page["invoices"]])
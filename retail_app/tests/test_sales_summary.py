@@ -0,0 +1,33 @@
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from retail_app.sales_summary import get_row_name, row_name_sql
+
+
+class TestSummaryRowNames(FrappeTestCase):
+    def test_python_and_sql_names_agree(self):
+        for pos_profile, dimension, key in (
+            ("Main Till", "Item", "ITEM-0001"),
+            (None, "Payment Mode", "Cash"),
+            ("", "Total", ""),
+            (None, "Payment Mode", None),
+            ("Caisse Café", "Item", "Crème brûlée"),
+        ):
+            values = {
+                "posting_date": "2026-03-01",
+                "posting_time": "09:05:00",
+                "pos_profile": pos_profile,
+                "owner": "cashier@example.com",
+                "key": key
+            }
+            # The columns the expression reads, from a one row derived table
+            sql_name = frappe.db.sql("""
+                SELECT {}
+                FROM (
+                    SELECT CAST(%(posting_date)s AS DATE) AS `posting_date`, CAST(%(posting_time)s AS TIME) AS `posting_time`,
+                        %(pos_profile)s AS `pos_profile`, %(owner)s AS `owner`
+                ) AS `tabSales Invoice`
+            """.format(row_name_sql(dimension, "%(key)s")), values)[0][0]
+
+            self.assertEqual(sql_name, get_row_name("2026-03-01", 9, pos_profile, "cashier@example.com", dimension, key),
+                             (pos_profile, dimension, key))
@@ -0,0 +1,21 @@
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from retail_app.snapshots import SHARD_COUNT, get_shard, shard_condition
+
+
+class TestSnapshotShards(FrappeTestCase):
+    def test_python_and_sql_shards_agree(self):
+        for item_code in ("ITEM-0001", "_Test Item", "Café Crème", "12345", "item with spaces"):
+            shard = get_shard(item_code)
+            # Only the item's shard selects it
+            selected = [
+                other for other in range(SHARD_COUNT)
+                if frappe.db.sql("""
+                    SELECT COUNT(*)
+                    FROM (SELECT %(item_code)s AS `item_code`) AS `item`
+                    WHERE {}
+                """.format(shard_condition("`item`.`item_code`")), {"item_code": item_code, "shard": other})[0][0]
+            ]
+
+            self.assertEqual(selected, [shard], item_code)
@@ -0,0 +1,48 @@
+import json
+from wsgiref.validate import validator
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from werkzeug.test import run_wsgi_app
+
+from retail_app.streaming import stream_response
+
+QUERY = "SELECT `name` FROM `tabDocType` ORDER BY `name` LIMIT 5"
+
+
+def get_body(response):
+    """
+    Send a response through a validating WSGI server and return its body.
+    """
+    app_iter, _status, _headers = run_wsgi_app(validator(response), {
+        "REQUEST_METHOD": "GET",
+        "SERVER_NAME": "localhost",
+        "SERVER_PORT": "80",
+        "SERVER_PROTOCOL": "HTTP/1.1",
+        "PATH_INFO": "/",
+        "wsgi.url_scheme": "http",
+    }, buffered=True)
+    try:
+        return b"".join(app_iter)
+    finally:
+        app_iter.close()
+
+
+class TestStreaming(FrappeTestCase):
+    def test_stream_formats(self):
+        names = frappe.db.sql_list(QUERY)
+        self.assertEqual([row["name"] for row in json.loads(get_body(stream_response(QUERY, batch_size=2)))], names)
+
+        lines = get_body(stream_response(QUERY, fmt="ndjson", batch_size=2)).decode().splitlines()
+        self.assertEqual([json.loads(line)["name"] for line in lines], names)
+
+    def test_stream_after_request_teardown(self):
+        names = frappe.db.sql_list(QUERY)
+        response = stream_response(QUERY)
+
+        # The request closes its connection before the body is sent
+        frappe.db.close()
+        try:
+            self.assertEqual([row["name"] for row in json.loads(get_body(response))], names)
+        finally:
+            frappe.connect()
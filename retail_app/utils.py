@@ -0,0 +1,91 @@
+import hashlib
+import json
+import time
+from contextlib import contextmanager
+
+import frappe
+import redis
+
+
+@contextmanager
+def capture_queries():
+    """
+    Record every SQL statement run through `frappe.db.sql` inside the block.
+
+    Yields a list that is filled with `{"query", "duration", "rows"}` dicts
+    as the statements complete, `rows` being the rows returned or affected.
+    """
+    queries = []
+    sql = frappe.db.sql
+
+    def _sql(query, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return sql(query, *args, **kwargs)
+        finally:
+            cursor = getattr(frappe.db, "_cursor", None)
+            queries.append(frappe._dict(
+                query=str(query),
+                duration=time.perf_counter() - start,
+                rows=max(getattr(cursor, "rowcount", 0) or 0, 0)
+            ))
+
+    frappe.db.sql = _sql
+    try:
+        yield queries
+    finally:
+        frappe.db.sql = sql
+
+
+# Seconds a cached row count is served before it is recounted
+COUNT_CACHE_TTL = 60
+
+
+def get_cached_count(doctype, filters):
+    """
+    Count the documents matching `filters`, caching the result per filter set
+    for `COUNT_CACHE_TTL` seconds.
+
+    Counting is a full scan of the matching rows, so listings that show a
+    total can trade a slightly stale number for not paying it on every page.
+    """
+    digest = hashlib.sha1(json.dumps([doctype, filters], sort_keys=True, default=str).encode()).hexdigest()
+    key = "retail_app:count:{}".format(digest)
+
+    count = frappe.cache().get_value(key)
+    if count is None:
+        count = frappe.db.count(doctype, filters=filters)
+        frappe.cache().set_value(key, count, expires_in_sec=COUNT_CACHE_TTL)
+
+    return count
+
+
+def redis_call(command, key, *args):
+    """
+    Run a Redis command on a key already built with `make_key`.
+
+    Frappe's cache wrapper overrides some commands (`lrange`, `hgetall`,
+    `hkeys`, `rpush`...) to prefix the key again and pickle values, so keys
+    and values written raw must be read back raw.
+    """
+    return getattr(redis.Redis, command)(frappe.cache(), key, *args)
+
+
+def set_savepoint(savepoint):
+    """
+    Set a savepoint and return the commit callbacks registered so far, for
+    `rollback_to_savepoint`.
+    """
+    frappe.db.savepoint(savepoint)
+    return list(frappe.db.after_commit._functions)
+
+
+def rollback_to_savepoint(savepoint, after_commit):
+    """
+    Roll back to `savepoint` along with the commit callbacks registered
+    since it was set, which would otherwise run for work that was undone.
+    """
+    frappe.db.rollback(save_point=savepoint)
+    frappe.db.after_commit.reset()
+    for callback in after_commit:
+        frappe.db.after_commit.add(callback)